@@ -0,0 +1,91 @@
+"""
+Micro-benchmark: re-applying a color change with and without the no-op filter
+
+This measures SQLite with its own simplified statements, not Firebird and not
+the SQL of db_functions (which runs the change as one EXECUTE BLOCK pass). It
+only shows how many rows each approach writes: a setparams table in an
+in-memory SQLite database stands in for ORDERS_ITEMS_ADDS_SETPARAMS, a color
+change is applied and then re-applied, once rewriting every matched row and
+once skipping rows that already hold the target (`IS NOT ?` in SQLite).
+Firebird creates a back-version for every row an UPDATE writes, even when
+the value is unchanged, so rows written is the number of record versions the
+same change would create there. Timings are SQLite timings.
+
+Usage (from the api directory):
+    python benchmarks/bench_noop_updates.py [--rows 20000] [--already 0.9] [--repeat 5]
+"""
+
+import argparse
+import random
+import sqlite3
+import time
+
+COLOR_PARAM = 3
+OLD_COLOR = 10
+NEW_COLOR = 20
+
+WHERE_SQL = """
+WHERE ORDERID = ?
+AND PARAMTYPE = ?
+AND COLORVALUEID IN (?, ?)
+"""
+OLD_UPDATE = f"UPDATE SETPARAMS SET COLORVALUEID = ? {WHERE_SQL}"
+NEW_UPDATE = f"UPDATE SETPARAMS SET COLORVALUEID = ? {WHERE_SQL} AND COLORVALUEID IS NOT ?"
+
+
+def make_database(rows: int, already: float) -> sqlite3.Connection:
+    """Order 1 with `rows` color rows, `already` of them holding the target color"""
+    con = sqlite3.connect(":memory:", isolation_level=None)
+    con.execute("""
+        CREATE TABLE SETPARAMS (
+            ID INTEGER PRIMARY KEY, ORDERID INTEGER, PARAMTYPE INTEGER, COLORVALUEID INTEGER, PAD TEXT
+        )
+    """)
+    rng = random.Random(1)
+    con.execute("BEGIN")
+    con.executemany(
+        "INSERT INTO SETPARAMS (ORDERID, PARAMTYPE, COLORVALUEID, PAD) VALUES (1, ?, ?, ?)",
+        ((COLOR_PARAM, NEW_COLOR if rng.random() < already else OLD_COLOR, "x" * 120) for _ in range(rows))
+    )
+    con.execute("COMMIT")
+    return con
+
+
+def apply(con: sqlite3.Connection, sql: str, params: tuple) -> tuple:
+    """(rows written, ms) of one change in its own transaction"""
+    started = time.perf_counter()
+    con.execute("BEGIN")
+    written = con.execute(sql, params).rowcount
+    con.execute("COMMIT")
+    return written, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--already", type=float, default=0.9, help="share of rows already holding the target")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    where_params = (1, COLOR_PARAM, OLD_COLOR, NEW_COLOR)
+    print(f"SQLite stand-in, rows: {args.rows}, already at target: {args.already:.0%}, repeats: {args.repeat}")
+    written = {}
+    for name, sql, params in (
+        ("old update", OLD_UPDATE, (NEW_COLOR,) + where_params),
+        ("no-op skip", NEW_UPDATE, (NEW_COLOR,) + where_params + (NEW_COLOR,)),
+    ):
+        con = make_database(args.rows, args.already)
+        matched = con.execute(f"SELECT COUNT(*) FROM SETPARAMS {WHERE_SQL}", where_params).fetchone()[0]
+        # First run does the real change, the following ones re-apply it
+        first = apply(con, sql, params)
+        again = [apply(con, sql, params) for _ in range(args.repeat)]
+        con.close()
+        written[name] = first[0] + sum(run[0] for run in again)
+        print(f"{name:>10}: matched {matched}, change wrote {first[0]} rows, "
+              f"re-apply wrote {again[0][0]} rows in {min(run[1] for run in again):.2f} ms")
+    print(f"rows written in {args.repeat + 1} runs: {written['old update']} -> {written['no-op skip']} "
+          f"({written['old update'] / max(1, written['no-op skip']):.0f}x fewer record versions)")
+
+
+if __name__ == "__main__":
+    main()
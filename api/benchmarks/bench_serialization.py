@@ -0,0 +1,72 @@
+"""
+Micro-benchmark: list endpoint serialization for a 2,000-color group
+
+Compares the previous path (dict rows -> pydantic models -> response_model
+validation -> JSON) with the fast path (cursor tuples -> JSON bytes).
+
+Usage (from the api directory):
+    python benchmarks/bench_serialization.py [--colors 2000] [--repeat 200]
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+
+from modules.models import Color
+from modules.serialization import encode_rows, orjson
+
+
+def make_rows(count: int):
+    """Cursor-like rows for one color group"""
+    return [(f"RAL {1000 + i} Цвет-{i}",) for i in range(count)]
+
+
+def old_path(rows, group_title: str) -> bytes:
+    """Dict rows, per-row models, response_model re-validation, json.dumps"""
+    colors_data = [{"COLOR": row[0]} for row in rows]
+    result = [
+        Color(color_id=i, title=color["COLOR"], group_title=group_title)
+        for i, color in enumerate(colors_data)
+    ]
+    # FastAPI validates the returned objects against response_model again
+    validated = [Color(**jsonable_encoder(item)) for item in result]
+    content = jsonable_encoder(validated)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def fast_path(rows, group_title: str) -> bytes:
+    """Tuples straight to JSON bytes"""
+    return encode_rows(
+        ("color_id", "title", "group_title"),
+        ((i, row[0], group_title) for i, row in enumerate(rows))
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--colors", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rows = make_rows(args.colors)
+    group_title = "RAL"
+    assert json.loads(old_path(rows, group_title)) == json.loads(fast_path(rows, group_title))
+
+    print(f"Encoder: {'orjson' if orjson is not None else 'json (orjson not installed)'}")
+    print(f"Rows: {args.colors}, repeats: {args.repeat}")
+    results = {}
+    for name, func in (("old path", old_path), ("fast path", fast_path)):
+        seconds = min(timeit.repeat(lambda: func(rows, group_title), number=args.repeat, repeat=3))
+        results[name] = seconds / args.repeat * 1000
+        print(f"{name:>10}: {results[name]:.3f} ms per response")
+    print(f"   speedup: {results['old path'] / results['fast path']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
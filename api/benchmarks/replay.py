@@ -0,0 +1,201 @@
+"""
+Replay of recorded API traffic against another build
+
+Requests captured with RECORD_REQUESTS=true (data/recordings/requests-*.jsonl)
+are re-issued at their original offsets, divided by --speed, so the original
+concurrency pattern is kept. Only GET requests are sent unless
+--include-writes is given; point writes at a stand-in database, e.g. a
+profile configured with DB_<NAME>_* on the target and selected with
+--database <name>.
+
+Usage (from the api directory):
+    python benchmarks/replay.py replay data/recordings --target http://127.0.0.1:8002 \
+        [--speed 1] [--database staging] [--include-writes] --output build-a.jsonl
+    python benchmarks/replay.py compare build-a.jsonl build-b.jsonl
+"""
+
+import argparse
+import glob
+import json
+import os
+import re
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List
+
+import requests
+
+_ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+_local = threading.local()
+
+
+def endpoint(method: str, path: str) -> str:
+    """Endpoint key of a request: numeric path segments become {id}"""
+    return f"{method} {_ID_SEGMENT.sub('/{id}', path)}"
+
+
+def load_recordings(paths: List[str]) -> List[Dict[str, Any]]:
+    """Recorded requests of the given files or directories, ordered by start time"""
+    files = []
+    for path in paths:
+        files.extend(sorted(glob.glob(os.path.join(path, "requests-*.jsonl"))) if os.path.isdir(path) else [path])
+    entries = []
+    for name in files:
+        with open(name, "rb") as recording:
+            for line in recording:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+    entries.sort(key=lambda entry: entry["t"])
+    return entries
+
+
+def percentile(values: List[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(share * (len(ordered) - 1))))]
+
+
+def _session() -> requests.Session:
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+
+def _send(target: str, entry: Dict[str, Any], database: str, lag_ms: float) -> Dict[str, Any]:
+    url = target.rstrip("/") + entry["path"] + ("?" + entry["query"] if entry.get("query") else "")
+    headers = {"X-Database": database or entry.get("db") or "default"}
+    if entry.get("id"):
+        headers["X-Request-ID"] = f"replay-{entry['id']}"
+    body = entry.get("body")
+    started = time.perf_counter()
+    try:
+        response = _session().request(
+            entry["method"], url, headers=headers, timeout=300,
+            json=body if isinstance(body, (dict, list)) else None,
+            data=body.encode("utf-8") if isinstance(body, str) else None
+        )
+        status = response.status_code
+    except requests.RequestException as e:
+        status = 0
+        print(f"{entry['method']} {entry['path']}: {e}", file=sys.stderr)
+    return {
+        "endpoint": endpoint(entry["method"], entry["path"]),
+        "recorded_ms": entry["ms"],
+        "recorded_status": entry["status"],
+        "ms": round((time.perf_counter() - started) * 1000, 2),
+        "status": status,
+        "lag_ms": round(lag_ms, 2),
+    }
+
+
+def replay(entries: List[Dict[str, Any]], target: str, speed: float, database: str,
+           max_workers: int) -> Iterator[Dict[str, Any]]:
+    """Send entries at their recorded offsets / speed; yields results as they complete"""
+    if not entries:
+        return
+    first = entries[0]["t"]
+    futures = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        started = time.monotonic()
+        for entry in entries:
+            due = started + (entry["t"] - first) / speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            # Lag shows the dispatcher could not keep the recorded pace (too few workers)
+            lag_ms = max(0.0, time.monotonic() - due) * 1000
+            futures.append(executor.submit(_send, target, entry, database, lag_ms))
+        for future in futures:
+            yield future.result()
+
+
+def summarize(results: List[Dict[str, Any]], field: str) -> Dict[str, Dict[str, float]]:
+    by_endpoint = defaultdict(list)
+    errors = defaultdict(int)
+    for result in results:
+        by_endpoint[result["endpoint"]].append(result[field])
+        if result["status"] != result["recorded_status"]:
+            errors[result["endpoint"]] += 1
+    return {
+        name: {
+            "count": len(values),
+            "p50": statistics.median(values),
+            "p95": percentile(values, 0.95),
+            "mismatched": errors[name],
+        }
+        for name, values in by_endpoint.items()
+    }
+
+
+def print_deltas(base: Dict[str, Dict[str, float]], new: Dict[str, Dict[str, float]],
+                 base_label: str, new_label: str) -> None:
+    print(f"{'endpoint':<48} {'n':>6} {base_label + ' p50':>12} {new_label + ' p50':>12} "
+          f"{'Δ p50':>9} {base_label + ' p95':>12} {new_label + ' p95':>12} {'Δ p95':>9} {'status≠':>8}")
+    for name in sorted(set(base) | set(new)):
+        a, b = base.get(name), new.get(name)
+        if a is None or b is None:
+            print(f"{name:<48} only in {'B' if a is None else 'A'}")
+            continue
+        delta50 = (b["p50"] - a["p50"]) / a["p50"] * 100 if a["p50"] else 0.0
+        delta95 = (b["p95"] - a["p95"]) / a["p95"] * 100 if a["p95"] else 0.0
+        print(f"{name:<48} {b['count']:>6} {a['p50']:>12.1f} {b['p50']:>12.1f} {delta50:>+8.1f}% "
+              f"{a['p95']:>12.1f} {b['p95']:>12.1f} {delta95:>+8.1f}% {b['mismatched']:>8}")
+
+
+def read_results(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding="utf-8") as results:
+        return [json.loads(line) for line in results if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("replay", help="re-issue recorded requests against an API instance")
+    run.add_argument("recordings", nargs="+", help="recording files or directories")
+    run.add_argument("--target", default="http://127.0.0.1:8002")
+    run.add_argument("--speed", type=float, default=1.0, help="time compression, e.g. 10 for 10x")
+    run.add_argument("--database", default="", help="send every request to this database profile")
+    run.add_argument("--include-writes", action="store_true", help="also send POST requests (changes, jobs)")
+    run.add_argument("--max-workers", type=int, default=64)
+    run.add_argument("--output", help="results file (JSONL) for a later compare")
+
+    compare = commands.add_parser("compare", help="per-endpoint latency deltas between two replay results")
+    compare.add_argument("base")
+    compare.add_argument("new")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        print_deltas(summarize(read_results(args.base), "ms"), summarize(read_results(args.new), "ms"), "A", "B")
+        return
+
+    entries = [
+        entry for entry in load_recordings(args.recordings)
+        if args.include_writes or entry["method"] == "GET"
+    ]
+    print(f"Replaying {len(entries)} requests against {args.target} at {args.speed:g}x")
+    results = []
+    output = open(args.output, "w", encoding="utf-8") if args.output else None
+    try:
+        for result in replay(entries, args.target, args.speed, args.database, args.max_workers):
+            results.append(result)
+            if output is not None:
+                output.write(json.dumps(result, ensure_ascii=False) + "\n")
+    finally:
+        if output is not None:
+            output.close()
+    if not results:
+        return
+    lag = max(result["lag_ms"] for result in results)
+    print(f"Max dispatch lag: {lag:.1f} ms")
+    print_deltas(summarize(results, "recorded_ms"), summarize(results, "ms"), "rec", "replay")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,771 +3,1161 @@ Database functions for Group Change Params API
 Uses direct Firebird connection for database operations
 """
 
+import ctypes
+import logging
+import socket
+from functools import partial
+
 import fdb
-from typing import List, Dict, Any
-from modules.config import DB_CONFIG, ENABLE_LOGGING
+from typing import List, Dict, Any, Sequence, Tuple
+from modules.config import (
+    DB_CONFIG, DB_PROFILES, DB_POOL_TIMEOUT, DB_POOL_PING_AFTER, DB_TRACE_CONTEXT,
+    DB_CONNECT_TIMEOUT, DB_BREAKER_THRESHOLD, DB_BREAKER_RESET, DB_CREATE_SELECTION_TABLE
+)
+from db.pool import ConnectionPool, PooledConnection
+from modules.breaker import CircuitBreaker
+from modules.databases import PerDatabase
+from db.selection import select_values, select_mapping, ensure_selection_table
+
+logger = logging.getLogger(__name__)
 
 
-def get_db_connection():
+def connect_db(config: Dict[str, Any] = DB_CONFIG):
     """
-    Получить соединение с базой данных Firebird
+    Открыть новое соединение с базой данных Firebird
     """
     try:
+        if DB_CONNECT_TIMEOUT > 0:
+            # fdb.connect has no timeout: an unreachable host would block until the OS gives up
+            socket.create_connection((config['host'], config['port']), timeout=DB_CONNECT_TIMEOUT).close()
         con = fdb.connect(
-            host=DB_CONFIG['host'],
-            port=DB_CONFIG['port'],
-            database=DB_CONFIG['database'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password'],
-            charset=DB_CONFIG['charset']
+            host=config['host'],
+            port=config['port'],
+            database=config['database'],
+            user=config['user'],
+            password=config['password'],
+            charset=config['charset']
         )
         return con
+    except OSError as e:
+        logger.error("БД недоступна (%s:%s): %s", config['host'], config['port'], e)
+        raise
     except Exception as e:
-        if ENABLE_LOGGING:
-            print(f"❌ Ошибка подключения к БД: {e}")
+        logger.exception("Ошибка подключения к БД")
         raise
 
 
+_cancel_operation = None
+
+
+def _cancel_function():
+    """fb_cancel_operation of the client library (fdb has no wrapper for it); None when not available"""
+    global _cancel_operation
+    if _cancel_operation is None:
+        try:
+            function = fdb.fbcore.load_api().client_library.fb_cancel_operation
+        except Exception as e:  # no client library or a version without the call
+            logger.warning("fb_cancel_operation недоступна, запросы по таймауту не прерываются: %s", e)
+            _cancel_operation = False
+        else:
+            function.argtypes = [
+                ctypes.POINTER(fdb.ibase.ISC_STATUS), ctypes.POINTER(fdb.ibase.isc_db_handle), ctypes.c_ushort
+            ]
+            function.restype = fdb.ibase.ISC_STATUS
+            _cancel_operation = function
+    return _cancel_operation or None
+
+
+def cancel_db_operation(con) -> bool:
+    """
+    Прервать выполняющийся на соединении запрос (fb_cancel_operation, вызывается из другого потока)
+    True only when the client library accepted the cancel request
+    """
+    handle = getattr(con, "_db_handle", None)
+    cancel = _cancel_function() if handle is not None else None
+    if cancel is None:
+        return False
+    status = fdb.ibase.ISC_STATUS_ARRAY()
+    cancel(status, ctypes.byref(handle), fdb.ibase.fb_cancel_raise)
+    return not (status[0] == 1 and status[1] > 0)
+
+
+# Own pool and breaker per database profile: a slow or unreachable site does not hold up the others
+db_pool: PerDatabase[ConnectionPool] = PerDatabase(lambda name: ConnectionPool(
+    partial(connect_db, DB_PROFILES[name]), DB_PROFILES[name]["pool_size"], DB_POOL_TIMEOUT,
+    ping_after=DB_POOL_PING_AFTER, trace_context=DB_TRACE_CONTEXT, name=name, cancel=cancel_db_operation,
+    breaker=CircuitBreaker(name, DB_BREAKER_THRESHOLD, DB_BREAKER_RESET)
+))
+
+
+# One pass over the rows a change selects: every row is counted, only rows whose value differs
+# are rewritten (an UPDATE of an unchanged value still creates a record version)
+_COUNTED_UPDATE_SQL = """
+EXECUTE BLOCK ({inputs})
+RETURNS (MATCHED_ROWS INTEGER, CHANGED_ROWS INTEGER)
+AS
+DECLARE VARIABLE OLD_VALUE INTEGER;
+DECLARE VARIABLE NEW_VALUE INTEGER;
+BEGIN
+    MATCHED_ROWS = 0;
+    CHANGED_ROWS = 0;
+    FOR SELECT {alias}.{column}, {new_value_sql}
+        FROM {table} {alias}
+        {where_sql}
+        INTO :OLD_VALUE, :NEW_VALUE
+        AS CURSOR TARGET_ROWS
+    DO
+    BEGIN
+        MATCHED_ROWS = MATCHED_ROWS + 1;
+        IF (NEW_VALUE IS DISTINCT FROM OLD_VALUE) THEN
+        BEGIN
+            UPDATE {table} SET {column} = :NEW_VALUE WHERE CURRENT OF TARGET_ROWS;
+            CHANGED_ROWS = CHANGED_ROWS + 1;
+        END
+    END
+    SUSPEND;
+END
+"""
+
+
+def _block_sql(template: str, params: Sequence[Any]) -> str:
+    """EXECUTE BLOCK text with the `?` placeholders of template turned into declared inputs :P1, :P2, ..."""
+    pieces = template.split("?")
+    if len(pieces) - 1 != len(params):
+        raise ValueError(f"{len(pieces) - 1} placeholders, {len(params)} parameters")
+    sql = pieces[0] + "".join(f":P{number}{piece}" for number, piece in enumerate(pieces[1:], 1))
+    inputs = ", ".join(
+        f"P{number} {'INTEGER' if isinstance(value, int) else 'VARCHAR(255)'} = ?"
+        for number, value in enumerate(params, 1)
+    )
+    return sql.replace("{inputs}", inputs)
+
+
+def _update_counted(cur, table: str, alias: str, column: str, new_value_sql: str, where_sql: str,
+                    params: Sequence[Any]) -> Tuple[int, int]:
+    """
+    Set `column` of the rows selected by where_sql to new_value_sql (may refer to the row by alias)
+    Returns (matched rows, changed rows); `?` parameters become inputs of the block.
+    """
+    # Inputs are declared once the placeholders of the body are numbered
+    sql = _block_sql(_COUNTED_UPDATE_SQL.format(
+        inputs="{inputs}", table=table, alias=alias, column=column,
+        new_value_sql=new_value_sql.strip(), where_sql=where_sql.strip()
+    ), params)
+
+    logger.debug("UPDATE SQL: %s", sql)
+    logger.debug("UPDATE parameters: %s", params)
+
+    cur.execute(sql, tuple(params))
+    matched_rows, changed_rows = cur.fetchone()
+    return matched_rows, changed_rows
+
+
+def prepare_databases() -> None:
+    """
+    Подготовить базы данных всех профилей при старте (временная таблица выбранных значений)
+    A database that cannot be prepared is logged; its change requests then fail until it is fixed.
+    """
+    if not DB_CREATE_SELECTION_TABLE:
+        return
+    for name in DB_PROFILES:
+        try:
+            with db_pool.get(name).acquire() as con:
+                ensure_selection_table(con)
+        except Exception:
+            logger.exception("Не удалось подготовить базу данных '%s'", name)
+
+
+def get_db_connection() -> PooledConnection:
+    """
+    Получить соединение из пула базы данных текущего запроса (использовать как контекстный менеджер)
+    """
+    return db_pool.instance().acquire()
+
+
 def get_wood_params() -> List[Dict[str, Any]]:
     """Get all wood (breed) parameters from real database"""
     try:
-        con = get_db_connection()
-        cur = con.cursor()
-        
-        sql = "SELECT sp.ID, sp.NAME FROM STRUCTS_PARAMS sp WHERE sp.NAME LIKE '%Wood%'"
-        cur.execute(sql)
-        rows = cur.fetchall()
-        
-        result = []
-        for row in rows:
-            result.append({
-                "ID": row[0],
-                "NAME": row[1]
-            })
-        
-        cur.close()
-        con.close()
+        with get_db_connection() as con:
+            cur = con.cursor()
+            
+            sql = "SELECT sp.ID, sp.NAME FROM STRUCTS_PARAMS sp WHERE sp.NAME LIKE '%Wood%'"
+            cur.execute(sql)
+            rows = cur.fetchall()
+            
+            result = []
+            for row in rows:
+                result.append({
+                    "ID": row[0],
+                    "NAME": row[1]
+                })
+            
+            cur.close()
         
-        if ENABLE_LOGGING:
-            print(f"✅ Получено {len(result)} параметров дерева")
+        logger.debug("Получено %d параметров дерева", len(result))
             
         return result
         
     except Exception as e:
-        if ENABLE_LOGGING:
-            print(f"❌ Ошибка получения параметров дерева: {e}")
+        logger.exception("Ошибка получения параметров дерева")
         raise
 
 
+# Predefined breed list as specified by user: (ID, CODE, TYPEID)
+AVAILABLE_BREEDS = [
+    (1, "Сосна Люкс", 1),
+    (2, "Сосна сращенный", 1),
+    (3, "Лиственница Люкс", 2),
+    (4, "Лиственница сращенный", 2),
+    (5, "Дуб Люкс", 3),
+    (6, "Дуб сращенный", 3),
+    (7, "Осина сращенный", 4),
+]
+
+
 def get_available_breeds() -> List[Dict[str, Any]]:
     """Get all available breed options - hardcoded list as specified"""
-    # Return predefined list as specified by user
-    return [
-        {"ID": 1, "CODE": "Сосна Люкс", "TYPEID": 1},
-        {"ID": 2, "CODE": "Сосна сращенный", "TYPEID": 1},
-        {"ID": 3, "CODE": "Лиственница Люкс", "TYPEID": 2},
-        {"ID": 4, "CODE": "Лиственница сращенный", "TYPEID": 2},
-        {"ID": 5, "CODE": "Дуб Люкс", "TYPEID": 3},
-        {"ID": 6, "CODE": "Дуб сращенный", "TYPEID": 3},
-        {"ID": 7, "CODE": "Осина сращенный", "TYPEID": 4},
-    ]
+    return [{"ID": row[0], "CODE": row[1], "TYPEID": row[2]} for row in AVAILABLE_BREEDS]
 
 
-def get_color_groups() -> List[Dict[str, Any]]:
-    """Get all color groups from real database"""
+def get_color_groups_rows() -> List[tuple]:
+    """Get all color groups from real database (raw cursor rows)"""
     try:
-        con = get_db_connection()
-        cur = con.cursor()
+        with get_db_connection() as con:
+            cur = con.cursor()
+            
+            sql = """
+            SELECT cg.TITLE as CG_TITLE                          
+            FROM COLORGROUP cg
+            WHERE cg.DELETED = 0
+            AND cg.GROUPID IN (1,2,3,5,6)
+            ORDER BY cg.TITLE
+            """
+            cur.execute(sql)
+            result = cur.fetchall()
+            
+            cur.close()
         
-        sql = """
-        SELECT cg.TITLE as CG_TITLE                          
-        FROM COLORGROUP cg
-        WHERE cg.DELETED = 0
-        AND cg.GROUPID IN (1,2,3,5,6)
-        ORDER BY cg.TITLE
-        """
-        cur.execute(sql)
-        rows = cur.fetchall()
-        
-        result = []
-        for row in rows:
-            result.append({
-                "CG_TITLE": row[0]
-            })
+        logger.debug("Получено %d групп цветов", len(result))
+            
+        return result
         
-        cur.close()
-        con.close()
+    except Exception as e:
+        logger.exception("Ошибка получения групп цветов")
+        raise
+
+
+def get_color_groups() -> List[Dict[str, Any]]:
+    """Get all color groups"""
+    return [{"CG_TITLE": row[0]} for row in get_color_groups_rows()]
+
+
+def get_colors_by_group_rows(group_title: str) -> List[tuple]:
+    """Get colors by group from real database (raw cursor rows)"""
+    try:
+        with get_db_connection() as con:
+            cur = con.cursor()
+            
+            sql = """
+            SELECT c.TITLE as COLOR                    
+            FROM COLORS c
+            JOIN COLORGROUP cg ON cg.GROUPID = c.GROUPID
+            WHERE c.DELETED = 0 
+            AND cg.TITLE = ?
+            ORDER BY c.TITLE
+            """
+            cur.execute(sql, (group_title,))
+            result = cur.fetchall()
+            
+            cur.close()
         
-        if ENABLE_LOGGING:
-            print(f"✅ Получено {len(result)} групп цветов")
+        logger.debug("Получено %d цветов для группы '%s'", len(result), group_title)
             
         return result
         
     except Exception as e:
-        if ENABLE_LOGGING:
-            print(f"❌ Ошибка получения групп цветов: {e}")
+        logger.exception("Ошибка получения цветов для группы '%s'", group_title)
         raise
 
 
 def get_colors_by_group(group_title: str) -> List[Dict[str, Any]]:
-    """Get colors by group from real database"""
-    print(f"🔄 БД: Запрос цветов для группы '{group_title}'")
+    """Get colors by group"""
+    return [{"COLOR": row[0]} for row in get_colors_by_group_rows(group_title)]
+
+
+def get_color_catalog_rows() -> List[tuple]:
+    """Get all colors of all shown color groups: (GROUP_TITLE, COLORID, COLOR_TITLE) rows"""
     try:
-        con = get_db_connection()
-        cur = con.cursor()
+        with get_db_connection() as con:
+            cur = con.cursor()
+            
+            sql = """
+            SELECT cg.TITLE as GROUP_TITLE, c.COLORID, c.TITLE as COLOR_TITLE
+            FROM COLORGROUP cg
+            JOIN COLORS c ON c.GROUPID = cg.GROUPID
+            WHERE cg.DELETED = 0
+            AND cg.GROUPID IN (1,2,3,5,6)
+            AND c.DELETED = 0
+            ORDER BY cg.TITLE, c.TITLE
+            """
+            cur.execute(sql)
+            result = cur.fetchall()
+            
+            cur.close()
         
-        sql = """
-        SELECT c.TITLE as COLOR                    
-        FROM COLORS c
-        JOIN COLORGROUP cg ON cg.GROUPID = c.GROUPID
-        WHERE c.DELETED = 0 
-        AND cg.TITLE = ?
-        ORDER BY c.TITLE
-        """
-        print(f"🔄 БД: Выполняем SQL: {sql}")
-        print(f"🔄 БД: Параметр: group_title = '{group_title}'")
-        
-        cur.execute(sql, (group_title,))
-        rows = cur.fetchall()
-        
-        result = []
-        for row in rows:
-            result.append({
-                "COLOR": row[0]
-            })
+        logger.debug("Получено %d цветов каталога", len(result))
+            
+        return result
         
-        cur.close()
-        con.close()
+    except Exception as e:
+        logger.exception("Ошибка получения каталога цветов")
+        raise
+
+
+_BREED_ENUM_ITEMS_SQL = """
+            SELECT ei.ID, ei.TYPEID, ei.CODE
+            FROM ENUM_ITEMS ei
+            WHERE LOWER(TRIM(ei.CODE)) IN ({})
+            """.format(",".join("?" for _ in AVAILABLE_BREEDS))
+
+
+def _breed_codes() -> tuple:
+    return tuple(row[1].lower() for row in AVAILABLE_BREEDS)
+
+
+def get_breed_enum_items_rows() -> List[tuple]:
+    """Get enum items of the available breeds in every TYPEID: (ID, TYPEID, CODE) rows"""
+    try:
+        with get_db_connection() as con:
+            cur = con.cursor()
+            cur.execute(_BREED_ENUM_ITEMS_SQL, _breed_codes())
+            result = cur.fetchall()
+            cur.close()
+        
+        logger.debug("Получено %d элементов перечислений пород", len(result))
         
-        print(f"🔄 БД: Получено {len(result)} цветов для группы '{group_title}'")
-        if ENABLE_LOGGING:
-            print(f"✅ Получено {len(result)} цветов для группы '{group_title}'")
-            
         return result
         
     except Exception as e:
-        print(f"❌ БД: Ошибка получения цветов для группы '{group_title}': {e}")
-        if ENABLE_LOGGING:
-            print(f"❌ Ошибка получения цветов для группы '{group_title}': {e}")
+        logger.exception("Ошибка получения элементов перечислений пород")
         raise
 
 
-def get_order_colors(order_id: int) -> List[Dict[str, Any]]:
-    """Get colors currently used in order from real database"""
+def get_catalog_snapshot_source() -> Dict[str, List[tuple]]:
+    """Get everything the shared catalog snapshot holds, in one connection"""
     try:
-        con = get_db_connection()
-        cur = con.cursor()
+        with get_db_connection() as con:
+            cur = con.cursor()
+            
+            cur.execute("""
+            SELECT cg.GROUPID, cg.TITLE
+            FROM COLORGROUP cg
+            WHERE cg.DELETED = 0
+            AND cg.GROUPID IN (1,2,3,5,6)
+            """)
+            groups = cur.fetchall()
+            
+            cur.execute("""
+            SELECT c.COLORID, c.GROUPID, c.TITLE
+            FROM COLORS c
+            JOIN COLORGROUP cg ON cg.GROUPID = c.GROUPID
+            WHERE c.DELETED = 0
+            AND cg.DELETED = 0
+            AND cg.GROUPID IN (1,2,3,5,6)
+            """)
+            colors = cur.fetchall()
+            
+            # Enum items of the available breeds, for every TYPEID they exist in
+            cur.execute(_BREED_ENUM_ITEMS_SQL, _breed_codes())
+            enum_items = cur.fetchall()
+            
+            cur.close()
         
-        sql = """
-        SELECT DISTINCT c.TITLE as COLOR_TITLE                                
-        FROM ORDERS_ITEMS_ADDS_SETPARAMS oiasp
-        JOIN COLORS c ON c.COLORID = oiasp.COLORVALUEID
-        WHERE (oiasp.ID IN 
-            (SELECT oiasp2.ID
-            FROM ORDERS o2
-            JOIN ORDERS_ITEMS oi2 ON oi2.ORDERID = o2.ID
-            JOIN ORDERS_ITEMS_ADDS oia2 ON oia2.ORDERITEMID = oi2.ID
-            JOIN ORDERS_ITEMS_ADDS_SETPARAMS oiasp2 ON oiasp2.ORDERITEMADDID = oia2.ID
-            WHERE o2.ID = ?))
-        AND (oiasp.PARAMID IN (SELECT sp.ID FROM STRUCTS_PARAMS sp WHERE sp.PARAMTYPE = 3))
-        ORDER BY c.TITLE
-        """
-        cur.execute(sql, (order_id,))
-        rows = cur.fetchall()
-        
-        result = []
-        for row in rows:
-            result.append({
-                "COLOR_TITLE": row[0]
-            })
+        logger.debug(
+            "Каталог для снимка: %d групп, %d цветов, %d пород",
+            len(groups), len(colors), len(enum_items)
+        )
         
-        cur.close()
-        con.close()
+        return {"groups": groups, "colors": colors, "enum_items": enum_items}
         
-        if ENABLE_LOGGING:
-            print(f"✅ Получено {len(result)} цветов для заказа {order_id}")
+    except Exception as e:
+        logger.exception("Ошибка получения каталога для снимка")
+        raise
+
+
+def get_order_colors_rows(order_id: int) -> List[tuple]:
+    """Get colors used in order adds: (COLOR_TITLE, ROW_COUNT, ITEM_COUNT) rows"""
+    try:
+        with get_db_connection() as con:
+            cur = con.cursor()
+            
+            sql = """
+            SELECT c.TITLE as COLOR_TITLE,
+                COUNT(*) as ROW_COUNT,
+                COUNT(DISTINCT oi.ID) as ITEM_COUNT
+            FROM ORDERS_ITEMS oi
+            JOIN ORDERS_ITEMS_ADDS oia ON oia.ORDERITEMID = oi.ID
+            JOIN ORDERS_ITEMS_ADDS_SETPARAMS oiasp ON oiasp.ORDERITEMADDID = oia.ID
+            JOIN STRUCTS_PARAMS sp ON sp.ID = oiasp.PARAMID
+            JOIN COLORS c ON c.COLORID = oiasp.COLORVALUEID
+            WHERE oi.ORDERID = ?
+            AND sp.PARAMTYPE = 3
+            GROUP BY c.TITLE
+            ORDER BY c.TITLE
+            """
+            cur.execute(sql, (order_id,))
+            result = cur.fetchall()
+            
+            cur.close()
+        
+        logger.debug("Получено %d цветов для заказа %s", len(result), order_id)
             
         return result
         
     except Exception as e:
-        if ENABLE_LOGGING:
-            print(f"❌ Ошибка получения цветов для заказа {order_id}: {e}")
+        logger.exception("Ошибка получения цветов для заказа %s", order_id)
         raise
 
 
+def get_order_colors(order_id: int) -> List[Dict[str, Any]]:
+    """Get colors currently used in order"""
+    return [
+        {"COLOR_TITLE": row[0], "ROW_COUNT": row[1], "ITEM_COUNT": row[2]}
+        for row in get_order_colors_rows(order_id)
+    ]
+
+
 def get_order_info(order_id: int) -> List[Dict[str, Any]]:
     """Get order information from real database"""
     try:
-        con = get_db_connection()
-        cur = con.cursor()
-        
-        sql = """
-        SELECT 
-            o.ID,
-            o.ORDERNO,
-            o.DATEORDER,
-            o.ADRESSINSTALL as ORDER_NAME,
-            co.NAME as CUSTOMER_NAME
-        FROM ORDERS o
-        LEFT JOIN CUSTOMERS c ON c.CUSTOMERID = o.CUSTOMERID
-        LEFT JOIN CONTRAGENTS co ON co.CONTRAGID = c.CONTRAGID
-        WHERE o.ID = ?
-        """
-        cur.execute(sql, (order_id,))
-        rows = cur.fetchall()
-        
-        result = []
-        for row in rows:
-            # Format date to string for JSON serialization
-            date_value = row[2]
-            if date_value:
-                try:
-                    if hasattr(date_value, 'strftime'):
-                        formatted_date = date_value.strftime("%Y-%m-%d")
-                    else:
-                        formatted_date = str(date_value)
-                except Exception:
-                    formatted_date = str(date_value) if date_value else None
-            else:
-                formatted_date = None
-                
-            result.append({
-                "ID": row[0],
-                "ORDERNO": row[1],
-                "DATEORDER": formatted_date,
-                "ORDER_NAME": row[3],
-                "CUSTOMER_NAME": row[4]
-            })
-        
-        cur.close()
-        con.close()
+        with get_db_connection() as con:
+            cur = con.cursor()
+            
+            sql = """
+            SELECT 
+                o.ID,
+                o.ORDERNO,
+                o.DATEORDER,
+                o.ADRESSINSTALL as ORDER_NAME,
+                co.NAME as CUSTOMER_NAME
+            FROM ORDERS o
+            LEFT JOIN CUSTOMERS c ON c.CUSTOMERID = o.CUSTOMERID
+            LEFT JOIN CONTRAGENTS co ON co.CONTRAGID = c.CONTRAGID
+            WHERE o.ID = ?
+            """
+            cur.execute(sql, (order_id,))
+            rows = cur.fetchall()
+            
+            result = []
+            for row in rows:
+                # Format date to string for JSON serialization
+                date_value = row[2]
+                if date_value:
+                    try:
+                        if hasattr(date_value, 'strftime'):
+                            formatted_date = date_value.strftime("%Y-%m-%d")
+                        else:
+                            formatted_date = str(date_value)
+                    except Exception:
+                        formatted_date = str(date_value) if date_value else None
+                else:
+                    formatted_date = None
+                    
+                result.append({
+                    "ID": row[0],
+                    "ORDERNO": row[1],
+                    "DATEORDER": formatted_date,
+                    "ORDER_NAME": row[3],
+                    "CUSTOMER_NAME": row[4]
+                })
+            
+            cur.close()
         
-        if ENABLE_LOGGING:
-            print(f"✅ Получена информация о заказе {order_id}")
+        logger.debug("Получена информация о заказе %s", order_id)
             
         return result
         
     except Exception as e:
-        if ENABLE_LOGGING:
-            print(f"❌ Ошибка получения информации о заказе {order_id}: {e}")
+        logger.exception("Ошибка получения информации о заказе %s", order_id)
         raise
 
 
-def update_breed_in_order(order_id: int, breed_code: str, selected_breeds: List[str] = None) -> bool:
+def update_breed_in_order(order_id: int, breed_code: str, selected_breeds: List[str] = None) -> Tuple[int, int]:
     """
     Update breed (wood type) in order using the provided SQL query
+    breed_code is compared with LOWER(TRIM(CODE)), so it must be trimmed and lower case.
+    Returns (matched rows, changed rows), raises on database errors
     """
-    print("🔧" + "=" * 79)
-    print("🔧 STARTING BREED UPDATE PROCESS (ADDS)")
-    print(f"🔧 Order ID: {order_id}")
-    print(f"🔧 Breed Code: {breed_code}")
-    print(f"🔧 Selected Breeds: {selected_breeds}")
-    print("🔧" + "=" * 79)
-    
     try:
-        con = get_db_connection()
-        cur = con.cursor()
-        
-        # Build SQL with optional filter for selected breeds
-        if selected_breeds:
-            # Create placeholders for IN clause
-            placeholders = ",".join(["?" for _ in selected_breeds])
-            breed_filter = f"""
-            AND oiasp.ID IN (
-                SELECT oiasp3.ID
-                FROM ORDERS_ITEMS_ADDS_SETPARAMS oiasp3
-                JOIN ENUM_ITEMS ei3 ON ei3.ID = oiasp3.ENUMVALUEID
-                WHERE ei3.CODE IN ({placeholders})
-                AND oiasp3.PARAMID IN (SELECT sp.ID FROM STRUCTS_PARAMS sp WHERE sp.NAME LIKE '%Wood%')
-            )"""
-        else:
-            breed_filter = ""
-        
-        sql = f"""
-        UPDATE ORDERS_ITEMS_ADDS_SETPARAMS oiasp
-        SET oiasp.ENUMVALUEID = (
-            SELECT ei2.ID
-            FROM (
-                SELECT ei.TYPEID
-                FROM ORDERS_ITEMS_ADDS_SETPARAMS oiasp2
-                JOIN ENUM_ITEMS ei ON ei.ID = oiasp2.ENUMVALUEID
-                WHERE oiasp2.ID = oiasp.ID
-            ) t
-            JOIN ENUM_ITEMS ei2 ON ei2.TYPEID = t.TYPEID
-            WHERE LOWER(TRIM(ei2.CODE)) LIKE ?
-        )
-        WHERE (
-            oiasp.ID IN (
-                SELECT oiasp2.ID
-                FROM ORDERS o2
-                JOIN ORDERS_ITEMS oi2 ON oi2.ORDERID = o2.ID
-                JOIN ORDERS_ITEMS_ADDS oia2 ON oia2.ORDERITEMID = oi2.ID
-                JOIN ORDERS_ITEMS_ADDS_SETPARAMS oiasp2 ON oiasp2.ORDERITEMADDID = oia2.ID
-                WHERE o2.ID = ?
+        with get_db_connection() as con:
+            cur = con.cursor()
+            
+            # Build SQL with optional filter for selected breeds
+            if selected_breeds:
+                selected_sql, selected_params = select_values(con, cur, "breeds", selected_breeds)
+                breed_filter = f"""
+                AND oiasp.ID IN (
+                    SELECT oiasp3.ID
+                    FROM ORDERS_ITEMS_ADDS_SETPARAMS oiasp3
+                    JOIN ENUM_ITEMS ei3 ON ei3.ID = oiasp3.ENUMVALUEID
+                    WHERE ei3.CODE IN ({selected_sql})
+                    AND oiasp3.PARAMID IN (SELECT sp.ID FROM STRUCTS_PARAMS sp WHERE sp.NAME LIKE '%Wood%')
+                )"""
+            else:
+                breed_filter = ""
+            
+            where_sql = f"""
+            WHERE (
+                oiasp.ID IN (
+                    SELECT oiasp2.ID
+                    FROM ORDERS o2
+                    JOIN ORDERS_ITEMS oi2 ON oi2.ORDERID = o2.ID
+                    JOIN ORDERS_ITEMS_ADDS oia2 ON oia2.ORDERITEMID = oi2.ID
+                    JOIN ORDERS_ITEMS_ADDS_SETPARAMS oiasp2 ON oiasp2.ORDERITEMADDID = oia2.ID
+                    WHERE o2.ID = ?
+                )
             )
-        )
-        AND (
-            oiasp.PARAMID IN (
-                SELECT sp.ID 
-                FROM STRUCTS_PARAMS sp 
-                WHERE sp.NAME LIKE '%Wood%'
+            AND (
+                oiasp.PARAMID IN (
+                    SELECT sp.ID 
+                    FROM STRUCTS_PARAMS sp 
+                    WHERE sp.NAME LIKE '%Wood%'
+                )
             )
-        )
-        {breed_filter}
-        """
-        
-        # Prepare parameters
-        breed_param = f"{breed_code.lower()}"
-        params = [breed_param, order_id]
-        if selected_breeds:
-            params.extend(selected_breeds)
-        params = tuple(params)
-        
-        print(f"🔧 Original breed_code: '{breed_code}'")
-        print(f"🔧 Lowercased: '{breed_code.lower()}'")
-        print(f"🔧 With wildcards: '{breed_param}'")
-        print(f"🔧 Final parameters: {params}")
-        print(f"🔧 Parameter types: {[type(p).__name__ for p in params]}")
-        
-        print("🔧 About to execute UPDATE query...")
-        cur.execute(sql, params)
-        
-        # Get the number of affected rows
-        affected_rows = cur.rowcount
-        
-        # Commit the transaction
-        con.commit()
-        
-        cur.close()
-        con.close()
+            {breed_filter}
+            """
+            
+            # Prepare parameters (breed_code is already normalized, see preflight.breed_key)
+            breed_param = breed_code
+            where_params = [order_id]
+            if selected_breeds:
+                where_params.extend(selected_params)
+            
+            # New value is the enum item of the target breed in the row's TYPEID
+            matched_rows, affected_rows = _update_counted(
+                cur, "ORDERS_ITEMS_ADDS_SETPARAMS", "oiasp", "ENUMVALUEID", """
+                (
+                    SELECT ei2.ID
+                    FROM ENUM_ITEMS ei
+                    JOIN ENUM_ITEMS ei2 ON ei2.TYPEID = ei.TYPEID
+                    WHERE ei.ID = oiasp.ENUMVALUEID
+                    AND LOWER(TRIM(ei2.CODE)) = ?
+                )""", where_sql, [breed_param] + where_params
+            )
+            
+            # Commit the transaction
+            con.commit()
+            
+            cur.close()
         
-        print(f"✅ Breed updated successfully for order {order_id}")
-        print(f"   Affected rows: {affected_rows}")
-        print("🔧" + "=" * 79)
-        return True
+        logger.info("Breed updated for order %s, matched rows: %d, changed rows: %d",
+                    order_id, matched_rows, affected_rows)
+        return matched_rows, affected_rows
         
     except Exception as e:
-        print(f"❌ Error updating breed: {e}")
-        print("🔧" + "=" * 79)
-        return False
+        logger.exception("Error updating breed for order %s", order_id)
+        raise
 
 
-def update_color_in_order(order_id: int, new_color: str, new_colorgroup: str, old_colors: List[str]) -> bool:
+def update_color_in_order(order_id: int, new_color_id: int, old_colors: List[str]) -> Tuple[int, int]:
     """
-    Update color in order using the provided SQL query
+    Update color in order to the color resolved by pre-flight (COLORID)
+    Returns (matched rows, changed rows), raises on database errors
     """
-    print("🔧" + "=" * 79)
-    print("🔧 STARTING COLOR UPDATE PROCESS")
-    print(f"🔧 Order ID: {order_id}")
-    print(f"🔧 New Color: {new_color}")
-    print(f"🔧 New Color Group: {new_colorgroup}")
-    print(f"🔧 Selected Old Colors: {old_colors}")
-    print("🔧" + "=" * 79)
-    
     try:
-        con = get_db_connection()
-        cur = con.cursor()
-        
-        # For Firebird, we need to use IN with parameters properly
-        # We'll execute the query with parameters
-        
-        sql = """
-        UPDATE ORDERS_ITEMS_ADDS_SETPARAMS oiasp
-        SET oiasp.COLORVALUEID = (
-            SELECT c.COLORID
-            FROM COLORS c
-            JOIN COLORGROUP cg ON cg.GROUPID = c.GROUPID
-            WHERE c.TITLE LIKE ?
-            AND cg.TITLE LIKE ?
-        )
-        WHERE (
-            oiasp.ID IN (
-                SELECT oiasp2.ID
-                FROM ORDERS o2
-                JOIN ORDERS_ITEMS oi2 ON oi2.ORDERID = o2.ID
-                JOIN ORDERS_ITEMS_ADDS oia2 ON oia2.ORDERITEMID = oi2.ID
-                JOIN ORDERS_ITEMS_ADDS_SETPARAMS oiasp2 ON oiasp2.ORDERITEMADDID = oia2.ID
-                LEFT JOIN COLORS c ON c.COLORID = oiasp2.COLORVALUEID
-                WHERE o2.ID = ?
-                AND c.TITLE IN ({})
+        with get_db_connection() as con:
+            cur = con.cursor()
+            
+            # Old colors come from the selection table, so the statement text does not depend on their count
+            selected_sql, selected_params = select_values(con, cur, "colors", old_colors)
+            
+            where_sql = """
+            WHERE (
+                oiasp.ID IN (
+                    SELECT oiasp2.ID
+                    FROM ORDERS o2
+                    JOIN ORDERS_ITEMS oi2 ON oi2.ORDERID = o2.ID
+                    JOIN ORDERS_ITEMS_ADDS oia2 ON oia2.ORDERITEMID = oi2.ID
+                    JOIN ORDERS_ITEMS_ADDS_SETPARAMS oiasp2 ON oiasp2.ORDERITEMADDID = oia2.ID
+                    LEFT JOIN COLORS c ON c.COLORID = oiasp2.COLORVALUEID
+                    WHERE o2.ID = ?
+                    AND c.TITLE IN ({})
+                )
             )
-        )
-        AND (
-            oiasp.PARAMID IN (
-                SELECT sp.ID 
-                FROM STRUCTS_PARAMS sp 
-                WHERE sp.PARAMTYPE = 3
+            AND (
+                oiasp.PARAMID IN (
+                    SELECT sp.ID 
+                    FROM STRUCTS_PARAMS sp 
+                    WHERE sp.PARAMTYPE = 3
+                )
             )
-        )
-        """.format(",".join(["?" for _ in old_colors]))
-        
-        # Prepare parameters: new_color, new_colorgroup, order_id, then old_colors
-        params = (f"%{new_color}%", f"%{new_colorgroup}%", order_id) + tuple(old_colors)
-        
-        cur.execute(sql, params)
-        
-        # Get the number of affected rows
-        affected_rows = cur.rowcount
-        
-        # Commit the transaction
-        con.commit()
-        
-        cur.close()
-        con.close()
+            """.format(selected_sql)
+            where_params = [order_id] + list(selected_params)
+            
+            # Rows that already hold the target color are counted but not rewritten
+            matched_rows, affected_rows = _update_counted(
+                cur, "ORDERS_ITEMS_ADDS_SETPARAMS", "oiasp", "COLORVALUEID", "?", where_sql,
+                [new_color_id] + where_params
+            )
+            
+            # Commit the transaction
+            con.commit()
+            
+            cur.close()
         
-        if ENABLE_LOGGING:
-            print(f"✅ Color updated successfully for order {order_id}")
-            print(f"   Affected rows: {affected_rows}")
+        logger.info("Color updated for order %s, matched rows: %d, changed rows: %d",
+                    order_id, matched_rows, affected_rows)
             
-        return True
+        return matched_rows, affected_rows
         
     except Exception as e:
-        if ENABLE_LOGGING:
-            print(f"❌ Error updating color: {e}")
-        return False
+        logger.exception("Error updating color for order %s", order_id)
+        raise
 
 
-def update_breed_in_stuffsets_orderitems(order_id: int, breed_code: str, selected_breeds: List[str] = None) -> bool:
+def update_breed_in_stuffsets_orderitems(order_id: int, breed_code: str,
+                                         selected_breeds: List[str] = None) -> Tuple[int, int]:
     """
     Update breed (wood type) in stuffsets orderitems using ORDERS_ITEMS_SETPARAMS table
+    breed_code is compared with LOWER(TRIM(CODE)), so it must be trimmed and lower case.
+    Returns (matched rows, changed rows), raises on database errors
     """
-    print("🔧" + "=" * 79)
-    print("🔧 STARTING STUFFSETS BREED UPDATE PROCESS")
-    print(f"🔧 Order ID: {order_id}")
-    print(f"🔧 Breed Code: {breed_code}")
-    print(f"🔧 Selected Breeds: {selected_breeds}")
-    print("🔧" + "=" * 79)
-    
     try:
-        con = get_db_connection()
-        cur = con.cursor()
-        
-        # Build SQL with optional filter for selected breeds
-        if selected_breeds:
-            # Create placeholders for IN clause
-            placeholders = ",".join(["?" for _ in selected_breeds])
-            breed_filter = f"""
-            AND oisp.ID IN (
-                SELECT oisp3.ID
-                FROM ORDERS_ITEMS_SETPARAMS oisp3
-                JOIN ENUM_ITEMS ei3 ON ei3.ID = oisp3.ENUMVALUEID
-                WHERE ei3.CODE IN ({placeholders})
-                AND oisp3.PARAMID IN (SELECT sp.ID FROM STRUCTS_PARAMS sp WHERE sp.NAME LIKE '%Wood%')
-            )"""
-        else:
-            breed_filter = ""
-        
-        sql = f"""
-        UPDATE ORDERS_ITEMS_SETPARAMS oisp
-        SET oisp.ENUMVALUEID = (
-            SELECT ei2.ID
-            FROM (
-                SELECT ei.TYPEID
-                FROM ORDERS_ITEMS_SETPARAMS oisp2
-                JOIN ENUM_ITEMS ei ON ei.ID = oisp2.ENUMVALUEID
-                WHERE oisp2.ID = oisp.ID
-            ) t
-            JOIN ENUM_ITEMS ei2 ON ei2.TYPEID = t.TYPEID
-            WHERE LOWER(TRIM(ei2.CODE)) LIKE ?
-        )
-        WHERE (
-            oisp.ID IN (
-                SELECT oisp2.ID
-                FROM ORDERS o2
-                JOIN ORDERS_ITEMS oi2 ON oi2.ORDERID = o2.ID
-                JOIN ORDERS_ITEMS_SETPARAMS oisp2 ON oisp2.ORDERITEMID = oi2.ID
-                WHERE o2.ID = ?
-                AND oi2.STUFFSETID IS NOT NULL
+        with get_db_connection() as con:
+            cur = con.cursor()
+            
+            # Build SQL with optional filter for selected breeds
+            if selected_breeds:
+                selected_sql, selected_params = select_values(con, cur, "breeds", selected_breeds)
+                breed_filter = f"""
+                AND oisp.ID IN (
+                    SELECT oisp3.ID
+                    FROM ORDERS_ITEMS_SETPARAMS oisp3
+                    JOIN ENUM_ITEMS ei3 ON ei3.ID = oisp3.ENUMVALUEID
+                    WHERE ei3.CODE IN ({selected_sql})
+                    AND oisp3.PARAMID IN (SELECT sp.ID FROM STRUCTS_PARAMS sp WHERE sp.NAME LIKE '%Wood%')
+                )"""
+            else:
+                breed_filter = ""
+            
+            where_sql = f"""
+            WHERE (
+                oisp.ID IN (
+                    SELECT oisp2.ID
+                    FROM ORDERS o2
+                    JOIN ORDERS_ITEMS oi2 ON oi2.ORDERID = o2.ID
+                    JOIN ORDERS_ITEMS_SETPARAMS oisp2 ON oisp2.ORDERITEMID = oi2.ID
+                    WHERE o2.ID = ?
+                    AND oi2.STUFFSETID IS NOT NULL
+                )
             )
-        )
-        AND (
-            oisp.PARAMID IN (
-                SELECT sp.ID 
-                FROM STRUCTS_PARAMS sp 
-                WHERE sp.NAME LIKE '%Wood%'
+            AND (
+                oisp.PARAMID IN (
+                    SELECT sp.ID 
+                    FROM STRUCTS_PARAMS sp 
+                    WHERE sp.NAME LIKE '%Wood%'
+                )
             )
-        )
-        {breed_filter}
-        """
-        
-        # Prepare parameters
-        breed_param = f"{breed_code.lower()}"
-        params = [breed_param, order_id]
-        if selected_breeds:
-            params.extend(selected_breeds)
-        params = tuple(params)
-        
-        print(f"🔧 Original breed_code: '{breed_code}'")
-        print(f"🔧 Lowercased: '{breed_code.lower()}'")
-        print(f"🔧 With wildcards: '{breed_param}'")
-        print(f"🔧 Final parameters: {params}")
-        print(f"🔧 Parameter types: {[type(p).__name__ for p in params]}")
-        
-        print("🔧 About to execute UPDATE query for stuffsets orderitems...")
-        cur.execute(sql, params)
+            {breed_filter}
+            """
+            
+            # Prepare parameters (breed_code is already normalized, see preflight.breed_key)
+            breed_param = breed_code
+            where_params = [order_id]
+            if selected_breeds:
+                where_params.extend(selected_params)
+            
+            # New value is the enum item of the target breed in the row's TYPEID
+            matched_rows, affected_rows = _update_counted(
+                cur, "ORDERS_ITEMS_SETPARAMS", "oisp", "ENUMVALUEID", """
+                (
+                    SELECT ei2.ID
+                    FROM ENUM_ITEMS ei
+                    JOIN ENUM_ITEMS ei2 ON ei2.TYPEID = ei.TYPEID
+                    WHERE ei.ID = oisp.ENUMVALUEID
+                    AND LOWER(TRIM(ei2.CODE)) = ?
+                )""", where_sql, [breed_param] + where_params
+            )
+            
+            # Commit the transaction
+            con.commit()
+            
+            cur.close()
         
-        # Get the number of affected rows
-        affected_rows = cur.rowcount
+        logger.info("Stuffsets breed updated for order %s, matched rows: %d, changed rows: %d",
+                    order_id, matched_rows, affected_rows)
+        return matched_rows, affected_rows
         
-        # Commit the transaction
-        con.commit()
-        
-        cur.close()
-        con.close()
+    except Exception as e:
+        logger.exception("Error updating stuffsets breed for order %s", order_id)
+        raise
+
+
+def get_stuffsets_breeds_in_order_rows(order_id: int) -> List[tuple]:
+    """Get breeds used in stuffsets orderitems: (BREED_CODE, ROW_COUNT, ITEM_COUNT) rows"""
+    try:
+        with get_db_connection() as con:
+            cur = con.cursor()
+            
+            sql = """
+            SELECT ei.CODE as BREED_CODE,
+                COUNT(*) as ROW_COUNT,
+                COUNT(DISTINCT oi.ID) as ITEM_COUNT
+            FROM ORDERS_ITEMS oi
+            JOIN ORDERS_ITEMS_SETPARAMS oisp ON oisp.ORDERITEMID = oi.ID
+            JOIN STRUCTS_PARAMS sp ON sp.ID = oisp.PARAMID
+            JOIN ENUM_ITEMS ei ON ei.ID = oisp.ENUMVALUEID
+            WHERE oi.ORDERID = ?
+            AND oi.STUFFSETID IS NOT NULL
+            AND sp.NAME LIKE '%Wood%'
+            GROUP BY ei.CODE
+            ORDER BY ei.CODE
+            """
+            cur.execute(sql, (order_id,))
+            result = cur.fetchall()
+            
+            cur.close()
         
-        print(f"✅ Stuffsets breed updated successfully for order {order_id}")
-        print(f"   Affected rows: {affected_rows}")
-        print("🔧" + "=" * 79)
-        return True
+        logger.debug("Получено %d пород дерева для stuffsets в заказе %s", len(result), order_id)
+            
+        return result
         
     except Exception as e:
-        print(f"❌ Error updating stuffsets breed: {e}")
-        print("🔧" + "=" * 79)
-        return False
+        logger.exception("Ошибка получения пород дерева для stuffsets в заказе %s", order_id)
+        raise
 
 
 def get_stuffsets_breeds_in_order(order_id: int) -> List[Dict[str, Any]]:
-    """Get breeds currently used in stuffsets orderitems from real database"""
+    """Get breeds currently used in stuffsets orderitems"""
+    return [
+        {"BREED_CODE": row[0], "ROW_COUNT": row[1], "ITEM_COUNT": row[2]}
+        for row in get_stuffsets_breeds_in_order_rows(order_id)
+    ]
+
+
+def get_adds_breeds_in_order_rows(order_id: int) -> List[tuple]:
+    """Get breeds used in adds (ORDERS_ITEMS_ADDS): (BREED_CODE, ROW_COUNT, ITEM_COUNT) rows"""
     try:
-        con = get_db_connection()
-        cur = con.cursor()
-        
-        sql = """
-        SELECT DISTINCT ei.CODE as BREED_CODE                                
-        FROM ORDERS_ITEMS_SETPARAMS oisp
-        JOIN ENUM_ITEMS ei ON ei.ID = oisp.ENUMVALUEID
-        WHERE (oisp.ID IN 
-            (SELECT oisp2.ID
-            FROM ORDERS o2
-            JOIN ORDERS_ITEMS oi2 ON oi2.ORDERID = o2.ID
-            JOIN ORDERS_ITEMS_SETPARAMS oisp2 ON oisp2.ORDERITEMID = oi2.ID
-            WHERE o2.ID = ?
-            AND oi2.STUFFSETID IS NOT NULL))
-        AND (oisp.PARAMID IN (SELECT sp.ID FROM STRUCTS_PARAMS sp WHERE sp.NAME LIKE '%Wood%'))
-        ORDER BY ei.CODE
-        """
-        cur.execute(sql, (order_id,))
-        rows = cur.fetchall()
-        
-        result = []
-        for row in rows:
-            result.append({
-                "BREED_CODE": row[0]
-            })
-        
-        cur.close()
-        con.close()
+        with get_db_connection() as con:
+            cur = con.cursor()
+            
+            sql = """
+            SELECT ei.CODE as BREED_CODE,
+                COUNT(*) as ROW_COUNT,
+                COUNT(DISTINCT oi.ID) as ITEM_COUNT
+            FROM ORDERS_ITEMS oi
+            JOIN ORDERS_ITEMS_ADDS oia ON oia.ORDERITEMID = oi.ID
+            JOIN ORDERS_ITEMS_ADDS_SETPARAMS oiasp ON oiasp.ORDERITEMADDID = oia.ID
+            JOIN STRUCTS_PARAMS sp ON sp.ID = oiasp.PARAMID
+            JOIN ENUM_ITEMS ei ON ei.ID = oiasp.ENUMVALUEID
+            WHERE oi.ORDERID = ?
+            AND sp.NAME LIKE '%Wood%'
+            GROUP BY ei.CODE
+            ORDER BY ei.CODE
+            """
+            cur.execute(sql, (order_id,))
+            result = cur.fetchall()
+            
+            cur.close()
         
-        if ENABLE_LOGGING:
-            print(f"✅ Получено {len(result)} пород дерева для stuffsets в заказе {order_id}")
+        logger.debug("Получено %d пород дерева для дополнений в заказе %s", len(result), order_id)
             
         return result
         
     except Exception as e:
-        if ENABLE_LOGGING:
-            print(f"❌ Ошибка получения пород дерева для stuffsets в заказе {order_id}: {e}")
+        logger.exception("Ошибка получения пород дерева для дополнений в заказе %s", order_id)
         raise
 
 
-def get_adds_breeds_in_order(order_id: int) -> List[Dict[str, Any]]:
-    """Get breeds currently used in adds (ORDERS_ITEMS_ADDS) from real database"""
+def get_order_breed_types_rows(order_id: int, scope: str) -> List[tuple]:
+    """Get TYPEIDs of the breed rows of order adds or stuffsets: (TYPEID, BREED_CODE, ROW_COUNT) rows"""
     try:
-        con = get_db_connection()
-        cur = con.cursor()
-        
-        sql = """
-        SELECT DISTINCT ei.CODE as BREED_CODE                                
-        FROM ORDERS_ITEMS_ADDS_SETPARAMS oiasp
-        JOIN ENUM_ITEMS ei ON ei.ID = oiasp.ENUMVALUEID
-        WHERE (oiasp.ID IN 
-            (SELECT oiasp2.ID
-            FROM ORDERS o2
-            JOIN ORDERS_ITEMS oi2 ON oi2.ORDERID = o2.ID
-            JOIN ORDERS_ITEMS_ADDS oia2 ON oia2.ORDERITEMID = oi2.ID
-            JOIN ORDERS_ITEMS_ADDS_SETPARAMS oiasp2 ON oiasp2.ORDERITEMADDID = oia2.ID
-            WHERE o2.ID = ?))
-        AND (oiasp.PARAMID IN (SELECT sp.ID FROM STRUCTS_PARAMS sp WHERE sp.NAME LIKE '%Wood%'))
-        ORDER BY ei.CODE
-        """
-        cur.execute(sql, (order_id,))
-        rows = cur.fetchall()
-        
-        result = []
-        for row in rows:
-            result.append({
-                "BREED_CODE": row[0]
-            })
+        with get_db_connection() as con:
+            cur = con.cursor()
+            
+            if scope == "stuffsets":
+                rows_sql = """
+                FROM ORDERS_ITEMS oi
+                JOIN ORDERS_ITEMS_SETPARAMS sp_rows ON sp_rows.ORDERITEMID = oi.ID
+                """
+                scope_filter = "AND oi.STUFFSETID IS NOT NULL"
+            else:
+                rows_sql = """
+                FROM ORDERS_ITEMS oi
+                JOIN ORDERS_ITEMS_ADDS oia ON oia.ORDERITEMID = oi.ID
+                JOIN ORDERS_ITEMS_ADDS_SETPARAMS sp_rows ON sp_rows.ORDERITEMADDID = oia.ID
+                """
+                scope_filter = ""
+            
+            sql = f"""
+            SELECT ei.TYPEID, ei.CODE as BREED_CODE, COUNT(*) as ROW_COUNT
+            {rows_sql}
+            JOIN STRUCTS_PARAMS sp ON sp.ID = sp_rows.PARAMID
+            JOIN ENUM_ITEMS ei ON ei.ID = sp_rows.ENUMVALUEID
+            WHERE oi.ORDERID = ?
+            {scope_filter}
+            AND sp.NAME LIKE '%Wood%'
+            GROUP BY ei.TYPEID, ei.CODE
+            """
+            cur.execute(sql, (order_id,))
+            result = cur.fetchall()
+            
+            cur.close()
         
-        cur.close()
-        con.close()
+        logger.debug("Получено %d типов пород (%s) в заказе %s", len(result), scope, order_id)
         
-        if ENABLE_LOGGING:
-            print(f"✅ Получено {len(result)} пород дерева для дополнений в заказе {order_id}")
-            
         return result
         
     except Exception as e:
-        if ENABLE_LOGGING:
-            print(f"❌ Ошибка получения пород дерева для дополнений в заказе {order_id}: {e}")
+        logger.exception("Ошибка получения типов пород (%s) в заказе %s", scope, order_id)
         raise
 
 
-def get_stuffsets_colors_in_order(order_id: int) -> List[Dict[str, Any]]:
-    """Get colors currently used in stuffsets orderitems from real database"""
+def get_adds_breeds_in_order(order_id: int) -> List[Dict[str, Any]]:
+    """Get breeds currently used in adds (ORDERS_ITEMS_ADDS)"""
+    return [
+        {"BREED_CODE": row[0], "ROW_COUNT": row[1], "ITEM_COUNT": row[2]}
+        for row in get_adds_breeds_in_order_rows(order_id)
+    ]
+
+
+def get_stuffsets_colors_in_order_rows(order_id: int) -> List[tuple]:
+    """Get colors used in stuffsets orderitems: (COLOR_TITLE, ROW_COUNT, ITEM_COUNT) rows"""
     try:
-        con = get_db_connection()
-        cur = con.cursor()
-        
-        sql = """
-        SELECT DISTINCT c.TITLE as COLOR_TITLE                                
-        FROM ORDERS_ITEMS_SETPARAMS oisp
-        JOIN COLORS c ON c.COLORID = oisp.COLORVALUEID
-        WHERE (oisp.ID IN 
-            (SELECT oisp2.ID
-            FROM ORDERS o2
-            JOIN ORDERS_ITEMS oi2 ON oi2.ORDERID = o2.ID
-            JOIN ORDERS_ITEMS_SETPARAMS oisp2 ON oisp2.ORDERITEMID = oi2.ID
-            WHERE o2.ID = ?
-            AND oi2.STUFFSETID IS NOT NULL))
-        AND (oisp.PARAMID IN (SELECT sp.ID FROM STRUCTS_PARAMS sp WHERE sp.PARAMTYPE = 3))
-        ORDER BY c.TITLE
-        """
-        cur.execute(sql, (order_id,))
-        rows = cur.fetchall()
-        
-        result = []
-        for row in rows:
-            result.append({
-                "COLOR_TITLE": row[0]
-            })
-        
-        cur.close()
-        con.close()
+        with get_db_connection() as con:
+            cur = con.cursor()
+            
+            sql = """
+            SELECT c.TITLE as COLOR_TITLE,
+                COUNT(*) as ROW_COUNT,
+                COUNT(DISTINCT oi.ID) as ITEM_COUNT
+            FROM ORDERS_ITEMS oi
+            JOIN ORDERS_ITEMS_SETPARAMS oisp ON oisp.ORDERITEMID = oi.ID
+            JOIN STRUCTS_PARAMS sp ON sp.ID = oisp.PARAMID
+            JOIN COLORS c ON c.COLORID = oisp.COLORVALUEID
+            WHERE oi.ORDERID = ?
+            AND oi.STUFFSETID IS NOT NULL
+            AND sp.PARAMTYPE = 3
+            GROUP BY c.TITLE
+            ORDER BY c.TITLE
+            """
+            cur.execute(sql, (order_id,))
+            result = cur.fetchall()
+            
+            cur.close()
         
-        if ENABLE_LOGGING:
-            print(f"✅ Получено {len(result)} цветов для stuffsets в заказе {order_id}")
+        logger.debug("Получено %d цветов для stuffsets в заказе %s", len(result), order_id)
             
         return result
         
     except Exception as e:
-        if ENABLE_LOGGING:
-            print(f"❌ Ошибка получения цветов для stuffsets в заказе {order_id}: {e}")
+        logger.exception("Ошибка получения цветов для stuffsets в заказе %s", order_id)
         raise
 
 
-def update_color_in_stuffsets_orderitems(order_id: int, new_color: str, new_colorgroup: str, old_colors: List[str]) -> bool:
+def get_stuffsets_colors_in_order(order_id: int) -> List[Dict[str, Any]]:
+    """Get colors currently used in stuffsets orderitems"""
+    return [
+        {"COLOR_TITLE": row[0], "ROW_COUNT": row[1], "ITEM_COUNT": row[2]}
+        for row in get_stuffsets_colors_in_order_rows(order_id)
+    ]
+
+
+def update_color_in_stuffsets_orderitems(order_id: int, new_color_id: int, old_colors: List[str]) -> Tuple[int, int]:
     """
-    Update color in stuffsets orderitems using ORDERS_ITEMS_SETPARAMS table
+    Update color in stuffsets orderitems (ORDERS_ITEMS_SETPARAMS) to the color resolved by pre-flight
+    Returns (matched rows, changed rows), raises on database errors
     """
-    print("🔧" + "=" * 79)
-    print("🔧 STARTING STUFFSETS COLOR UPDATE PROCESS")
-    print(f"🔧 Order ID: {order_id}")
-    print(f"🔧 New Color: {new_color}")
-    print(f"🔧 New Color Group: {new_colorgroup}")
-    print(f"🔧 Selected Old Colors: {old_colors}")
-    print("🔧" + "=" * 79)
-    
     try:
-        con = get_db_connection()
-        cur = con.cursor()
-        
-        # Build SQL with filter for selected old colors
-        if old_colors:
-            # Create placeholders for IN clause
-            placeholders = ",".join(["?" for _ in old_colors])
-            color_filter = f"""
-            AND oisp.ID IN (
-                SELECT oisp3.ID
-                FROM ORDERS_ITEMS_SETPARAMS oisp3
-                JOIN COLORS c3 ON c3.COLORID = oisp3.COLORVALUEID
-                WHERE c3.TITLE IN ({placeholders})
-                AND oisp3.PARAMID IN (SELECT sp.ID FROM STRUCTS_PARAMS sp WHERE sp.PARAMTYPE = 3)
-            )"""
-        else:
-            color_filter = ""
-        
-        sql = f"""
-        UPDATE ORDERS_ITEMS_SETPARAMS oisp
-        SET oisp.COLORVALUEID = (
-            SELECT FIRST 1 c.COLORID
-            FROM COLORS c
-            JOIN COLORGROUP cg ON cg.GROUPID = c.GROUPID
-            WHERE c.TITLE = ?
-            AND cg.TITLE = ?
-        )
-        WHERE (
-            oisp.ID IN (
-                SELECT oisp2.ID
-                FROM ORDERS o2
-                JOIN ORDERS_ITEMS oi2 ON oi2.ORDERID = o2.ID
-                JOIN ORDERS_ITEMS_SETPARAMS oisp2 ON oisp2.ORDERITEMID = oi2.ID
-                WHERE o2.ID = ?
-                AND oi2.STUFFSETID IS NOT NULL
+        with get_db_connection() as con:
+            cur = con.cursor()
+            
+            # Build SQL with filter for selected old colors
+            if old_colors:
+                selected_sql, selected_params = select_values(con, cur, "colors", old_colors)
+                color_filter = f"""
+                AND oisp.ID IN (
+                    SELECT oisp3.ID
+                    FROM ORDERS_ITEMS_SETPARAMS oisp3
+                    JOIN COLORS c3 ON c3.COLORID = oisp3.COLORVALUEID
+                    WHERE c3.TITLE IN ({selected_sql})
+                    AND oisp3.PARAMID IN (SELECT sp.ID FROM STRUCTS_PARAMS sp WHERE sp.PARAMTYPE = 3)
+                )"""
+            else:
+                color_filter = ""
+            
+            where_sql = f"""
+            WHERE (
+                oisp.ID IN (
+                    SELECT oisp2.ID
+                    FROM ORDERS o2
+                    JOIN ORDERS_ITEMS oi2 ON oi2.ORDERID = o2.ID
+                    JOIN ORDERS_ITEMS_SETPARAMS oisp2 ON oisp2.ORDERITEMID = oi2.ID
+                    WHERE o2.ID = ?
+                    AND oi2.STUFFSETID IS NOT NULL
+                )
             )
-        )
-        AND (
-            oisp.PARAMID IN (
-                SELECT sp.ID 
-                FROM STRUCTS_PARAMS sp 
-                WHERE sp.PARAMTYPE = 3
+            AND (
+                oisp.PARAMID IN (
+                    SELECT sp.ID 
+                    FROM STRUCTS_PARAMS sp 
+                    WHERE sp.PARAMTYPE = 3
+                )
             )
-        )
-        {color_filter}
-        """
-        
-        # Prepare parameters: new_color, new_colorgroup, order_id, then old_colors
-        params = [new_color, new_colorgroup, order_id]
-        if old_colors:
-            params.extend(old_colors)
-        params = tuple(params)
+            {color_filter}
+            """
+            where_params = [order_id]
+            if old_colors:
+                where_params.extend(selected_params)
+            
+            # Rows that already hold the target color are counted but not rewritten
+            matched_rows, affected_rows = _update_counted(
+                cur, "ORDERS_ITEMS_SETPARAMS", "oisp", "COLORVALUEID", "?", where_sql,
+                [new_color_id] + where_params
+            )
+            
+            # Commit the transaction
+            con.commit()
+            
+            cur.close()
         
-        print(f"🔧 New color: '{new_color}'")
-        print(f"🔧 New color group: '{new_colorgroup}'")
-        print(f"🔧 Final parameters: {params}")
-        print(f"🔧 Parameter types: {[type(p).__name__ for p in params]}")
+        logger.info("Stuffsets colors updated for order %s, matched rows: %d, changed rows: %d",
+                    order_id, matched_rows, affected_rows)
+        return matched_rows, affected_rows
         
-        print("🔧 About to execute UPDATE query for stuffsets colors...")
+    except Exception as e:
+        logger.exception("Error updating stuffsets colors for order %s", order_id)
+        raise
+
+
+# Setparam rows of one order, by scope: (table, alias, row filter with the order ID parameter)
+_ADDS_ROWS = ("ORDERS_ITEMS_ADDS_SETPARAMS", "oiasp", """
+                oiasp.ID IN (
+                    SELECT oiasp2.ID
+                    FROM ORDERS o2
+                    JOIN ORDERS_ITEMS oi2 ON oi2.ORDERID = o2.ID
+                    JOIN ORDERS_ITEMS_ADDS oia2 ON oia2.ORDERITEMID = oi2.ID
+                    JOIN ORDERS_ITEMS_ADDS_SETPARAMS oiasp2 ON oiasp2.ORDERITEMADDID = oia2.ID
+                    WHERE o2.ID = ?
+                )""")
+_STUFFSETS_ROWS = ("ORDERS_ITEMS_SETPARAMS", "oisp", """
+                oisp.ID IN (
+                    SELECT oisp2.ID
+                    FROM ORDERS o2
+                    JOIN ORDERS_ITEMS oi2 ON oi2.ORDERID = o2.ID
+                    JOIN ORDERS_ITEMS_SETPARAMS oisp2 ON oisp2.ORDERITEMID = oi2.ID
+                    WHERE o2.ID = ?
+                    AND oi2.STUFFSETID IS NOT NULL
+                )""")
+
+# Mapping pairs resolved to (PAIR_NO, OLD_ID, NEW_ID); NEW_ID is NULL when the target does not exist
+# (new breeds are normalized codes, see preflight.breed_key)
+_BREED_PAIRS_SQL = """
+            SELECT m.PAIR_NO, ei.ID AS OLD_ID, (
+                SELECT FIRST 1 ei2.ID
+                FROM ENUM_ITEMS ei2
+                WHERE ei2.TYPEID = ei.TYPEID
+                AND LOWER(TRIM(ei2.CODE)) = m.NEW_VALUE
+            ) AS NEW_ID
+            FROM ({mapping}) m
+            JOIN ENUM_ITEMS ei ON ei.CODE = m.OLD_VALUE
+"""
+# New colors are COLORIDs resolved by pre-flight
+_COLOR_PAIRS_SQL = """
+            SELECT m.PAIR_NO, c.COLORID AS OLD_ID, CAST(m.NEW_VALUE AS INTEGER) AS NEW_ID
+            FROM ({mapping}) m
+            JOIN COLORS c ON c.TITLE = m.OLD_VALUE
+"""
+_WOOD_PARAMS = "SELECT sp.ID FROM STRUCTS_PARAMS sp WHERE sp.NAME LIKE '%Wood%'"
+_COLOR_PARAMS = "SELECT sp.ID FROM STRUCTS_PARAMS sp WHERE sp.PARAMTYPE = 3"
+
+
+# One pass over the rows a mapping selects, ordered by pair: rows are counted per pair and only rows
+# whose value differs are rewritten. A cursor over a join is not updatable, so rows are updated by DB key.
+_COUNTED_REMAP_SQL = """
+EXECUTE BLOCK ({inputs})
+RETURNS (PAIR_NO INTEGER, MATCHED_ROWS INTEGER, CHANGED_ROWS INTEGER)
+AS
+DECLARE VARIABLE ROW_PAIR INTEGER;
+DECLARE VARIABLE ROW_KEY CHAR(8) CHARACTER SET OCTETS;
+DECLARE VARIABLE OLD_VALUE INTEGER;
+DECLARE VARIABLE NEW_VALUE INTEGER;
+BEGIN
+    PAIR_NO = NULL;
+    FOR SELECT p.PAIR_NO, {alias}.RDB$DB_KEY, {alias}.{column}, p.NEW_ID
+        FROM {table} {alias}
+        JOIN ({pairs}) p ON p.OLD_ID = {alias}.{column}
+        WHERE p.NEW_ID IS NOT NULL
+        AND {target_filter}
+        ORDER BY 1
+        INTO :ROW_PAIR, :ROW_KEY, :OLD_VALUE, :NEW_VALUE
+    DO
+    BEGIN
+        IF (PAIR_NO IS DISTINCT FROM ROW_PAIR) THEN
+        BEGIN
+            IF (PAIR_NO IS NOT NULL) THEN
+                SUSPEND;
+            PAIR_NO = ROW_PAIR;
+            MATCHED_ROWS = 0;
+            CHANGED_ROWS = 0;
+        END
+        MATCHED_ROWS = MATCHED_ROWS + 1;
+        IF (NEW_VALUE IS DISTINCT FROM OLD_VALUE) THEN
+        BEGIN
+            UPDATE {table} SET {column} = :NEW_VALUE WHERE RDB$DB_KEY = :ROW_KEY;
+            CHANGED_ROWS = CHANGED_ROWS + 1;
+        END
+    END
+    IF (PAIR_NO IS NOT NULL) THEN
+        SUSPEND;
+END
+"""
+
+
+def _remap_values(order_id: int, rows_scope: tuple, value_column: str, params_sql: str, pairs_sql: str,
+                  columns: List[str], mapping: List[tuple]) -> List[Tuple[int, int]]:
+    """
+    Apply old -> new mapping to the setparam rows of an order in one pass
+    Returns (matched rows, changed rows) per mapping pair (in request order), raises on database errors
+    """
+    olds = [pair[0] for pair in mapping]
+    if len(set(olds)) != len(olds):
+        raise ValueError("Each old value may be mapped only once")
+    table, alias, rows_sql = rows_scope
+    with get_db_connection() as con:
+        cur = con.cursor()
+
+        mapping_sql, mapping_params = select_mapping(con, cur, "map", columns, mapping)
+        params = tuple(mapping_params) + (order_id,)
+        sql = _block_sql(_COUNTED_REMAP_SQL.format(
+            inputs="{inputs}", table=table, alias=alias, column=value_column,
+            pairs=pairs_sql.format(mapping=mapping_sql).strip(),
+            target_filter=f"""{rows_sql.strip()}
+        AND {alias}.PARAMID IN ({params_sql})"""
+        ), params)
+
+        logger.debug("UPDATE SQL: %s", sql)
+        logger.debug("UPDATE parameters: %s", params)
+
         cur.execute(sql, params)
-        
-        # Get the number of affected rows
-        affected_rows = cur.rowcount
-        
-        # Commit the transaction
+        # Pairs without rows in the order are not returned
+        counts = [(0, 0)] * len(mapping)
+        for pair_no, matched, changed in cur.fetchall():
+            counts[pair_no] = (matched, changed)
         con.commit()
-        
         cur.close()
-        con.close()
+    return counts
+
+
+def remap_breeds_in_order(order_id: int, mappings: List[tuple]) -> List[Tuple[int, int]]:
+    """Replace old breeds with new ones in adds of order; (old, new) pairs, (matched, changed) per pair"""
+    try:
+        counts = _remap_values(order_id, _ADDS_ROWS, "ENUMVALUEID", _WOOD_PARAMS, _BREED_PAIRS_SQL,
+                               ["OLD_VALUE", "NEW_VALUE"], mappings)
+        logger.info("Breeds remapped for order %s, (matched, changed) rows per pair: %s", order_id, counts)
+        return counts
+    except Exception:
+        logger.exception("Error remapping breeds for order %s", order_id)
+        raise
+
+
+def remap_breeds_in_stuffsets_orderitems(order_id: int, mappings: List[tuple]) -> List[Tuple[int, int]]:
+    """Replace old breeds with new ones in stuffsets orderitems; (old, new) pairs, (matched, changed) per pair"""
+    try:
+        counts = _remap_values(order_id, _STUFFSETS_ROWS, "ENUMVALUEID", _WOOD_PARAMS, _BREED_PAIRS_SQL,
+                               ["OLD_VALUE", "NEW_VALUE"], mappings)
+        logger.info("Stuffsets breeds remapped for order %s, (matched, changed) rows per pair: %s", order_id, counts)
+        return counts
+    except Exception:
+        logger.exception("Error remapping stuffsets breeds for order %s", order_id)
+        raise
+
+
+def remap_colors_in_order(order_id: int, mappings: List[tuple]) -> List[Tuple[int, int]]:
+    """Replace each old color in adds of order; (old title, new COLORID) pairs, (matched, changed) per pair"""
+    try:
+        counts = _remap_values(order_id, _ADDS_ROWS, "COLORVALUEID", _COLOR_PARAMS, _COLOR_PAIRS_SQL,
+                               ["OLD_VALUE", "NEW_VALUE"], [(old, str(new)) for old, new in mappings])
+        logger.info("Colors remapped for order %s, (matched, changed) rows per pair: %s", order_id, counts)
+        return counts
+    except Exception:
+        logger.exception("Error remapping colors for order %s", order_id)
+        raise
+
+
+def remap_colors_in_stuffsets_orderitems(order_id: int, mappings: List[tuple]) -> List[Tuple[int, int]]:
+    """Replace each old color in stuffsets orderitems; (old title, new COLORID) pairs, (matched, changed) per pair"""
+    try:
+        counts = _remap_values(order_id, _STUFFSETS_ROWS, "COLORVALUEID", _COLOR_PARAMS, _COLOR_PAIRS_SQL,
+                               ["OLD_VALUE", "NEW_VALUE"], [(old, str(new)) for old, new in mappings])
+        logger.info("Stuffsets colors remapped for order %s, (matched, changed) rows per pair: %s", order_id, counts)
+        return counts
+    except Exception:
+        logger.exception("Error remapping stuffsets colors for order %s", order_id)
+        raise
+
+
+def get_order_fingerprint_row(order_id: int) -> tuple:
+    """
+    Aggregate over wood and color setparam rows of order (adds and stuffsets):
+    (ROW_COUNT, ROW_HASH) - the hash sum does not depend on row order
+    """
+    try:
+        with get_db_connection() as con:
+            cur = con.cursor()
+            
+            sql = """
+            SELECT COUNT(*) as ROW_COUNT,
+                COALESCE(SUM(MOD(HASH(t.SRC || ':' || t.ID || ':' || COALESCE(t.ENUMVALUEID, '')
+                    || ':' || COALESCE(t.COLORVALUEID, '')), 1000000007)), 0) as ROW_HASH
+            FROM (
+                SELECT 'A' as SRC, oiasp.ID, oiasp.ENUMVALUEID, oiasp.COLORVALUEID
+                FROM ORDERS_ITEMS oi
+                JOIN ORDERS_ITEMS_ADDS oia ON oia.ORDERITEMID = oi.ID
+                JOIN ORDERS_ITEMS_ADDS_SETPARAMS oiasp ON oiasp.ORDERITEMADDID = oia.ID
+                JOIN STRUCTS_PARAMS sp ON sp.ID = oiasp.PARAMID
+                WHERE oi.ORDERID = ?
+                AND (sp.NAME LIKE '%Wood%' OR sp.PARAMTYPE = 3)
+                UNION ALL
+                SELECT 'S' as SRC, oisp.ID, oisp.ENUMVALUEID, oisp.COLORVALUEID
+                FROM ORDERS_ITEMS oi
+                JOIN ORDERS_ITEMS_SETPARAMS oisp ON oisp.ORDERITEMID = oi.ID
+                JOIN STRUCTS_PARAMS sp ON sp.ID = oisp.PARAMID
+                WHERE oi.ORDERID = ?
+                AND oi.STUFFSETID IS NOT NULL
+                AND (sp.NAME LIKE '%Wood%' OR sp.PARAMTYPE = 3)
+            ) t
+            """
+            cur.execute(sql, (order_id, order_id))
+            result = cur.fetchone()
+            
+            cur.close()
         
-        print(f"✅ Stuffsets colors updated successfully for order {order_id}")
-        print(f"   Affected rows: {affected_rows}")
-        print("🔧" + "=" * 79)
-        return True
+        logger.debug("Получен отпечаток заказа %s: %s", order_id, result)
+            
+        return result
         
     except Exception as e:
-        print(f"❌ Error updating stuffsets colors: {e}")
-        print("🔧" + "=" * 79)
-        return False
+        logger.exception("Ошибка получения отпечатка заказа %s", order_id)
+        raise
 
 
 def test_connection() -> bool:
     """Test database connection"""
     try:
-        con = get_db_connection()
-        cur = con.cursor()
-        
-        sql = "SELECT 1 FROM RDB$DATABASE"
-        cur.execute(sql)
-        result = cur.fetchone()
-        
-        cur.close()
-        con.close()
+        with get_db_connection() as con:
+            cur = con.cursor()
+            
+            sql = "SELECT 1 FROM RDB$DATABASE"
+            cur.execute(sql)
+            result = cur.fetchone()
+            
+            cur.close()
         
-        if ENABLE_LOGGING:
-            print("✅ Database connection test successful")
+        logger.debug("Database connection test successful")
             
         return True
         
     except Exception as e:
-        if ENABLE_LOGGING:
-            print(f"❌ Database connection test failed: {e}")
+        logger.warning("Database connection test failed: %s", e)
         return False
@@ -0,0 +1,331 @@
+"""
+Connection pool for Firebird
+Connections are reused between requests instead of opening one per query.
+A checkout is a context manager; leaving it rolls back whatever was not
+committed and returns the connection to the pool. Pool wait and every
+SQL statement are recorded in the request trace (Server-Timing). Statements
+run under the request deadline and are cancelled when it passes; commits are
+not cancelled.
+"""
+
+import logging
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from modules.logging_config import get_request_id
+from modules.tracing import record
+from modules.deadlines import watchdog, cap_timeout
+from modules.breaker import CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+_SET_CONTEXT_SQL = "SELECT RDB$SET_CONTEXT('USER_TRANSACTION', 'REQUEST_ID', ?) FROM RDB$DATABASE"
+_PING_SQL = "SELECT 1 FROM RDB$DATABASE"
+
+
+class PoolTimeout(Exception):
+    """No free connection within the pool timeout"""
+
+
+class TracedCursor:
+    """Cursor proxy timing each statement (execute plus its fetches)"""
+
+    def __init__(self, cursor, cancel: Optional[Callable[[], Any]] = None):
+        self._cursor = cursor
+        self._cancel = cancel
+        self._label: Optional[str] = None
+        self._elapsed = 0.0
+
+    def _flush(self) -> None:
+        if self._label is not None:
+            record("sql", self._elapsed * 1000, self._label)
+            self._label = None
+            self._elapsed = 0.0
+
+    def _timed(self, method: Callable, *args):
+        started = time.perf_counter()
+        try:
+            if self._cancel is None:
+                return method(*args)
+            with watchdog.watch(self._cancel):
+                return method(*args)
+        finally:
+            self._elapsed += time.perf_counter() - started
+
+    def execute(self, sql, parameters=None):
+        self._flush()
+        # Function that issued the statement, e.g. "get_order_info"
+        self._label = sys._getframe(1).f_code.co_name
+        if parameters is None:
+            return self._timed(self._cursor.execute, sql)
+        return self._timed(self._cursor.execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._flush()
+        self._label = sys._getframe(1).f_code.co_name
+        return self._timed(self._cursor.executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        return self._timed(self._cursor.fetchone)
+
+    def fetchall(self):
+        return self._timed(self._cursor.fetchall)
+
+    def fetchmany(self, *args):
+        return self._timed(self._cursor.fetchmany, *args)
+
+    def close(self) -> None:
+        self._flush()
+        self._cursor.close()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._cursor, name)
+
+
+class PooledConnection:
+    """Checked-out connection; close() or leaving the with-block returns it to the pool"""
+
+    def __init__(self, pool: "ConnectionPool", con):
+        self._pool = pool
+        self._con = con
+        self._cursors: List[TracedCursor] = []
+        self._released = False
+
+    @property
+    def pool(self) -> "ConnectionPool":
+        return self._pool
+
+    def _cancel(self) -> bool:
+        return self._pool.cancel(self._con)
+
+    def cursor(self) -> TracedCursor:
+        cursor = TracedCursor(self._con.cursor(), self._cancel if self._pool.can_cancel else None)
+        self._cursors.append(cursor)
+        return cursor
+
+    def commit(self) -> None:
+        for cursor in self._cursors:
+            cursor._flush()
+        # Not watched: a commit cut short would leave the client unsure whether the change was applied
+        started = time.perf_counter()
+        try:
+            self._con.commit()
+        finally:
+            record("commit", (time.perf_counter() - started) * 1000)
+
+    def rollback(self) -> None:
+        self._con.rollback()
+
+    def close(self) -> None:
+        self._release(failed=False)
+
+    def _release(self, failed: bool) -> None:
+        if self._released:
+            return
+        self._released = True
+        for cursor in self._cursors:
+            cursor._flush()
+        self._pool._release(self._con, failed)
+
+    def __enter__(self) -> "PooledConnection":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._release(failed=exc_type is not None)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._con, name)
+
+
+class ConnectionPool:
+    """Bounded pool of DB connections created on demand"""
+
+    def __init__(self, connect: Callable[[], Any], size: int, timeout: float,
+                 ping_after: float = 60.0, trace_context: bool = True, name: str = "default",
+                 cancel: Optional[Callable[[Any], bool]] = None,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.trace_context = trace_context
+        self._connect = connect
+        self._cancel = cancel
+        self.breaker = breaker or CircuitBreaker(name, threshold=3, reset_timeout=15.0)
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._idle: Deque[Tuple[Any, float]] = deque()
+        self._in_use = 0
+        self._closed = False
+        self._idle_all = threading.Condition(self._lock)  # notified when the last connection is returned
+        # Per-database facts found at runtime (e.g. whether a helper table exists)
+        self.features: Dict[str, Any] = {}
+        # Metrics
+        self._created = 0
+        self._discarded = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def acquire(self, timeout: Optional[float] = None) -> PooledConnection:
+        """Check out a connection; raises PoolTimeout when none frees up in time
+        and CircuitOpen while the database is considered unavailable"""
+        # The half-open probe opens a new connection: that is what tells whether the DB is back
+        probe = self.breaker.allow()
+        timeout = cap_timeout(self.timeout if timeout is None else timeout)
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise PoolTimeout(f"No free database connection within {timeout:.0f} s (pool size {self.size})")
+        try:
+            con = self._new_connection() if probe else (self._take_idle() or self._new_connection())
+        except Exception:
+            self._slots.release()
+            raise
+        waited = time.perf_counter() - started
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        record("pool", waited * 1000)
+        if self.trace_context:
+            self._set_request_context(con)
+        return PooledConnection(self, con)
+
+    @property
+    def can_cancel(self) -> bool:
+        return self._cancel is not None
+
+    def cancel(self, con) -> bool:
+        """Cancel the statement running on a checked-out connection (called from another thread);
+        True when the cancel was accepted"""
+        if self._cancel(con):
+            logger.warning("Pool '%s': операция отменена по истечении времени запроса", self.name)
+            return True
+        logger.warning("Pool '%s': не удалось отменить операцию", self.name)
+        return False
+
+    def _take_idle(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                con, idle_since = self._idle.pop()
+            if time.monotonic() - idle_since < self.ping_after or self._ping(con):
+                return con
+            self._discard(con)
+
+    def _new_connection(self):
+        try:
+            con = self._connect()
+        except Exception as e:
+            if self.breaker.failure(e):
+                self._drop_idle()  # Most likely dead as well
+            raise
+        self.breaker.success()
+        with self._lock:
+            self._created += 1
+        logger.debug("Pool '%s': новое соединение с БД", self.name)
+        return con
+
+    @staticmethod
+    def _ping(con) -> bool:
+        try:
+            cur = con.cursor()
+            cur.execute(_PING_SQL)
+            cur.fetchone()
+            cur.close()
+            con.rollback()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _set_request_context(con) -> None:
+        request_id = get_request_id()
+        if request_id == "-":
+            return
+        started = time.perf_counter()
+        try:
+            cur = con.cursor()
+            cur.execute(_SET_CONTEXT_SQL, (request_id,))
+            cur.fetchone()
+            cur.close()
+        except Exception as e:
+            logger.debug("RDB$SET_CONTEXT failed: %s", e)
+        record("ctx", (time.perf_counter() - started) * 1000)
+
+    def _discard(self, con) -> None:
+        with self._lock:
+            self._discarded += 1
+        try:
+            con.close()
+        except Exception:
+            pass
+
+    def _release(self, con, failed: bool) -> None:
+        """Roll back what was not committed and put the connection back (or drop it)"""
+        try:
+            con.rollback()
+            healthy = True
+        except Exception:
+            healthy = False
+        with self._lock:
+            self._in_use -= 1
+            keep = healthy and not self._closed
+            if keep:
+                self._idle.append((con, time.monotonic()))
+            if not self._in_use:
+                self._idle_all.notify_all()
+        if not keep:
+            if failed:
+                logger.warning("Pool '%s': соединение отброшено после ошибки", self.name)
+            self._discard(con)
+        self._slots.release()
+
+    def _drop_idle(self) -> None:
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        for con, _ in idle:
+            self._discard(con)
+
+    def close(self, timeout: float = 0.0) -> None:
+        """Close idle connections and wait up to `timeout` s for connections in use;
+        those are rolled back and closed when released"""
+        with self._lock:
+            self._closed = True
+        self._drop_idle()
+
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self._in_use:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._idle_all.wait(remaining)
+            busy = self._in_use
+        if busy:
+            logger.warning("Pool '%s': %d соединений не освобождены за %.1f с", self.name, busy, timeout)
+        else:
+            logger.info("Pool '%s' закрыт", self.name)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": self.size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "created": self._created,
+                "discarded": self._discarded,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "wait_ms_avg": round(self._wait_total / self._checkouts * 1000, 2) if self._checkouts else 0.0,
+                "wait_ms_max": round(self._wait_max * 1000, 2),
+            }
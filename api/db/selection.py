@@ -0,0 +1,124 @@
+"""
+Selected value lists for SQL statements
+Values chosen in the client (old breeds, old colors, order IDs) are loaded
+into the global temporary table GCP_SELECTED_VALUES of the current
+transaction and joined from there. The statement text is then the same for
+any number of selected values, so it is prepared once and can be cached.
+Rows live until the end of the transaction (ON COMMIT DELETE ROWS).
+Mappings (old -> new value pairs) keep each column under its own list key,
+rows of one pair share INT_VALUE, the pair number.
+
+The table is created by the startup step (DB_CREATE_SELECTION_TABLE) or by
+`python -m db.selection [database]`; requests never run DDL and fail with
+SelectionTableMissing when it does not exist.
+"""
+
+import logging
+from typing import Any, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+SELECTION_TABLE = "GCP_SELECTED_VALUES"
+
+_SELECTION_DDL = f"""
+CREATE GLOBAL TEMPORARY TABLE {SELECTION_TABLE} (
+    LIST_KEY VARCHAR(16) NOT NULL,
+    STR_VALUE VARCHAR(255),
+    INT_VALUE INTEGER
+) ON COMMIT DELETE ROWS
+"""
+_EXISTS_SQL = "SELECT 1 FROM RDB$RELATIONS WHERE RDB$RELATION_NAME = ?"
+_INSERT_SQL = {
+    "STR_VALUE": f"INSERT INTO {SELECTION_TABLE} (LIST_KEY, STR_VALUE) VALUES (?, ?)",
+    "INT_VALUE": f"INSERT INTO {SELECTION_TABLE} (LIST_KEY, INT_VALUE) VALUES (?, ?)",
+}
+_INSERT_PAIR_SQL = f"INSERT INTO {SELECTION_TABLE} (LIST_KEY, INT_VALUE, STR_VALUE) VALUES (?, ?, ?)"
+
+
+class SelectionTableMissing(Exception):
+    """The selection table does not exist in the database"""
+
+
+def _table_exists(con) -> bool:
+    cur = con.cursor()
+    cur.execute(_EXISTS_SQL, (SELECTION_TABLE,))
+    exists = cur.fetchone() is not None
+    cur.close()
+    return exists
+
+
+def ensure_selection_table(con) -> bool:
+    """Create the selection table when missing; True when it was created"""
+    if _table_exists(con):
+        return False
+    try:
+        # DDL in its own transaction, so the caller's transaction is not committed
+        transaction = con.trans()
+        transaction.begin()
+        transaction.execute_immediate(_SELECTION_DDL)
+        transaction.commit()
+    except Exception:
+        # Another worker process may have created it at the same time
+        if _table_exists(con):
+            return False
+        raise
+    logger.info("Создана временная таблица %s", SELECTION_TABLE)
+    return True
+
+
+def _require_table(con) -> None:
+    """Check (until found, once per pool) that the selection table exists"""
+    features = con.pool.features
+    if features.get("selection_table"):
+        return
+    if not _table_exists(con):
+        raise SelectionTableMissing(
+            f"Table {SELECTION_TABLE} does not exist; create it with `python -m db.selection` "
+            f"or start the API with DB_CREATE_SELECTION_TABLE=true"
+        )
+    features["selection_table"] = True
+
+
+def select_values(con, cur, key: str, values: Sequence[Any]) -> Tuple[str, List[Any]]:
+    """
+    SQL for `column IN (<sql>)` over values, with the parameters it needs
+    Loads values into the selection table of the current transaction.
+    """
+    _require_table(con)
+    column = "INT_VALUE" if values and isinstance(values[0], int) else "STR_VALUE"
+    cur.executemany(_INSERT_SQL[column], [(key, value) for value in values])
+    return f"SELECT sv.{column} FROM {SELECTION_TABLE} sv WHERE sv.LIST_KEY = ?", [key]
+
+
+def select_mapping(con, cur, key: str, columns: Sequence[str],
+                   rows: Sequence[Sequence[str]]) -> Tuple[str, List[Any]]:
+    """
+    SQL of a derived table (PAIR_NO, <columns>...) over mapping rows, with its parameters
+    PAIR_NO is the index of the row in `rows`.
+    """
+    _require_table(con)
+    keys = [f"{key}:{index}" for index in range(len(columns))]
+    cur.executemany(_INSERT_PAIR_SQL, [
+        (keys[index], number, value) for number, row in enumerate(rows) for index, value in enumerate(row)
+    ])
+    sql = "SELECT m0.INT_VALUE AS PAIR_NO, " + ", ".join(
+        f"m{index}.STR_VALUE AS {column}" for index, column in enumerate(columns)
+    ) + f" FROM {SELECTION_TABLE} m0" + "".join(
+        f" JOIN {SELECTION_TABLE} m{index} ON m{index}.LIST_KEY = ? AND m{index}.INT_VALUE = m0.INT_VALUE"
+        for index in range(1, len(columns))
+    ) + " WHERE m0.LIST_KEY = ?"
+    return sql, keys[1:] + keys[:1]
+
+
+if __name__ == "__main__":
+    # Migration: python -m db.selection [database]
+    import sys
+    from modules.config import DB_DEFAULT_PROFILE
+    from modules.logging_config import setup_logging
+    from db.db_functions import db_pool
+
+    setup_logging()
+    database = sys.argv[1] if len(sys.argv) > 1 else DB_DEFAULT_PROFILE
+    with db_pool.get(database).acquire() as connection:
+        created = ensure_selection_table(connection)
+    print(f"{SELECTION_TABLE}: {'created' if created else 'already exists'} in database '{database}'")
@@ -12,17 +12,39 @@ if sys.stdout is None:
 if sys.stderr is None:
     sys.stderr = open(os.devnull, "w")
 
-from fastapi import FastAPI
+import asyncio
+import time
+import uuid
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-import uvicorn
 
+from modules.logging_config import setup_logging, shutdown_logging, request_id_var
 from modules.routes import router
-from modules.config import API_HOST, API_PORT
+from modules.events import event_broadcaster
+from modules.jobs import job_manager
+from modules.changes import apply_remote_change
+from modules.change_feed import change_feed
+from modules.catalog_snapshot import start_snapshot_writer, stop_snapshot_writer
+from modules.profiling import profiling_middleware
+from modules.tracing import server_timing_middleware
+from modules.deadlines import deadline_middleware
+from modules.breaker import breaker_middleware
+from modules.databases import DatabaseRoutingMiddleware
+from db.db_functions import db_pool, prepare_databases
+from modules.idempotency import idempotency_store
+from modules.audit import audit_journal
+from modules.recording import RequestRecorderMiddleware, request_recorder
+from modules.config import API_GRACEFUL_TIMEOUT
+from modules.server import run_server
 
 # Load environment variables
 load_dotenv()
 
+# Route all logging through the background writer
+setup_logging()
+
 # Create FastAPI application
 app = FastAPI(
     title="Group Change Params API",
@@ -39,6 +61,61 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+# Registered before the request ID middleware, so they run inside it and see the ID
+app.middleware("http")(deadline_middleware)
+app.middleware("http")(breaker_middleware)
+app.middleware("http")(profiling_middleware)
+app.middleware("http")(server_timing_middleware)
+
+
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    """Assign request ID (taken from X-Request-ID when the client sends one)"""
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16]
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+
+# Records requests with the request ID and database selected
+app.add_middleware(RequestRecorderMiddleware)
+
+# Outermost: selects the database (also for WebSocket) before anything else runs
+app.add_middleware(DatabaseRoutingMiddleware)
+
+
+@app.on_event("startup")
+async def on_startup():
+    event_broadcaster.bind_loop(asyncio.get_running_loop())
+    audit_journal.start()
+    request_recorder.start()
+    job_manager.start()
+    change_feed.start(apply_remote_change)
+    start_snapshot_writer()
+    await asyncio.to_thread(prepare_databases)
+
+
+@app.on_event("shutdown")
+def on_shutdown():
+    # Runs after uvicorn stopped accepting connections and in-flight requests finished;
+    # running jobs and DB transactions share what is left of the graceful deadline
+    deadline = time.monotonic() + API_GRACEFUL_TIMEOUT
+    job_manager.stop(API_GRACEFUL_TIMEOUT)
+    stop_snapshot_writer()
+    change_feed.stop()
+    for _, pool in db_pool.items():
+        pool.close(max(0.0, deadline - time.monotonic()))
+    idempotency_store.close()
+    audit_journal.stop()
+    request_recorder.stop()
+    shutdown_logging()
+
+
 # Include API routes
 app.include_router(router, prefix="/api")
 
@@ -54,9 +131,4 @@ async def root():
 
 
 if __name__ == "__main__":
-    uvicorn.run(
-        app, 
-        host=API_HOST, 
-        port=API_PORT,
-        log_level="info"
-    )
\ No newline at end of file
+    run_server(app)
\ No newline at end of file
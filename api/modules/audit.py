@@ -0,0 +1,115 @@
+"""
+Audit journal of group changes
+Every change (who, what, which order, rows, duration, outcome) is put on an
+in-memory queue by the request path and appended by a background writer to
+JSONL segment files (modules.journal), so the request never waits on disk.
+Queries read segments most recently written first and stop once the newest
+`limit` matches are found; segments without the order or time range asked
+for are skipped by a per-segment index kept in memory.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from modules.config import (
+    AUDIT_DIR, AUDIT_SEGMENT_BYTES, AUDIT_MAX_SEGMENTS, AUDIT_FLUSH_INTERVAL, AUDIT_QUEUE_LIMIT,
+    DB_DEFAULT_PROFILE
+)
+from modules.journal import SegmentJournal
+from modules.logging_config import get_request_id
+
+logger = logging.getLogger(__name__)
+
+
+class _SegmentIndex:
+    """Orders and time range of one segment, valid while its size is unchanged"""
+
+    __slots__ = ("size", "orders", "first", "last")
+
+    def __init__(self, size: int, entries: List[Dict[str, Any]]):
+        self.size = size
+        self.orders = {(entry.get("database", DB_DEFAULT_PROFILE), entry.get("order_id")) for entry in entries}
+        times = [entry["time"] for entry in entries]
+        self.first = min(times, default=None)
+        self.last = max(times, default=None)
+
+
+class AuditJournal(SegmentJournal):
+    """Journal of changes with a query by database, order and time range"""
+
+    def __init__(self, directory: str, segment_bytes: int, max_segments: int,
+                 flush_interval: float, queue_limit: int):
+        super().__init__(directory, "audit", segment_bytes, max_segments, flush_interval, queue_limit)
+        self._index: Dict[str, _SegmentIndex] = {}
+        self._index_lock = threading.Lock()
+
+    def record(self, entry: Dict[str, Any]) -> bool:
+        """Queue one change record; never waits for disk"""
+        entry.setdefault("time", time.time())
+        entry.setdefault("request_id", get_request_id())
+        if self.running and not super().record(entry):
+            logger.error("Audit queue is full, record dropped: %s", entry)
+            return False
+        return True
+
+    def _skip(self, path: str, size: int, database: Optional[str], order_id: Optional[int],
+              since: Optional[float], until: Optional[float]) -> bool:
+        """True when the index of an unchanged segment shows it has no matching record"""
+        with self._index_lock:
+            index = self._index.get(path)
+        if index is None or index.size != size:
+            return False
+        if index.first is None:
+            return True  # No complete record
+        if since is not None and index.last < since or until is not None and index.first > until:
+            return True
+        if order_id is None:
+            return False
+        if database is not None:
+            return (database, order_id) not in index.orders
+        return all(key[1] != order_id for key in index.orders)
+
+    def query(self, database: Optional[str] = None, order_id: Optional[int] = None, since: Optional[float] = None,
+              until: Optional[float] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Records matching the filters, newest first (records of the last flush interval may be missing)"""
+        if not self.enabled:
+            return []
+        matches: List[Dict[str, Any]] = []
+        candidates = self.candidates(since, until)
+        for path, size, modified in candidates:
+            # Segments come by last write: once `limit` matches are newer than this one, none can follow
+            if len(matches) >= limit and modified < matches[limit - 1]["time"]:
+                break
+            if self._skip(path, size, database, order_id, since, until):
+                continue
+            entries = self.read_segment(path)
+            with self._index_lock:
+                self._index[path] = _SegmentIndex(size, entries)
+            for entry in entries:
+                if database is not None and entry.get("database", DB_DEFAULT_PROFILE) != database:
+                    continue
+                if order_id is not None and entry.get("order_id") != order_id:
+                    continue
+                if since is not None and entry["time"] < since:
+                    continue
+                if until is not None and entry["time"] > until:
+                    continue
+                matches.append(entry)
+            matches.sort(key=lambda entry: entry["time"], reverse=True)
+            del matches[limit:]
+        self._forget_removed()
+        return matches
+
+    def _forget_removed(self) -> None:
+        """Drop index entries of pruned segments"""
+        present = set(self.segments())
+        with self._index_lock:
+            for path in [path for path in self._index if path not in present]:
+                del self._index[path]
+
+
+audit_journal = AuditJournal(
+    AUDIT_DIR, AUDIT_SEGMENT_BYTES, AUDIT_MAX_SEGMENTS, AUDIT_FLUSH_INTERVAL, AUDIT_QUEUE_LIMIT
+)
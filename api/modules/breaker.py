@@ -0,0 +1,131 @@
+"""
+Circuit breaker for the database
+After N consecutive connect failures the breaker opens and DB checkouts fail
+at once instead of waiting for the OS connect timeout. After the reset time
+one request is let through as a probe (half-open): its success closes the
+breaker, its failure opens it again. A request whose handler lets the
+CircuitOpen rejection escape is answered 503 with Retry-After by the
+middleware; handlers that deal with the rejection keep their own answer.
+"""
+
+import logging
+import math
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """Database is considered unavailable; retry after `retry_after` seconds"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Database '{name}' is unavailable, retry in {math.ceil(retry_after)} s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe"""
+
+    def __init__(self, name: str, threshold: int, reset_timeout: float):
+        self.name = name
+        self.threshold = max(1, threshold)
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+        self._last_error: Optional[str] = None
+        # Metrics
+        self._opens = 0
+        self._rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def allow(self) -> bool:
+        """Raise CircuitOpen when calls are not allowed; True when the caller is the half-open probe"""
+        with self._lock:
+            if self._state == CLOSED:
+                return False
+            now = time.monotonic()
+            if self._state == OPEN and now - self._opened_at >= self.reset_timeout:
+                self._state = HALF_OPEN
+                self._probe_started = None
+            # A probe that never reported back (e.g. gave up waiting for a slot) is replaced
+            if self._state == HALF_OPEN and (
+                self._probe_started is None or now - self._probe_started >= self.reset_timeout
+            ):
+                self._probe_started = now
+                logger.info("Breaker '%s': пробное подключение к БД", self.name)
+                return True
+            self._rejected += 1
+            if self._state == OPEN:
+                retry_after = self.reset_timeout - (now - self._opened_at)
+            else:
+                retry_after = self.reset_timeout - (now - self._probe_started)
+        raise CircuitOpen(self.name, max(1.0, retry_after))
+
+    def success(self) -> None:
+        with self._lock:
+            if self._state != CLOSED:
+                logger.warning("Breaker '%s': БД снова доступна, breaker закрыт", self.name)
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_started = None
+
+    def failure(self, error: Exception) -> bool:
+        """Count a connect failure; True when it opened the breaker"""
+        with self._lock:
+            self._failures += 1
+            self._last_error = str(error)
+            if self._state == CLOSED and self._failures < self.threshold:
+                return False
+            opened = self._state == CLOSED
+            self._state = OPEN
+            self._opened_at = time.monotonic()
+            self._probe_started = None
+            if opened:
+                self._opens += 1
+        if opened:
+            logger.error("Breaker '%s' открыт после %d ошибок подключения: %s", self.name, self.threshold, error)
+        return opened
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            retry_after = 0.0
+            if self._state == OPEN:
+                retry_after = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "threshold": self.threshold,
+                "retry_after": round(retry_after, 1),
+                "opens": self._opens,
+                "rejected": self._rejected,
+                "last_error": self._last_error,
+            }
+
+
+async def breaker_middleware(request: Request, call_next):
+    """Answer 503 with Retry-After when the handler failed with an open breaker's rejection"""
+    try:
+        return await call_next(request)
+    except CircuitOpen as error:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": str(error)},
+            headers={"Retry-After": str(math.ceil(error.retry_after))}
+        )
@@ -0,0 +1,79 @@
+"""
+Catalog cache for Group Change Params API
+Keeps encoded catalog responses (breeds, color groups, colors) with their
+ETags so unchanged catalogs are answered without a DB query. When the
+shared catalog snapshot is enabled, entries are dropped as soon as a new
+snapshot generation is mapped. Each database profile has its own cache.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from modules.conditional import make_etag
+from modules.config import CATALOG_TTL
+from modules.catalog_snapshot import shared_catalog
+from modules.databases import PerDatabase
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogCache:
+    """Encoded catalog bodies keyed by catalog name, refreshed after TTL"""
+
+    def __init__(self, ttl: int, generation_source: Optional[Callable[[], Optional[int]]] = None):
+        self.ttl = ttl
+        self.version = 0  # Incremented whenever a refresh brings different content
+        self._entries: Dict[str, Tuple[bytes, str, float]] = {}
+        self._lock = threading.Lock()
+        self._generation_source = generation_source
+        self._generation: Optional[int] = None
+
+    def _check_generation(self) -> None:
+        """Drop all entries when the underlying catalog source changed"""
+        if self._generation_source is None:
+            return
+        generation = self._generation_source()
+        if generation != self._generation:
+            with self._lock:
+                self._entries.clear()
+                self._generation = generation
+
+    def current_etag(self, key: str) -> Optional[str]:
+        """ETag of a fresh cached entry, None if missing or expired"""
+        self._check_generation()
+        entry = self._entries.get(key)
+        if entry and time.monotonic() - entry[2] < self.ttl:
+            return entry[1]
+        return None
+
+    def get(self, key: str, loader: Callable[[], bytes]) -> Tuple[bytes, str]:
+        """Get (body, etag) for catalog, loading it when missing or expired"""
+        self._check_generation()
+        entry = self._entries.get(key)
+        if entry and time.monotonic() - entry[2] < self.ttl:
+            return entry[0], entry[1]
+
+        body = loader()
+        etag = make_etag(body, prefix="cat-")
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is None or previous[1] != etag:
+                self.version += 1
+                logger.info("Catalog '%s' loaded, catalog version %d", key, self.version)
+            self._entries[key] = (body, etag, time.monotonic())
+        return body, etag
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """Drop one catalog entry or all of them"""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+
+catalog_cache: PerDatabase[CatalogCache] = PerDatabase(
+    lambda name: CatalogCache(CATALOG_TTL, generation_source=shared_catalog.get(name).generation)
+)
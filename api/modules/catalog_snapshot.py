@@ -0,0 +1,366 @@
+"""
+Shared catalog snapshot for multi-worker deployments
+One process (a worker holding the writer lock, or a sidecar running
+`python -m modules.catalog_snapshot`) writes the catalog into a compact
+binary file; every worker memory-maps it read-only, so catalog memory is
+paid once and new snapshots are picked up by remapping.
+
+File layout (little-endian):
+    header    magic, format version, generation, created_at, section count
+    index     per section: name, offset, record count, record size
+    sections  groups, colors, enum_items (fixed-size records)
+              strings (UTF-8 blob referenced by offset/length)
+
+Snapshots are written to a new file `catalog-<generation>.snap` and then
+published by atomically replacing the `catalog.current` pointer file, so a
+mapped snapshot is never modified or replaced in place (Windows-safe).
+A refresh whose content equals the published snapshot writes nothing, so
+readers keep their generation and do not rebuild what they derived from it.
+Each database profile other than the default one has its own subdirectory.
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from modules.config import (
+    CATALOG_SNAPSHOT_DIR, CATALOG_SNAPSHOT_WRITER,
+    CATALOG_SNAPSHOT_REFRESH, CATALOG_SNAPSHOT_CHECK_INTERVAL
+)
+from modules.file_lock import try_lock, release_lock
+from modules.databases import PerDatabase, using_database
+from modules.config import DB_DEFAULT_PROFILE
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"GCPCATLG"
+FORMAT_VERSION = 1
+POINTER_FILE = "catalog.current"
+LOCK_FILE = "catalog.writer.lock"
+KEEP_SNAPSHOTS = 3
+
+_HEADER = struct.Struct("<8sIQdI")
+_SECTION = struct.Struct("<16sQII")
+_RECORDS = {
+    "groups": struct.Struct("<iII"),  # GROUPID, title offset, title length
+    "colors": struct.Struct("<iIII"),  # COLORID, group index, title offset, title length
+    "enum_items": struct.Struct("<iiII"),  # ID, TYPEID, code offset, code length
+}
+
+
+class _Strings:
+    """Builder of the strings blob"""
+
+    def __init__(self):
+        self.blob = bytearray()
+
+    def add(self, value: str) -> Tuple[int, int]:
+        data = (value or "").encode("utf-8")
+        offset = len(self.blob)
+        self.blob += data
+        return offset, len(data)
+
+
+def _encode_content(source: Dict[str, List[tuple]]) -> bytes:
+    """Section index and sections of catalog source rows (everything after the header)"""
+    strings = _Strings()
+
+    groups = sorted(source["groups"], key=lambda row: row[1] or "")
+    group_index = {row[0]: index for index, row in enumerate(groups)}
+    group_records = [(group_id, *strings.add(title)) for group_id, title in groups]
+
+    # Sorted by group title, then color title, like the catalog endpoint
+    colors = sorted(
+        (row for row in source["colors"] if row[1] in group_index),
+        key=lambda row: (group_index[row[1]], row[2] or "")
+    )
+    color_records = [(color_id, group_index[group_id], *strings.add(title)) for color_id, group_id, title in colors]
+
+    enum_records = [(item_id, type_id, *strings.add((code or "").strip())) for item_id, type_id, code in source["enum_items"]]
+
+    sections = [
+        ("groups", group_records),
+        ("colors", color_records),
+        ("enum_items", enum_records),
+    ]
+    offset = _HEADER.size + _SECTION.size * (len(sections) + 1)
+    index = []
+    bodies = []
+    for name, records in sections:
+        record = _RECORDS[name]
+        body = b"".join(record.pack(*values) for values in records)
+        index.append(_SECTION.pack(name.encode("ascii"), offset, len(records), record.size))
+        bodies.append(body)
+        offset += len(body)
+    index.append(_SECTION.pack(b"strings", offset, len(strings.blob), 1))
+    bodies.append(bytes(strings.blob))
+
+    return b"".join(index) + b"".join(bodies)
+
+
+def encode_snapshot(source: Dict[str, List[tuple]], generation: int) -> bytes:
+    """Encode catalog source rows (see get_catalog_snapshot_source) into snapshot bytes"""
+    content = _encode_content(source)
+    section_count = len(_RECORDS) + 1  # and the strings blob
+    return _HEADER.pack(MAGIC, FORMAT_VERSION, generation, time.time(), section_count) + content
+
+
+class CatalogSnapshot:
+    """Read-only memory-mapped snapshot"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.generation, self.created_at, section_count = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self._mm.close()
+            raise ValueError(f"Not a catalog snapshot (format {version}): {path}")
+        self._sections = {}
+        for i in range(section_count):
+            name, offset, count, size = _SECTION.unpack_from(self._mm, _HEADER.size + i * _SECTION.size)
+            self._sections[name.rstrip(b"\0").decode("ascii")] = (offset, count, size)
+        self._strings_offset = self._sections["strings"][0]
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def _string(self, offset: int, length: int) -> str:
+        start = self._strings_offset + offset
+        return self._mm[start:start + length].decode("utf-8")
+
+    def _records(self, name: str) -> Iterator[tuple]:
+        offset, count, size = self._sections[name]
+        record = _RECORDS[name]
+        for i in range(count):
+            yield record.unpack_from(self._mm, offset + i * size)
+
+    def count(self, name: str) -> int:
+        return self._sections[name][1]
+
+    def groups(self) -> Iterator[Tuple[int, str]]:
+        """(GROUPID, TITLE) ordered by title"""
+        for group_id, offset, length in self._records("groups"):
+            yield group_id, self._string(offset, length)
+
+    def colors(self) -> Iterator[Tuple[int, int, str]]:
+        """(COLORID, group index, TITLE) ordered by group title, color title"""
+        for color_id, group_index, offset, length in self._records("colors"):
+            yield color_id, group_index, self._string(offset, length)
+
+    def enum_items(self) -> Iterator[Tuple[int, int, str]]:
+        """(ID, TYPEID, CODE) of breed enum items"""
+        for item_id, type_id, offset, length in self._records("enum_items"):
+            yield item_id, type_id, self._string(offset, length)
+
+    # Row views matching the db_functions *_rows results
+
+    def color_groups_rows(self) -> List[tuple]:
+        return [(title,) for _, title in self.groups()]
+
+    def color_catalog_rows(self) -> List[tuple]:
+        titles = [title for _, title in self.groups()]
+        return [(titles[group_index], color_id, title) for color_id, group_index, title in self.colors()]
+
+    def colors_by_group_rows(self, group_title: str) -> Optional[List[tuple]]:
+        """Colors of group, None when the group is not in the snapshot"""
+        titles = [title for _, title in self.groups()]
+        if group_title not in titles:
+            return None
+        wanted = titles.index(group_title)
+        return [(title,) for _, group_index, title in self.colors() if group_index == wanted]
+
+
+def _published(directory: str) -> Tuple[Optional[str], Optional[bytes]]:
+    """Path and content digest of the published snapshot, (None, None) when there is none"""
+    try:
+        with open(os.path.join(directory, POINTER_FILE), encoding="ascii") as f:
+            path = os.path.join(directory, f.read().strip())
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None, None
+    if data[:len(MAGIC)] != MAGIC:
+        return None, None
+    return path, hashlib.sha256(data[_HEADER.size:]).digest()
+
+
+def write_snapshot(directory: str, source: Dict[str, List[tuple]]) -> str:
+    """Write a new snapshot file and publish it through the pointer file,
+    unless the published snapshot has the same content (its path is returned then)"""
+    os.makedirs(directory, exist_ok=True)
+    published_path, published_digest = _published(directory)
+    if published_digest is not None and hashlib.sha256(_encode_content(source)).digest() == published_digest:
+        logger.debug("Catalog unchanged, snapshot %s kept", published_path)
+        return published_path
+    generation = time.time_ns()
+    name = f"catalog-{generation}.snap"
+    path = os.path.join(directory, name)
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(encode_snapshot(source, generation))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    pointer_tmp = os.path.join(directory, POINTER_FILE + ".tmp")
+    with open(pointer_tmp, "w", encoding="ascii") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_tmp, os.path.join(directory, POINTER_FILE))
+
+    _remove_old_snapshots(directory, keep=name)
+    logger.info("Catalog snapshot written: %s", path)
+    return path
+
+
+def _remove_old_snapshots(directory: str, keep: str) -> None:
+    snapshots = sorted(f for f in os.listdir(directory) if f.startswith("catalog-") and f.endswith(".snap"))
+    for name in snapshots[:-KEEP_SNAPSHOTS]:
+        if name == keep:
+            continue
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass  # Still mapped by a worker (Windows); removed on a later refresh
+
+
+def build_snapshot(directory: str) -> str:
+    """Read catalogs from DB and write a snapshot"""
+    from db.db_functions import get_catalog_snapshot_source
+    return write_snapshot(directory, get_catalog_snapshot_source())
+
+
+class SharedCatalog:
+    """Current snapshot of a directory, remapped when a new one is published"""
+
+    def __init__(self, directory: str, check_interval: float):
+        self.directory = directory
+        self.check_interval = check_interval
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._pointer: Optional[str] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def current(self) -> Optional[CatalogSnapshot]:
+        """Mapped snapshot, or None when disabled or not written yet"""
+        if not self.directory:
+            return None
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self._refresh()
+        return self._snapshot
+
+    def generation(self) -> Optional[int]:
+        snapshot = self.current()
+        return snapshot.generation if snapshot else None
+
+    def _refresh(self) -> None:
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                with open(os.path.join(self.directory, POINTER_FILE), encoding="ascii") as f:
+                    pointer = f.read().strip()
+            except FileNotFoundError:
+                return
+            if pointer == self._pointer:
+                return
+            try:
+                snapshot = CatalogSnapshot(os.path.join(self.directory, pointer))
+            except (OSError, ValueError):
+                logger.exception("Failed to map catalog snapshot %s", pointer)
+                return
+            # The previous mapping is released when no reader holds it anymore
+            self._snapshot = snapshot
+            self._pointer = pointer
+            logger.info("Catalog snapshot mapped: %s", pointer)
+
+
+class SnapshotWriter:
+    """Background refresh of the snapshot by the worker that owns the writer lock"""
+
+    def __init__(self, directory: str, interval: int, database: Optional[str] = None):
+        self.directory = directory
+        self.interval = interval
+        self.database = database
+        self._lock_handle = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> bool:
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock_handle = try_lock(os.path.join(self.directory, LOCK_FILE))
+        if self._lock_handle is None:
+            return False  # Another worker is the writer
+        self._thread = threading.Thread(target=self._run, name="catalog-snapshot-writer", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(5)
+        if self._lock_handle is not None:
+            release_lock(self._lock_handle)
+            self._lock_handle = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                with using_database(self.database):
+                    build_snapshot(self.directory)
+            except Exception:
+                logger.exception("Catalog snapshot refresh failed")
+            self._stop.wait(self.interval)
+
+
+def snapshot_directory(database: str) -> str:
+    """Snapshot directory of a database profile ("" when snapshots are disabled)"""
+    if not CATALOG_SNAPSHOT_DIR or database == DB_DEFAULT_PROFILE:
+        return CATALOG_SNAPSHOT_DIR
+    return os.path.join(CATALOG_SNAPSHOT_DIR, database)
+
+
+shared_catalog: PerDatabase[SharedCatalog] = PerDatabase(
+    lambda name: SharedCatalog(snapshot_directory(name), CATALOG_SNAPSHOT_CHECK_INTERVAL)
+)
+snapshot_writer: PerDatabase[SnapshotWriter] = PerDatabase(
+    lambda name: SnapshotWriter(snapshot_directory(name), CATALOG_SNAPSHOT_REFRESH, name)
+)
+
+
+def start_snapshot_writer() -> None:
+    """Start refreshing the snapshots in this process if configured and elected"""
+    if CATALOG_SNAPSHOT_DIR and CATALOG_SNAPSHOT_WRITER != "false":
+        for name, writer in snapshot_writer.items():
+            if writer.start():
+                logger.info("This process writes the catalog snapshot of database '%s'", name)
+
+
+def stop_snapshot_writer() -> None:
+    for _, writer in snapshot_writer.items():
+        writer.stop()
+
+
+if __name__ == "__main__":
+    # Sidecar mode: python -m modules.catalog_snapshot [directory [database]]
+    import sys
+    from modules.logging_config import setup_logging
+
+    setup_logging()
+    database = sys.argv[2] if len(sys.argv) > 2 else DB_DEFAULT_PROFILE
+    target = sys.argv[1] if len(sys.argv) > 1 else snapshot_directory(database)
+    if not target:
+        sys.exit("Snapshot directory is not configured (CATALOG_SNAPSHOT_DIR)")
+    with using_database(database):
+        print(build_snapshot(target))
@@ -0,0 +1,149 @@
+"""
+Change feed shared by worker processes
+Each worker process has its own order read cache, single-flight table,
+last-change times and WebSocket clients. With several workers every
+committed change is also appended to a small SQLite feed; each process polls
+it and applies the changes made by the other processes (drop the order from
+the read cache, set its last-change time, send the event to its own
+WebSocket clients). Another process may serve an old read of the order for
+at most CHANGE_FEED_POLL seconds.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+from modules.config import CHANGE_FEED_PATH, CHANGE_FEED_POLL, CHANGE_FEED_RETENTION
+
+logger = logging.getLogger(__name__)
+
+_PRUNE_EVERY = 100
+
+
+class ChangeFeed:
+    """Append-only feed of committed changes polled by every worker process"""
+
+    def __init__(self, path: str, poll_interval: float, retention: float):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        # Not the PID: a restarted worker may get the PID of one that died
+        self.process_id = uuid.uuid4().hex
+        self._con: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._apply: Optional[Callable[[Dict[str, Any]], None]] = None
+        self._last_seq = 0
+        self._published = 0
+        self._applied = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._con is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            con = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS order_changes (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    process_id TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    event TEXT NOT NULL
+                )
+            """)
+            con.execute("CREATE INDEX IF NOT EXISTS idx_order_changes_created ON order_changes (created_at)")
+            self._con = con
+        return self._con
+
+    def start(self, apply: Callable[[Dict[str, Any]], None]) -> None:
+        """Poll the feed in a background thread; `apply` gets the events of the other processes"""
+        if not self.enabled or self._thread is not None:
+            return
+        with self._lock:
+            row = self._connection().execute("SELECT MAX(seq) FROM order_changes").fetchone()
+            self._last_seq = row[0] or 0
+        self._apply = apply
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="change-feed", daemon=True)
+        self._thread.start()
+        logger.info("Лента изменений %s: опрос каждые %g с", self.path, self.poll_interval)
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(5)
+        self._thread = None
+        with self._lock:
+            if self._con is not None:
+                self._con.close()
+                self._con = None
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        """Append a committed change for the other processes; a failure is logged, never raised"""
+        if not self.enabled:
+            return
+        try:
+            with self._lock:
+                con = self._connection()
+                con.execute(
+                    "INSERT INTO order_changes (process_id, created_at, event) VALUES (?, ?, ?)",
+                    (self.process_id, time.time(), json.dumps(event, ensure_ascii=False, default=str))
+                )
+                self._published += 1
+                if self._published % _PRUNE_EVERY == 0:
+                    con.execute("DELETE FROM order_changes WHERE created_at < ?", (time.time() - self.retention,))
+        except sqlite3.Error:
+            logger.exception("Не удалось записать изменение в ленту изменений")
+
+    def poll(self) -> int:
+        """Apply new changes of the other processes; returns how many were applied"""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT seq, process_id, event FROM order_changes WHERE seq > ? ORDER BY seq",
+                (self._last_seq,)
+            ).fetchall()
+            if rows:
+                self._last_seq = rows[-1][0]
+        applied = 0
+        for _, process_id, event in rows:
+            if process_id == self.process_id:
+                continue
+            try:
+                self._apply(json.loads(event))
+                applied += 1
+            except Exception:
+                logger.exception("Failed to apply a change of another worker process")
+        with self._lock:
+            self._applied += applied
+        return applied
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll()
+            except sqlite3.Error:
+                logger.exception("Change feed poll failed")
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "published": self._published,
+                "applied": self._applied,
+                "last_seq": self._last_seq,
+            }
+
+
+change_feed = ChangeFeed(CHANGE_FEED_PATH, CHANGE_FEED_POLL, CHANGE_FEED_RETENTION)
@@ -0,0 +1,296 @@
+"""
+Change operations for Group Change Params API
+Single place that runs a group change and its post-commit steps,
+used by the change endpoints and by background jobs.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from modules.models import BreedChangeRequest, ColorChangeRequest, BreedMappingRequest, ColorMappingRequest
+from modules.events import event_broadcaster, publish_order_change
+from modules.change_feed import change_feed
+from modules.order_locks import order_locks, OrderLockTimeout
+from modules.single_flight import single_flight, order_key
+from modules.order_cache import order_cache
+from modules.audit import audit_journal
+from modules.deadlines import current_deadline
+from modules.databases import database_name, using_database
+from modules.preflight import PreflightError, breed_key, check_breed_targets, check_color_targets
+from db.db_functions import (
+    update_breed_in_order, update_color_in_order,
+    update_breed_in_stuffsets_orderitems, update_color_in_stuffsets_orderitems,
+    remap_breeds_in_order, remap_breeds_in_stuffsets_orderitems,
+    remap_colors_in_order, remap_colors_in_stuffsets_orderitems
+)
+
+logger = logging.getLogger(__name__)
+
+# Time of the last change made through this API (any worker process), per (database, order) (most recent orders only)
+_LAST_CHANGES_LIMIT = 10000
+_last_changes: "OrderedDict[Tuple[str, int], float]" = OrderedDict()
+_last_changes_lock = threading.Lock()
+
+
+def _row_counts(matched: int, changed: int) -> Dict[str, Any]:
+    """Rows selected by the change and rows actually rewritten; affected_rows is the changed count"""
+    return {"affected_rows": changed, "matched_rows": matched, "changed_rows": changed}
+
+
+def _affected_rows(request: BaseModel, counts: Tuple[int, int]) -> Dict[str, Any]:
+    return _row_counts(*counts)
+
+
+def _pair_rows(request: BaseModel, counts: List[Tuple[int, int]]) -> Dict[str, Any]:
+    """Result of a mapping change: total rows and rows of each pair"""
+    return {
+        **_row_counts(sum(count[0] for count in counts), sum(count[1] for count in counts)),
+        "pairs": [
+            {**jsonable_encoder(mapping), **_row_counts(*count)}
+            for mapping, count in zip(request.mappings, counts)
+        ],
+    }
+
+
+@dataclass(frozen=True)
+class ChangeOperation:
+    """Description of one change endpoint"""
+    name: str
+    scope: str  # "adds" or "stuffsets"
+    kind: str  # "breed" or "color"
+    request_model: Type[BaseModel]
+    apply: Callable[[BaseModel, Any], Any]  # gets what preflight returned (resolved targets)
+    success_message: Callable[[BaseModel], str]
+    failure_message: str
+    values: Callable[[BaseModel], Tuple[List[str], Any]]  # old values and new value(s) for the change event
+    preflight: Callable[[BaseModel], Any]  # raises PreflightError when the change must not reach the DB
+    result: Callable[[BaseModel, Any], Dict[str, Any]] = _affected_rows  # response data from what apply returned
+
+
+def _color_pairs(request: ColorMappingRequest, color_ids: List[int]) -> List[Tuple[str, int]]:
+    return [(m.old_color, color_id) for m, color_id in zip(request.mappings, color_ids)]
+
+
+def _breed_pairs(request: BreedMappingRequest) -> List[Tuple[str, str]]:
+    return [(m.old_breed, breed_key(m.new_breed)) for m in request.mappings]
+
+
+def _breed_values(request: BreedChangeRequest):
+    return request.selected_breeds or [], request.breed_code
+
+
+def _color_values(request: ColorChangeRequest):
+    return request.old_colors, request.new_color
+
+
+def _breed_mapping_values(request: BreedMappingRequest):
+    return [m.old_breed for m in request.mappings], [m.new_breed for m in request.mappings]
+
+
+def _color_mapping_values(request: ColorMappingRequest):
+    return [m.old_color for m in request.mappings], [m.new_color for m in request.mappings]
+
+
+CHANGE_OPERATIONS: Dict[str, ChangeOperation] = {
+    op.name: op for op in (
+        ChangeOperation(
+            name="change-breed",
+            scope="adds",
+            kind="breed",
+            request_model=BreedChangeRequest,
+            apply=lambda r, _: update_breed_in_order(r.order_id, breed_key(r.breed_code), r.selected_breeds),
+            preflight=lambda r: check_breed_targets(r.order_id, "adds", [(r.selected_breeds or None, r.breed_code)]),
+            success_message=lambda r: f"Breed changed to '{r.breed_code}' in order {r.order_id}",
+            failure_message="Failed to update breed",
+            values=_breed_values,
+        ),
+        ChangeOperation(
+            name="change-color",
+            scope="adds",
+            kind="color",
+            request_model=ColorChangeRequest,
+            apply=lambda r, color_ids: update_color_in_order(r.order_id, color_ids[0], r.old_colors),
+            preflight=lambda r: check_color_targets([(r.new_color, r.new_colorgroup)]),
+            success_message=lambda r: f"Color changed to '{r.new_color}' ({r.new_colorgroup}) in order {r.order_id}",
+            failure_message="Failed to update color",
+            values=_color_values,
+        ),
+        ChangeOperation(
+            name="change-stuffsets-breed",
+            scope="stuffsets",
+            kind="breed",
+            request_model=BreedChangeRequest,
+            apply=lambda r, _: update_breed_in_stuffsets_orderitems(
+                r.order_id, breed_key(r.breed_code), r.selected_breeds
+            ),
+            preflight=lambda r: check_breed_targets(
+                r.order_id, "stuffsets", [(r.selected_breeds or None, r.breed_code)]
+            ),
+            success_message=lambda r: f"Stuffsets breed changed to '{r.breed_code}' in order {r.order_id}",
+            failure_message="Failed to update stuffsets breed",
+            values=_breed_values,
+        ),
+        ChangeOperation(
+            name="change-stuffsets-color",
+            scope="stuffsets",
+            kind="color",
+            request_model=ColorChangeRequest,
+            apply=lambda r, color_ids: update_color_in_stuffsets_orderitems(r.order_id, color_ids[0], r.old_colors),
+            preflight=lambda r: check_color_targets([(r.new_color, r.new_colorgroup)]),
+            success_message=lambda r: f"Stuffsets colors changed to '{r.new_color}' in order {r.order_id}",
+            failure_message="Failed to update stuffsets colors",
+            values=_color_values,
+        ),
+        ChangeOperation(
+            name="change-breed-mapping",
+            scope="adds",
+            kind="breed",
+            request_model=BreedMappingRequest,
+            apply=lambda r, _: remap_breeds_in_order(r.order_id, _breed_pairs(r)),
+            preflight=lambda r: check_breed_targets(
+                r.order_id, "adds", [([m.old_breed], m.new_breed) for m in r.mappings]
+            ),
+            success_message=lambda r: f"{len(r.mappings)} breeds remapped in order {r.order_id}",
+            failure_message="Failed to remap breeds",
+            values=_breed_mapping_values,
+            result=_pair_rows,
+        ),
+        ChangeOperation(
+            name="change-color-mapping",
+            scope="adds",
+            kind="color",
+            request_model=ColorMappingRequest,
+            apply=lambda r, color_ids: remap_colors_in_order(r.order_id, _color_pairs(r, color_ids)),
+            preflight=lambda r: check_color_targets([(m.new_color, m.new_colorgroup) for m in r.mappings]),
+            success_message=lambda r: f"{len(r.mappings)} colors remapped in order {r.order_id}",
+            failure_message="Failed to remap colors",
+            values=_color_mapping_values,
+            result=_pair_rows,
+        ),
+        ChangeOperation(
+            name="change-stuffsets-breed-mapping",
+            scope="stuffsets",
+            kind="breed",
+            request_model=BreedMappingRequest,
+            apply=lambda r, _: remap_breeds_in_stuffsets_orderitems(r.order_id, _breed_pairs(r)),
+            preflight=lambda r: check_breed_targets(
+                r.order_id, "stuffsets", [([m.old_breed], m.new_breed) for m in r.mappings]
+            ),
+            success_message=lambda r: f"{len(r.mappings)} stuffsets breeds remapped in order {r.order_id}",
+            failure_message="Failed to remap stuffsets breeds",
+            values=_breed_mapping_values,
+            result=_pair_rows,
+        ),
+        ChangeOperation(
+            name="change-stuffsets-color-mapping",
+            scope="stuffsets",
+            kind="color",
+            request_model=ColorMappingRequest,
+            apply=lambda r, color_ids: remap_colors_in_stuffsets_orderitems(r.order_id, _color_pairs(r, color_ids)),
+            preflight=lambda r: check_color_targets([(m.new_color, m.new_colorgroup) for m in r.mappings]),
+            success_message=lambda r: f"{len(r.mappings)} stuffsets colors remapped in order {r.order_id}",
+            failure_message="Failed to remap stuffsets colors",
+            values=_color_mapping_values,
+            result=_pair_rows,
+        ),
+    )
+}
+
+
+def _audit(name: str, request: BaseModel, affected_rows: Optional[int], started: float,
+           origin: Optional[str], user: Optional[str], error: Optional[Exception] = None,
+           matched_rows: Optional[int] = None) -> None:
+    deadline = current_deadline.get()
+    if error is None:
+        outcome = "ok"
+    elif deadline is not None and deadline.cancelled:
+        outcome = "timeout"
+    elif deadline is not None and deadline.expired:
+        # The statement was not cancelled: it may still have been applied
+        outcome = "unknown"
+    elif isinstance(error, PreflightError):
+        outcome = "rejected"
+    else:
+        outcome = "conflict" if isinstance(error, OrderLockTimeout) else "error"
+    audit_journal.record({
+        "database": database_name(),
+        "operation": name,
+        "order_id": request.order_id,
+        "params": jsonable_encoder(request, exclude={"order_id"}),
+        "affected_rows": affected_rows,
+        "matched_rows": matched_rows,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        "client_id": origin,
+        "user": user,
+        "outcome": outcome,
+        "error": str(error) if error is not None else None,
+    })
+
+
+def execute_change(name: str, request: BaseModel, origin: Optional[str] = None,
+                   user: Optional[str] = None) -> Dict[str, Any]:
+    """Run change operation; returns its result data (affected_rows, ...), raises on failure"""
+    operation = CHANGE_OPERATIONS[name]
+    started = time.perf_counter()
+    try:
+        # Changes of the same order run one after another, so they never hit update conflicts
+        with order_locks.instance().hold(request.order_id):
+            # Checked under the lock, so no earlier change of the order can invalidate the check;
+            # doomed changes are rejected before they reach the database
+            targets = operation.preflight(request)
+            try:
+                data = operation.result(request, operation.apply(request, targets))
+            finally:
+                # Reads of this order made before the change must not be served any more. In-flight
+                # loads are forgotten first: a read joining one after the invalidation would get old data
+                single_flight.forget(order_key(request.order_id, ""))
+                order_cache.instance().invalidate(request.order_id)
+    except Exception as e:
+        _audit(name, request, None, started, origin, user, e)
+        raise
+    affected_rows = data["affected_rows"]
+    _audit(name, request, affected_rows, started, origin, user, matched_rows=data["matched_rows"])
+
+    # A change that rewrote no rows left the order as it was: no client, here or in
+    # other worker processes, has anything to refresh
+    if affected_rows:
+        _remember_change(request.order_id, time.time())
+        old_values, new_value = operation.values(request)
+        event = publish_order_change(
+            request.order_id, operation.scope, operation.kind,
+            old_values, new_value, affected_rows, origin
+        )
+        # Other worker processes drop the order from their caches and notify their clients
+        change_feed.publish(event)
+    return data
+
+
+def _remember_change(order_id: int, changed_at: float) -> None:
+    key = (database_name(), order_id)
+    with _last_changes_lock:
+        _last_changes[key] = changed_at
+        _last_changes.move_to_end(key)
+        if len(_last_changes) > _LAST_CHANGES_LIMIT:
+            _last_changes.popitem(last=False)
+
+
+def apply_remote_change(event: Dict[str, Any]) -> None:
+    """Post-commit steps of a change made by another worker process (from the change feed)"""
+    with using_database(event["database"]):
+        single_flight.forget(order_key(event["order_id"], ""))
+        order_cache.instance().invalidate(event["order_id"])
+        _remember_change(event["order_id"], event["ts"])
+    event_broadcaster.publish(event)
+
+
+def last_change_at(order_id: int) -> Optional[float]:
+    """Time of the last change of order (current database) made through this API, if known"""
+    with _last_changes_lock:
+        return _last_changes.get((database_name(), order_id))
@@ -0,0 +1,219 @@
+"""
+In-memory color search for typeahead
+Indexes all color titles of the catalog (case-insensitive, ё = е) by token
+prefixes and trigrams, so searches never query COLORS.
+"""
+
+import bisect
+import heapq
+import logging
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from modules.config import CATALOG_TTL
+from modules.catalog_snapshot import SharedCatalog, shared_catalog
+from modules.databases import PerDatabase, using_database
+from db.db_functions import get_color_catalog_rows
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+")
+
+# Minimal share of query trigrams a title must contain to match fuzzily
+TRIGRAM_THRESHOLD = 0.5
+# Seconds before a failed background rebuild is tried again
+_RETRY_AFTER = 30.0
+
+
+def normalize(text: str) -> str:
+    return text.casefold().replace("ё", "е")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(normalize(text))
+
+
+def trigrams(compact: str) -> set:
+    padded = f"  {compact} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ColorSearchIndex:
+    """Token-prefix and trigram index over (group_title, color_id, color_title) rows"""
+
+    def __init__(self, rows: Sequence[Tuple[str, int, str]]):
+        self.rows = list(rows)
+        self._titles: List[str] = []
+        self._compact: List[str] = []
+        self._tokens: List[Tuple[str, int]] = []  # sorted (token, row index)
+        self._trigrams: Dict[str, List[int]] = defaultdict(list)
+
+        for index, (_, _, title) in enumerate(self.rows):
+            tokens = tokenize(title)
+            compact = "".join(tokens)
+            self._titles.append(" ".join(tokens))
+            self._compact.append(compact)
+            self._tokens.extend((token, index) for token in set(tokens))
+            for gram in trigrams(compact):
+                self._trigrams[gram].append(index)
+        self._tokens.sort()
+        self._token_keys = [token for token, _ in self._tokens]
+        self._token_rows = [index for _, index in self._tokens]
+        # Tie-break of equal scores: shorter titles first, then alphabetical
+        order = sorted(range(len(self.rows)), key=lambda i: (len(self._titles[i]), self._titles[i]))
+        self._rank = [0] * len(self.rows)
+        for rank, index in enumerate(order):
+            self._rank[index] = rank
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _prefix_matches(self, prefix: str) -> set:
+        start = bisect.bisect_left(self._token_keys, prefix)
+        end = bisect.bisect_left(self._token_keys, prefix + "\U0010ffff", start)
+        return set(self._token_rows[start:end])
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[float, Tuple[str, int, str]]]:
+        """Ranked (score, row) matches, best first"""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        phrase = " ".join(tokens)
+        compact = "".join(tokens)
+        scores: Dict[int, float] = {}
+
+        # Every query token is a prefix of some title token
+        matched = None
+        for token in tokens:
+            token_matches = self._prefix_matches(token)
+            matched = token_matches if matched is None else matched & token_matches
+            if not matched:
+                break
+        for index in matched or ():
+            title = self._titles[index]
+            if title == phrase:
+                scores[index] = 100.0
+            elif title.startswith(phrase):
+                scores[index] = 80.0
+            else:
+                scores[index] = 60.0
+
+        # Substring of the title without separators ("ral9016", "9016"), then typos.
+        # These score at most 50, below any prefix match, so they are only looked
+        # for when the prefix matches do not fill the limit.
+        if len(scores) < limit:
+            grams = trigrams(compact)
+            counts = Counter()
+            for gram in grams:
+                counts.update(self._trigrams.get(gram, ()))
+            for index, count in counts.items():
+                if index in scores:
+                    continue
+                if compact in self._compact[index]:
+                    scores[index] = 50.0
+                    continue
+                similarity = count / len(grams)
+                if similarity >= TRIGRAM_THRESHOLD:
+                    scores[index] = round(40.0 * similarity, 1)
+
+        # Best scores first; within a score shorter titles first, then alphabetical
+        by_score: Dict[float, List[int]] = defaultdict(list)
+        for index, score in scores.items():
+            by_score[score].append(index)
+        results = []
+        for score in sorted(by_score, reverse=True):
+            for index in heapq.nsmallest(limit - len(results), by_score[score], key=self._rank.__getitem__):
+                results.append((score, self.rows[index]))
+            if len(results) >= limit:
+                break
+        return results
+
+
+class ColorSearch:
+    """Lazily built index; after CATALOG_TTL or a new catalog snapshot it is rebuilt in the
+    background while searches keep using the old one"""
+
+    def __init__(self, ttl: int, rows_loader: Callable[[], Sequence[Tuple[str, int, str]]],
+                 catalog: SharedCatalog, database: str):
+        self.ttl = ttl
+        self.database = database
+        self._rows_loader = rows_loader
+        self._catalog = catalog
+        self._lock = threading.Lock()
+        self._index: Optional[ColorSearchIndex] = None
+        self._built_at = 0.0
+        self._generation: Optional[int] = None
+        self._rebuilding = False
+        self._failed_at: Optional[float] = None
+
+    def _fresh(self) -> bool:
+        return (
+            self._index is not None
+            and time.monotonic() - self._built_at < self.ttl
+            and self._catalog.generation() == self._generation
+        )
+
+    def _build(self) -> ColorSearchIndex:
+        generation = self._catalog.generation()
+        started = time.perf_counter()
+        index = ColorSearchIndex(self._rows_loader())
+        logger.info(
+            "Индекс поиска цветов построен: %d цветов за %.1f мс",
+            len(index), (time.perf_counter() - started) * 1000
+        )
+        self._index = index
+        self._built_at = time.monotonic()
+        self._generation = generation
+        return index
+
+    def index(self) -> ColorSearchIndex:
+        if self._fresh():
+            return self._index
+        with self._lock:
+            if self._index is None:
+                # Nothing to serve yet: the first search builds the index itself
+                return self._build()
+            retry_at = (self._failed_at or 0.0) + min(self.ttl, _RETRY_AFTER)
+            if not self._fresh() and not self._rebuilding and time.monotonic() >= retry_at:
+                self._rebuilding = True
+                threading.Thread(target=self._rebuild, name=f"color-search-{self.database}", daemon=True).start()
+            return self._index
+
+    def _rebuild(self) -> None:
+        try:
+            # Own thread: not bound by the deadline of the request that noticed the stale index
+            with using_database(self.database):
+                generation = self._catalog.generation()
+                index = ColorSearchIndex(self._rows_loader())
+            with self._lock:
+                self._index = index
+                self._built_at = time.monotonic()
+                self._generation = generation
+                self._failed_at = None
+            logger.info("Индекс поиска цветов обновлён: %d цветов", len(index))
+        except Exception:
+            logger.exception("Color search index rebuild failed, the previous index stays in use")
+            with self._lock:
+                self._failed_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._rebuilding = False
+
+    def invalidate(self) -> None:
+        """Rebuild on the next search (in the background when there is an index to serve meanwhile)"""
+        with self._lock:
+            self._built_at = 0.0
+
+
+def _catalog_rows() -> List[tuple]:
+    snapshot = shared_catalog.instance().current()
+    return snapshot.color_catalog_rows() if snapshot else get_color_catalog_rows()
+
+
+# Index of the current database is built in the request that first needs it
+color_search: PerDatabase[ColorSearch] = PerDatabase(
+    lambda name: ColorSearch(CATALOG_TTL, _catalog_rows, shared_catalog.get(name), name)
+)
@@ -0,0 +1,42 @@
+"""
+Conditional GET support (ETag / If-None-Match)
+"""
+
+import hashlib
+
+from fastapi import Request
+from fastapi.responses import Response
+
+
+def make_etag(body: bytes, prefix: str = "") -> str:
+    """Strong ETag from response body content"""
+    digest = hashlib.blake2b(body, digest_size=8).hexdigest()
+    return f'"{prefix}{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Check If-None-Match header of the request against ETag"""
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [value.strip() for value in header.split(",")]
+    # Weak comparison, as required for If-None-Match
+    return any(value.removeprefix("W/") == etag.removeprefix("W/") for value in candidates)
+
+
+def not_modified(etag: str) -> Response:
+    """304 response for a matching validator"""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+def conditional_response(request: Request, body: bytes, etag: str) -> Response:
+    """304 if the client already has this version, otherwise full JSON body"""
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": "no-cache"}
+    )
@@ -12,6 +12,15 @@ load_dotenv()
 API_PORT = int(os.getenv("API_PORT", "8002"))
 API_HOST = os.getenv("API_HOST", "0.0.0.0")
 
+# Server launcher (python main.py)
+API_WORKERS = max(1, int(os.getenv("API_WORKERS", "1")))  # worker processes
+API_LOOP = os.getenv("API_LOOP", "auto").lower()  # "auto" (uvloop when installed), "uvloop", "asyncio"
+API_HTTP = os.getenv("API_HTTP", "auto").lower()  # "auto" (httptools when installed), "httptools", "h11"
+API_KEEPALIVE = int(os.getenv("API_KEEPALIVE", "15"))  # seconds an idle keep-alive connection is kept
+API_BACKLOG = int(os.getenv("API_BACKLOG", "2048"))  # pending connections queued by the OS
+# Seconds in-flight requests, jobs and DB transactions get to finish on shutdown
+API_GRACEFUL_TIMEOUT = float(os.getenv("API_GRACEFUL_TIMEOUT", "30"))
+
 # Database configuration (direct Firebird connection)
 DB_CONFIG = {
     "host": os.getenv("DB_HOST", "192.168.1.251"),
@@ -23,4 +32,152 @@ DB_CONFIG = {
 }
 
 # Logging
-ENABLE_LOGGING = os.getenv("ENABLE_LOGGING", "true").lower() == "true"
+# ENABLE_LOGGING accepts "true"/"false" or a level name (DEBUG, INFO, WARNING, ERROR)
+_LOGGING_SETTING = os.getenv("ENABLE_LOGGING", "true").strip().upper()
+ENABLE_LOGGING = _LOGGING_SETTING not in ("FALSE", "0", "NO", "OFF")
+if _LOGGING_SETTING in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"):
+    LOG_LEVEL = _LOGGING_SETTING
+else:
+    LOG_LEVEL = "INFO" if ENABLE_LOGGING else "WARNING"
+
+# Per-module levels, e.g. "db.db_functions=DEBUG,modules.routes=WARNING"
+LOG_MODULE_LEVELS = {
+    name.strip(): level.strip().upper()
+    for name, _, level in (
+        item.partition("=") for item in os.getenv("LOG_MODULE_LEVELS", "").split(",")
+    )
+    if name.strip() and level.strip()
+}
+
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # "json" or "text"
+LOG_FILE = os.getenv("LOG_FILE", "logs/api.log")  # empty string disables the file
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_TO_CONSOLE = os.getenv("LOG_TO_CONSOLE", "true").lower() == "true"
+# Fraction of DEBUG events kept per message template (1.0 keeps all)
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+
+# Catalog cache (breeds, color groups, colors): seconds before a catalog is re-read from DB
+CATALOG_TTL = int(os.getenv("CATALOG_TTL", "300"))
+
+# Background jobs
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "data/jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_LIMIT = int(os.getenv("JOB_QUEUE_LIMIT", "1000"))
+
+# Shared catalog snapshot (memory-mapped by every worker); empty directory disables it
+CATALOG_SNAPSHOT_DIR = os.getenv("CATALOG_SNAPSHOT_DIR", "")
+# "auto": the first worker to take the writer lock refreshes the snapshot;
+# "false": workers only read (snapshot written by `python -m modules.catalog_snapshot`)
+CATALOG_SNAPSHOT_WRITER = os.getenv("CATALOG_SNAPSHOT_WRITER", "auto").lower()
+CATALOG_SNAPSHOT_REFRESH = int(os.getenv("CATALOG_SNAPSHOT_REFRESH", "300"))
+CATALOG_SNAPSHOT_CHECK_INTERVAL = float(os.getenv("CATALOG_SNAPSHOT_CHECK_INTERVAL", "5"))
+
+# Per-request time budgets (seconds): DB statements still running when the budget ends are
+# cancelled and the client gets 504; 0 disables. ROUTE_TIMEOUTS sets budgets by path prefix,
+# e.g. "/api/change-=90,/api/orders/=20" (the longest matching prefix wins)
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "30"))
+ROUTE_TIMEOUTS = {
+    prefix.strip(): float(seconds)
+    for prefix, _, seconds in (
+        item.partition("=") for item in os.getenv("ROUTE_TIMEOUTS", "/api/change-=90").split(",")
+    )
+    if prefix.strip() and seconds.strip()
+}
+
+# Per-order write serialization: seconds a change waits for earlier changes of the same order
+ORDER_LOCK_TIMEOUT = float(os.getenv("ORDER_LOCK_TIMEOUT", "30"))
+# Directory of per-order lock files that serialize changes across worker processes
+# (used by default when API_WORKERS > 1; empty string disables it)
+ORDER_LOCK_DIR = os.getenv("ORDER_LOCK_DIR", "data/locks" if API_WORKERS > 1 else "")
+# Number of lock files in that directory; orders share them by order ID, so the directory stays bounded
+ORDER_LOCK_FILES = int(os.getenv("ORDER_LOCK_FILES", "256"))
+
+# Single-flight reads: number of keys kept in per-key metrics
+SINGLE_FLIGHT_METRIC_KEYS = int(os.getenv("SINGLE_FLIGHT_METRIC_KEYS", "500"))
+
+# Order read cache: orders kept (LRU) and seconds before an entry is re-read (covers edits made in Altawin)
+ORDER_CACHE_SIZE = int(os.getenv("ORDER_CACHE_SIZE", "200"))
+ORDER_CACHE_TTL = float(os.getenv("ORDER_CACHE_TTL", "30"))
+
+# Change feed that lets worker processes drop each other's changed orders from their read
+# caches and forward change events to their WebSocket clients (SQLite file; used by default
+# when API_WORKERS > 1, empty string disables it). Polled every CHANGE_FEED_POLL seconds
+CHANGE_FEED_PATH = os.getenv("CHANGE_FEED_PATH", "data/changes.sqlite3" if API_WORKERS > 1 else "")
+CHANGE_FEED_POLL = float(os.getenv("CHANGE_FEED_POLL", "0.2"))
+CHANGE_FEED_RETENTION = float(os.getenv("CHANGE_FEED_RETENTION", "3600"))  # seconds changes are kept
+
+# Request profiling (debug): "X-Profile: 1" captures a cProfile of that request;
+# PROFILE_SLOW_MS > 0 samples every request and keeps the profile of slower ones
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "data/profiles")
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "50"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+
+# Database connection pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # seconds to wait for a free connection
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", "60"))  # idle seconds before a connection is checked
+# Fast fail while the DB host is unreachable: TCP check with this timeout before each new
+# connection (seconds, 0 disables), and a circuit breaker that opens after N consecutive
+# connect failures and lets a probe through every DB_BREAKER_RESET seconds
+DB_CONNECT_TIMEOUT = float(os.getenv("DB_CONNECT_TIMEOUT", "3"))
+DB_BREAKER_THRESHOLD = int(os.getenv("DB_BREAKER_THRESHOLD", "3"))
+DB_BREAKER_RESET = float(os.getenv("DB_BREAKER_RESET", "15"))
+# Put the request ID into RDB$SET_CONTEXT('USER_TRANSACTION', 'REQUEST_ID') of every DB transaction
+DB_TRACE_CONTEXT = os.getenv("DB_TRACE_CONTEXT", "true").lower() == "true"
+
+# Database profiles: one API serves several Altawin databases (one per site).
+# DB_PROFILES="site2,site3" adds profiles configured by DB_SITE2_HOST, DB_SITE2_PORT, DB_SITE2_NAME,
+# DB_SITE2_USER, DB_SITE2_PASSWORD, DB_SITE2_CHARSET and DB_SITE2_POOL_SIZE (unset values fall
+# back to the DB_* settings); the "default" profile is DB_CONFIG itself
+_PROFILE_SETTINGS = (
+    ("host", "HOST"), ("port", "PORT"), ("database", "NAME"),
+    ("user", "USER"), ("password", "PASSWORD"), ("charset", "CHARSET"),
+)
+
+
+def _profile_config(name: str) -> dict:
+    prefix = "DB_" + name.upper().replace("-", "_") + "_"
+    config = {key: type(DB_CONFIG[key])(os.getenv(prefix + env, DB_CONFIG[key])) for key, env in _PROFILE_SETTINGS}
+    config["pool_size"] = int(os.getenv(prefix + "POOL_SIZE", str(DB_POOL_SIZE)))
+    return config
+
+
+DB_PROFILES = {"default": {**DB_CONFIG, "pool_size": DB_POOL_SIZE}}
+for _name in filter(None, (name.strip() for name in os.getenv("DB_PROFILES", "").split(","))):
+    DB_PROFILES[_name] = _profile_config(_name)
+# Profile of requests that select none (neither /db/<name>/ path prefix nor X-Database header)
+DB_DEFAULT_PROFILE = os.getenv("DB_DEFAULT_PROFILE", "default")
+
+# Selected values are passed to SQL through a global temporary table (stable statement text);
+# created at startup when missing, or beforehand with `python -m db.selection` (then set false)
+DB_CREATE_SELECTION_TABLE = os.getenv("DB_CREATE_SELECTION_TABLE", "true").lower() == "true"
+
+# Idempotency keys of change requests
+IDEMPOTENCY_DB_PATH = os.getenv("IDEMPOTENCY_DB_PATH", "data/idempotency.sqlite3")
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", str(24 * 3600)))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+# Seconds a duplicate waits for the in-flight request with the same key
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", "120"))
+
+# Audit journal of changes (JSONL segments written in batches); empty directory disables it
+AUDIT_DIR = os.getenv("AUDIT_DIR", "data/audit")
+AUDIT_SEGMENT_BYTES = int(os.getenv("AUDIT_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+AUDIT_MAX_SEGMENTS = int(os.getenv("AUDIT_MAX_SEGMENTS", "64"))  # oldest removed beyond this (1 GB); 0 keeps all
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.5"))  # seconds records wait for one fsync
+AUDIT_QUEUE_LIMIT = int(os.getenv("AUDIT_QUEUE_LIMIT", "100000"))
+
+# Request recording for replay (benchmarks/replay.py); JSONL segments like the audit journal
+RECORD_REQUESTS = os.getenv("RECORD_REQUESTS", "false").lower() == "true"
+RECORD_DIR = os.getenv("RECORD_DIR", "data/recordings")
+RECORD_SAMPLE_RATE = float(os.getenv("RECORD_SAMPLE_RATE", "1.0"))  # share of requests recorded
+RECORD_MAX_BODY = int(os.getenv("RECORD_MAX_BODY", str(64 * 1024)))  # larger bodies are recorded without content
+RECORD_REDACT_FIELDS = {
+    field.strip().lower()
+    for field in os.getenv("RECORD_REDACT_FIELDS", "password,token,secret,authorization,api_key").split(",")
+    if field.strip()
+}
+RECORD_SEGMENT_BYTES = int(os.getenv("RECORD_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+RECORD_MAX_SEGMENTS = int(os.getenv("RECORD_MAX_SEGMENTS", "20"))
@@ -0,0 +1,101 @@
+"""
+Database profiles for Group Change Params API
+One API serves several Altawin databases. A request selects its database
+by path prefix (/db/<name>/api/...) or the X-Database header, otherwise it
+uses the default profile. Connection pools, catalog caches and other
+per-database state are kept per profile (PerDatabase), so the load of one
+site does not affect another.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Generic, ItemsView, Iterator, Optional, TypeVar
+
+from fastapi.responses import JSONResponse
+
+from modules.config import DB_PROFILES, DB_DEFAULT_PROFILE
+
+PATH_PREFIX = "/db/"
+HEADER = b"x-database"
+
+if DB_DEFAULT_PROFILE not in DB_PROFILES:
+    raise ValueError(f"DB_DEFAULT_PROFILE '{DB_DEFAULT_PROFILE}' is not one of DB_PROFILES")
+
+# Database of the request (or job) being handled in the current context
+current_database: ContextVar[str] = ContextVar("current_database", default=DB_DEFAULT_PROFILE)
+
+
+class UnknownDatabase(Exception):
+    """No database profile with this name"""
+
+
+def database_name() -> str:
+    """Database profile of the current context"""
+    return current_database.get()
+
+
+@contextmanager
+def using_database(name: Optional[str]) -> Iterator[None]:
+    """Run the block against another database profile (None is the default one)"""
+    name = name or DB_DEFAULT_PROFILE
+    if name not in DB_PROFILES:
+        raise UnknownDatabase(f"Unknown database '{name}'")
+    token = current_database.set(name)
+    try:
+        yield
+    finally:
+        current_database.reset(token)
+
+
+T = TypeVar("T")
+
+
+class PerDatabase(Generic[T]):
+    """One instance of a component per database profile"""
+
+    def __init__(self, factory: Callable[[str], T]):
+        self._instances: Dict[str, T] = {name: factory(name) for name in DB_PROFILES}
+
+    def instance(self) -> T:
+        """Instance of the current database"""
+        return self._instances[current_database.get()]
+
+    def get(self, name: str) -> T:
+        return self._instances[name]
+
+    def items(self) -> ItemsView[str, T]:
+        return self._instances.items()
+
+
+class DatabaseRoutingMiddleware:
+    """Select the database of HTTP and WebSocket requests; /db/<name> is stripped from the path"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        name = None
+        path = scope["path"]
+        if path.startswith(PATH_PREFIX):
+            name, _, rest = path[len(PATH_PREFIX):].partition("/")
+            scope = dict(scope, path="/" + rest, raw_path=("/" + rest).encode("utf-8"))
+        else:
+            for header, value in scope.get("headers", ()):
+                if header == HEADER:
+                    name = value.decode("latin-1")
+                    break
+        name = name or DB_DEFAULT_PROFILE
+        if name not in DB_PROFILES:
+            if scope["type"] == "websocket":
+                await send({"type": "websocket.close", "code": 1008})
+            else:
+                await JSONResponse({"detail": f"Unknown database '{name}'"}, status_code=404)(scope, receive, send)
+            return
+        token = current_database.set(name)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_database.reset(token)
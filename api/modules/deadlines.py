@@ -0,0 +1,178 @@
+"""
+Per-request time budgets
+The middleware gives each request a deadline from its route budget. Blocking
+DB calls made for the request are watched: when the deadline passes, a
+watchdog thread cancels the running statement, the caller gets the DB error,
+the connection is rolled back on release, and the client receives 504.
+When the statement could not be cancelled and the request failed, the 504
+says its outcome is unknown. Waits for a pool connection or an order lock
+are capped by what is left.
+"""
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+
+from modules.config import REQUEST_TIMEOUT, ROUTE_TIMEOUTS
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(Exception):
+    """Request budget ran out before a DB call started"""
+
+
+class RequestDeadline:
+    """Deadline of one request; `expired` is set when it passed during a DB call,
+    `cancelled` once work was actually cut short by it"""
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+        self.expired = False
+        self.cancelled = False
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+
+current_deadline: ContextVar[Optional[RequestDeadline]] = ContextVar("current_deadline", default=None)
+
+
+def route_budget(path: str) -> float:
+    """Budget of a path: longest matching ROUTE_TIMEOUTS prefix, else REQUEST_TIMEOUT"""
+    best = None
+    for prefix in ROUTE_TIMEOUTS:
+        if path.startswith(prefix) and (best is None or len(prefix) > len(best)):
+            best = prefix
+    return ROUTE_TIMEOUTS[best] if best is not None else REQUEST_TIMEOUT
+
+
+def cap_timeout(timeout: float) -> float:
+    """Wait timeout limited by what is left of the current request budget"""
+    deadline = current_deadline.get()
+    if deadline is None:
+        return timeout
+    return max(0.0, min(timeout, deadline.remaining()))
+
+
+class _Watch:
+    __slots__ = ("deadline", "cancel", "done")
+
+    def __init__(self, deadline: RequestDeadline, cancel: Callable[[], bool]):
+        self.deadline = deadline
+        self.cancel = cancel
+        self.done = False
+
+
+class Watchdog:
+    """One thread that cancels watched calls whose request deadline has passed"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._heap: List[Tuple[float, int, _Watch]] = []
+        self._sequence = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self.cancelled = 0
+        self.cancel_failed = 0
+
+    @contextmanager
+    def watch(self, cancel: Callable[[], bool]) -> Iterator[None]:
+        """Run the block under the current request deadline; `cancel` interrupts it from the watchdog
+        thread and returns whether the interruption was accepted"""
+        deadline = current_deadline.get()
+        if deadline is None:
+            yield
+            return
+        if deadline.remaining() <= 0:
+            deadline.expired = deadline.cancelled = True
+            raise DeadlineExceeded(f"Request time budget of {deadline.budget:g} s is exhausted")
+        entry = _Watch(deadline, cancel)
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="deadline-watchdog", daemon=True)
+                self._thread.start()
+            heapq.heappush(self._heap, (deadline.expires_at, next(self._sequence), entry))
+            if self._heap[0][2] is entry:
+                self._condition.notify()
+        try:
+            yield
+        finally:
+            # Taken under the lock, so a cancel never hits the next call on the connection
+            with self._condition:
+                entry.done = True
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while self._heap and self._heap[0][2].done:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                expires_at, _, entry = self._heap[0]
+                remaining = expires_at - time.monotonic()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+                heapq.heappop(self._heap)
+                entry.deadline.expired = True
+                try:
+                    cancelled = bool(entry.cancel())
+                except Exception:
+                    logger.exception("Failed to cancel DB operation after the request deadline")
+                    cancelled = False
+                if cancelled:
+                    entry.deadline.cancelled = True
+                    self.cancelled += 1
+                else:
+                    self.cancel_failed += 1
+
+
+watchdog = Watchdog()
+
+
+def _timeout_detail(deadline: RequestDeadline) -> str:
+    if deadline.cancelled:
+        return f"Request exceeded its time budget of {deadline.budget:g} s; the DB operation was cancelled"
+    return (f"Request exceeded its time budget of {deadline.budget:g} s; the DB operation could not be "
+            f"cancelled, its outcome is unknown")
+
+
+def deadline_error() -> Optional[HTTPException]:
+    """504 for a request that failed after its deadline passed, None when it did not pass"""
+    deadline = current_deadline.get()
+    if deadline is None or not deadline.expired:
+        return None
+    return HTTPException(status_code=504, detail=_timeout_detail(deadline))
+
+
+async def deadline_middleware(request: Request, call_next):
+    """Give the request its route budget; answer 504 when it failed after running out of it"""
+    budget = route_budget(request.url.path)
+    if budget <= 0:
+        return await call_next(request)
+    deadline = RequestDeadline(budget)
+    token = current_deadline.set(deadline)
+    try:
+        response = await call_next(request)
+    finally:
+        current_deadline.reset(token)
+    # A request that still succeeded (e.g. the statement finished before the cancel landed) keeps its answer;
+    # handlers that answer failures themselves raise deadline_error() for their 504
+    if not deadline.expired or response.status_code < 500 or response.status_code == 504:
+        return response
+    if deadline.cancelled:
+        logger.warning("%s %s cancelled after its %g s budget", request.method, request.url.path, budget)
+    else:
+        logger.warning("%s %s exceeded its %g s budget, the DB operation could not be cancelled",
+                       request.method, request.url.path, budget)
+    return JSONResponse(status_code=504, content={"detail": _timeout_detail(deadline)})
@@ -0,0 +1,79 @@
+"""
+Order change events pushed to connected clients over WebSocket
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from fastapi import WebSocket
+
+from modules.serialization import dumps
+from modules.databases import database_name
+
+logger = logging.getLogger(__name__)
+
+
+class EventBroadcaster:
+    """Fan-out of change events to the WebSocket connections of the event's database"""
+
+    def __init__(self):
+        self._clients: Dict[WebSocket, str] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Remember the server event loop so events can be published from worker threads"""
+        self._loop = loop
+
+    @property
+    def client_count(self) -> int:
+        return len(self._clients)
+
+    async def connect(self, websocket: WebSocket) -> None:
+        await websocket.accept()
+        self._clients[websocket] = database_name()
+        logger.info("Events client connected, %d open", len(self._clients))
+
+    def disconnect(self, websocket: WebSocket) -> None:
+        self._clients.pop(websocket, None)
+        logger.info("Events client disconnected, %d open", len(self._clients))
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        """Queue event for broadcast; safe to call from any thread"""
+        if self._loop is None or not self._clients:
+            return
+        message = dumps(event).decode("utf-8")
+        database = event["database"]
+        self._loop.call_soon_threadsafe(lambda: self._loop.create_task(self._broadcast(database, message)))
+
+    async def _broadcast(self, database: str, message: str) -> None:
+        for websocket, client_database in list(self._clients.items()):
+            if client_database != database:
+                continue
+            try:
+                await websocket.send_text(message)
+            except Exception:
+                self.disconnect(websocket)
+
+
+event_broadcaster = EventBroadcaster()
+
+
+def publish_order_change(order_id: int, scope: str, kind: str, old_values: List[str],
+                         new_value: Any, affected_rows: int, origin: Optional[str] = None) -> Dict[str, Any]:
+    """Broadcast a committed change of one order (new_value is a list for mapping changes); returns the event"""
+    event = {
+        "type": "order_changed",
+        "database": database_name(),
+        "order_id": order_id,
+        "scope": scope,
+        "kind": kind,
+        "old_values": old_values,
+        "new_value": new_value,
+        "affected_rows": affected_rows,
+        "origin": origin,
+        "ts": time.time(),
+    }
+    event_broadcaster.publish(event)
+    return event
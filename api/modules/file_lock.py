@@ -0,0 +1,39 @@
+"""
+Advisory file locks shared by the worker processes of one server
+"""
+
+import os
+from typing import IO, Optional
+
+
+def try_lock(path: str) -> Optional[IO]:
+    """Non-blocking exclusive lock; returns the open handle or None when another process holds it"""
+    handle = open(path, "a+")
+    try:
+        if os.name == "nt":
+            import msvcrt
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return None
+    return handle
+
+
+def release_lock(handle: IO) -> None:
+    """Release a lock taken by try_lock"""
+    try:
+        if os.name == "nt":
+            import msvcrt
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(handle, fcntl.LOCK_UN)
+    except OSError:
+        pass
+    finally:
+        handle.close()
@@ -0,0 +1,190 @@
+"""
+Idempotency keys for change requests
+The first request with an Idempotency-Key claims the key and runs; its
+successful result is stored for IDEMPOTENCY_TTL. A repeated request gets
+the stored result without touching the database, and a duplicate that
+arrives while the first one is still running waits for it. Claims live in
+SQLite, so duplicates are recognised across worker processes too.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from modules.config import IDEMPOTENCY_DB_PATH, IDEMPOTENCY_TTL, IDEMPOTENCY_MAX_KEYS, IDEMPOTENCY_WAIT_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+_POLL_INTERVAL = 0.05
+_PRUNE_EVERY = 100
+
+
+class IdempotencyError(Exception):
+    """Key reused for another request, or still running after the wait timeout"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def request_fingerprint(operation: str, payload: Any) -> str:
+    """Hash of operation and request body, to detect a key reused for another request"""
+    data = json.dumps([operation, payload], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    """Claimed keys and stored results, bounded by TTL and key count"""
+
+    def __init__(self, path: str, ttl: int, max_keys: int, wait_timeout: float):
+        self.path = path
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self.wait_timeout = wait_timeout
+        self._con: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._inserts = 0
+        # Keys running in this process; duplicates wake up as soon as they finish
+        self._local: Dict[str, threading.Event] = {}
+        self._replays = 0
+        self._waits = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._con is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            con = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS idempotency_keys (
+                    key TEXT PRIMARY KEY,
+                    fingerprint TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    status_code INTEGER,
+                    body TEXT,
+                    created_at REAL NOT NULL
+                )
+            """)
+            con.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_created ON idempotency_keys (created_at)")
+            self._con = con
+        return self._con
+
+    def _claim(self, key: str, fingerprint: str) -> Optional[Tuple[str, str, Optional[int], Optional[str], float]]:
+        """Claim key for this request; returns None when claimed, else the existing row"""
+        now = time.time()
+        with self._lock:
+            con = self._connection()
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                row = con.execute(
+                    "SELECT fingerprint, status, status_code, body, created_at FROM idempotency_keys WHERE key = ?",
+                    (key,)
+                ).fetchone()
+                # Expired results and abandoned claims (process died mid-request) can be taken over;
+                # a claim still running in this process is never abandoned
+                if row is None or row[4] < now - self.ttl or (
+                    row[1] == "running" and row[4] < now - self.wait_timeout and key not in self._local
+                ):
+                    con.execute(
+                        "INSERT OR REPLACE INTO idempotency_keys (key, fingerprint, status, created_at) "
+                        "VALUES (?, ?, 'running', ?)",
+                        (key, fingerprint, now)
+                    )
+                    row = None
+                con.execute("COMMIT")
+            except Exception:
+                con.execute("ROLLBACK")
+                raise
+            if row is None:
+                self._local[key] = threading.Event()
+            return row
+
+    def _finish(self, key: str, result: Optional[Tuple[int, Dict[str, Any]]]) -> None:
+        with self._lock:
+            con = self._connection()
+            if result is None:
+                # Failed requests release the key so a retry runs again
+                con.execute("DELETE FROM idempotency_keys WHERE key = ? AND status = 'running'", (key,))
+            else:
+                status_code, body = result
+                con.execute(
+                    "UPDATE idempotency_keys SET status = 'done', status_code = ?, body = ? WHERE key = ?",
+                    (status_code, json.dumps(body, ensure_ascii=False, default=str), key)
+                )
+                self._inserts += 1
+                if self._inserts % _PRUNE_EVERY == 0:
+                    self._prune(con)
+            event = self._local.pop(key, None)
+        if event is not None:
+            event.set()
+
+    def _prune(self, con: sqlite3.Connection) -> None:
+        con.execute("DELETE FROM idempotency_keys WHERE created_at < ?", (time.time() - self.ttl,))
+        con.execute("""
+            DELETE FROM idempotency_keys WHERE status = 'done' AND key NOT IN (
+                SELECT key FROM idempotency_keys ORDER BY created_at DESC LIMIT ?
+            )
+        """, (self.max_keys,))
+
+    def run(self, key: str, fingerprint: str,
+            call: Callable[[], Tuple[int, Dict[str, Any], bool]]) -> Tuple[int, Dict[str, Any], bool]:
+        """
+        Run call once per key; returns (status code, body, replayed)
+        call returns (status code, body, store) - only results with store=True are kept.
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+        while True:
+            row = self._claim(key, fingerprint)
+            if row is None:
+                break
+            stored_fingerprint, status, status_code, body, _ = row
+            if stored_fingerprint != fingerprint:
+                raise IdempotencyError(422, "Idempotency-Key was already used for a different request")
+            if status == "done":
+                with self._lock:
+                    self._replays += 1
+                logger.info("Повтор запроса с Idempotency-Key %s: возвращён сохранённый результат", key)
+                return status_code, json.loads(body), True
+            # Same request still running: wait for it, then look again
+            if not waited:
+                waited = True
+                with self._lock:
+                    self._waits += 1
+                logger.info("Запрос с Idempotency-Key %s уже выполняется, ожидание", key)
+            if time.monotonic() >= deadline:
+                raise IdempotencyError(409, "Request with this Idempotency-Key is still in progress")
+            event = self._local.get(key)
+            if event is not None:
+                event.wait(min(1.0, max(0.0, deadline - time.monotonic())))
+            else:
+                time.sleep(_POLL_INTERVAL)
+
+        result = None
+        try:
+            status_code, body, store = call()
+            if store:
+                result = (status_code, body)
+            return status_code, body, False
+        finally:
+            self._finish(key, result)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"in_flight": len(self._local), "replays": self._replays, "waits": self._waits}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._con is not None:
+                self._con.close()
+                self._con = None
+
+
+idempotency_store = IdempotencyStore(IDEMPOTENCY_DB_PATH, IDEMPOTENCY_TTL, IDEMPOTENCY_MAX_KEYS, IDEMPOTENCY_WAIT_TIMEOUT)
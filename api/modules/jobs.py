@@ -0,0 +1,270 @@
+"""
+Background job queue for long-running group changes
+Jobs are kept in a local SQLite store and run by a fixed pool of worker
+threads. Interactive (single-order) jobs overtake bulk jobs. Jobs that were
+queued or running when the server stopped are resumed on the next start
+(by one worker process when the server runs several).
+"""
+
+import itertools
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from pydantic import ValidationError
+
+from modules.changes import CHANGE_OPERATIONS, execute_change
+from modules.config import JOBS_DB_PATH, JOB_WORKERS, JOB_QUEUE_LIMIT
+from modules.logging_config import request_id_var
+from modules.file_lock import try_lock, release_lock
+from modules.databases import database_name, using_database
+
+logger = logging.getLogger(__name__)
+
+# Lower value is served first
+PRIORITY_LANES = {"interactive": 0, "bulk": 1}
+
+_JSON_COLUMNS = ("payload", "order_ids", "result")
+
+
+class JobError(Exception):
+    """Invalid job submission or full queue"""
+
+
+class JobStore:
+    """SQLite persistence of job state"""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._con = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._con.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._con.execute("PRAGMA journal_mode=WAL")
+            self._con.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    operation TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    order_ids TEXT NOT NULL,
+                    priority TEXT NOT NULL,
+                    origin TEXT,
+                    user TEXT,
+                    database TEXT,
+                    status TEXT NOT NULL,
+                    orders_total INTEGER NOT NULL,
+                    orders_done INTEGER NOT NULL DEFAULT 0,
+                    rows_done INTEGER NOT NULL DEFAULT 0,
+                    progress REAL NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            """)
+            # Stores created before these columns were added
+            columns = {row[1] for row in self._con.execute("PRAGMA table_info(jobs)")}
+            for column in ("user", "database"):
+                if column not in columns:
+                    self._con.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+
+    @staticmethod
+    def _decode(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        for column in _JSON_COLUMNS:
+            if job[column] is not None:
+                job[column] = json.loads(job[column])
+        return job
+
+    def insert(self, job: Dict[str, Any]) -> None:
+        values = {k: json.dumps(v) if k in _JSON_COLUMNS and v is not None else v for k, v in job.items()}
+        columns = ", ".join(values)
+        placeholders = ", ".join("?" for _ in values)
+        with self._lock:
+            self._con.execute(f"INSERT INTO jobs ({columns}) VALUES ({placeholders})", tuple(values.values()))
+
+    def update(self, job_id: str, **fields) -> None:
+        values = {k: json.dumps(v) if k in _JSON_COLUMNS and v is not None else v for k, v in fields.items()}
+        assignments = ", ".join(f"{column} = ?" for column in values)
+        with self._lock:
+            self._con.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*values.values(), job_id))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._con.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return self._decode(row) if row else None
+
+    def recent(self, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._con.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._decode(row) for row in rows]
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._con.execute(
+                "SELECT * FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return [self._decode(row) for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._con.close()
+
+
+class JobManager:
+    """Priority queue of jobs served by a bounded pool of worker threads"""
+
+    def __init__(self, store_path: str, workers: int, queue_limit: int):
+        self.store_path = store_path
+        self.workers = max(1, workers)
+        self.queue_limit = queue_limit
+        self._store: Optional[JobStore] = None
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._threads: List[threading.Thread] = []
+        self._resume_lock = None
+
+    def start(self) -> None:
+        """Open store, re-queue unfinished jobs and start workers"""
+        if self._threads:
+            return
+        self._store = JobStore(self.store_path)
+        # Of several worker processes only the one holding the lock resumes jobs
+        self._resume_lock = try_lock(self.store_path + ".lock")
+        # Re-applying a change is safe: rows already changed no longer match the
+        # old values, and orders recorded as done are skipped
+        for job in self._store.unfinished() if self._resume_lock is not None else ():
+            self._store.update(job["job_id"], status="queued")
+            self._enqueue(job)
+            logger.info("Job %s re-queued after restart", job["job_id"])
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 30.0) -> None:
+        """Let workers finish their current job and stop them"""
+        for _ in self._threads:
+            self._queue.put((float("inf"), next(self._sequence), None))
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self._threads.clear()
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+        if self._resume_lock is not None:
+            release_lock(self._resume_lock)
+            self._resume_lock = None
+
+    def _enqueue(self, job: Dict[str, Any]) -> None:
+        self._queue.put((PRIORITY_LANES[job["priority"]], next(self._sequence), job["job_id"]))
+
+    def submit(self, operation: str, request_data: Dict[str, Any], order_ids: Optional[List[int]] = None,
+               priority: Optional[str] = None, origin: Optional[str] = None,
+               user: Optional[str] = None) -> Dict[str, Any]:
+        """Validate and queue a change; returns the stored job"""
+        if self._store is None:
+            raise JobError("Job queue is not running")
+        if operation not in CHANGE_OPERATIONS:
+            raise JobError(f"Unknown operation '{operation}'")
+        try:
+            request = CHANGE_OPERATIONS[operation].request_model(**request_data)
+        except ValidationError as e:
+            raise JobError(f"Invalid request for '{operation}': {e}")
+        order_ids = list(dict.fromkeys(order_ids or [request.order_id]))
+        if priority is None:
+            priority = "interactive" if len(order_ids) == 1 else "bulk"
+        if priority not in PRIORITY_LANES:
+            raise JobError(f"Unknown priority '{priority}'")
+        if self._queue.qsize() >= self.queue_limit:
+            raise JobError("Job queue is full")
+
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "operation": operation,
+            "payload": request_data,
+            "order_ids": order_ids,
+            "priority": priority,
+            "origin": origin,
+            "user": user,
+            "database": database_name(),
+            "status": "queued",
+            "orders_total": len(order_ids),
+            "created_at": time.time(),
+        }
+        self._store.insert(job)
+        self._enqueue(job)
+        logger.info("Job %s queued: %s for %d orders (%s)", job["job_id"], operation, len(order_ids), priority)
+        return self._store.get(job["job_id"])
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self._store.get(job_id) if self._store else None
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        return self._store.recent(limit) if self._store else []
+
+    def _worker(self) -> None:
+        while True:
+            _, _, job_id = self._queue.get()
+            if job_id is None:
+                break
+            # Job ID stands in for the request ID in logs and DB context
+            token = request_id_var.set(f"job-{job_id[:12]}")
+            try:
+                job = self._store.get(job_id)
+                if job is not None and job["status"] in ("queued", "running"):
+                    # Jobs run against the database they were submitted for
+                    with using_database(job["database"]):
+                        self._run(job)
+            except Exception:
+                logger.exception("Job %s crashed", job_id)
+                self._store.update(job_id, status="failed", error="Internal job error", finished_at=time.time())
+            finally:
+                request_id_var.reset(token)
+
+    def _run(self, job: Dict[str, Any]) -> None:
+        job_id = job["job_id"]
+        operation = CHANGE_OPERATIONS[job["operation"]]
+        result = job["result"] or {"orders": {}, "errors": {}}
+        orders_done = job["orders_done"]
+        rows_done = job["rows_done"]
+        self._store.update(job_id, status="running", started_at=job["started_at"] or time.time())
+
+        for order_id in job["order_ids"][orders_done:]:
+            request = operation.request_model(**{**job["payload"], "order_id": order_id})
+            try:
+                affected_rows = execute_change(
+                    job["operation"], request, origin=job["origin"], user=job["user"]
+                )["affected_rows"]
+                result["orders"][str(order_id)] = affected_rows
+                rows_done += affected_rows
+            except Exception as e:
+                logger.exception("Job %s: %s failed for order %s", job_id, job["operation"], order_id)
+                result["errors"][str(order_id)] = str(e)
+            orders_done += 1
+            self._store.update(
+                job_id, orders_done=orders_done, rows_done=rows_done,
+                progress=orders_done / job["orders_total"], result=result
+            )
+
+        if not result["errors"]:
+            status = "completed"
+        elif result["orders"]:
+            status = "completed_with_errors"
+        else:
+            status = "failed"
+        self._store.update(job_id, status=status, finished_at=time.time())
+        logger.info("Job %s %s: %d orders, %d rows", job_id, status, orders_done, rows_done)
+
+
+job_manager = JobManager(JOBS_DB_PATH, JOB_WORKERS, JOB_QUEUE_LIMIT)
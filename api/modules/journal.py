@@ -0,0 +1,201 @@
+"""
+Append-only JSONL journal
+Records are put on an in-memory queue by the request path and appended by a
+background writer to segment files `<prefix>-<time>-<pid>.jsonl`. Lines are
+written in batches with one fsync per batch; each worker process writes its
+own segments, which are never rewritten. Used by the audit journal and the
+request recorder.
+"""
+
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_SEGMENT_TIME_FORMAT = "%Y%m%dT%H%M%S"
+_STOP = object()
+
+
+class SegmentJournal:
+    """Queue plus background writer of append-only, rotated JSONL segments"""
+
+    def __init__(self, directory: str, prefix: str, segment_bytes: int, max_segments: int,
+                 flush_interval: float, queue_limit: int):
+        self.directory = directory
+        self.prefix = prefix
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, queue_limit))
+        self._thread: Optional[threading.Thread] = None
+        self._file = None
+        self._lock = threading.Lock()
+        # Metrics
+        self._written = 0
+        self._dropped = 0
+        self._batches = 0
+        self._sync_ms_max = 0.0
+        self._errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        if not self.enabled or self._thread is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name=f"{self.prefix}-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Write what is queued and stop the writer"""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.error("Journal '%s' queue is full on shutdown", self.prefix)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def record(self, entry: Dict[str, Any]) -> bool:
+        """Queue one record; never waits for disk. False when it was dropped"""
+        if self._thread is None:
+            return False
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+            return False
+        return True
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            # Collect what arrives within the flush interval into one write and fsync
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not _STOP:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is _STOP:
+                stopping = True
+                batch.pop()
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception:
+                    with self._lock:
+                        self._errors += 1
+                    logger.exception("Failed to write %d records of journal '%s'", len(batch), self.prefix)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        data = "".join(
+            json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=str) + "\n" for entry in batch
+        ).encode("utf-8")
+        segment = self._segment()
+        started = time.perf_counter()
+        segment.write(data)
+        segment.flush()
+        os.fsync(segment.fileno())
+        sync_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._written += len(batch)
+            self._batches += 1
+            self._sync_ms_max = max(self._sync_ms_max, sync_ms)
+
+    def _segment(self):
+        """Current segment of this process; a new one is started when it is full"""
+        if self._file is not None and self._file.tell() < self.segment_bytes:
+            return self._file
+        if self._file is not None:
+            self._file.close()
+        name = f"{self.prefix}-{datetime.now().strftime(_SEGMENT_TIME_FORMAT)}-{os.getpid()}.jsonl"
+        self._file = open(os.path.join(self.directory, name), "ab")
+        self._prune()
+        return self._file
+
+    def segments(self) -> List[str]:
+        """Segment files, oldest first"""
+        return sorted(glob.glob(os.path.join(self.directory, f"{self.prefix}-*.jsonl")))
+
+    def _prune(self) -> None:
+        if self.max_segments <= 0:
+            return
+        for path in self.segments()[:-self.max_segments]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def candidates(self, since: Optional[float] = None, until: Optional[float] = None) -> List[Tuple[str, int, float]]:
+        """(path, size, mtime) of segments that may hold times within [since, until], most recently
+        written first: no record of a segment is newer than its mtime"""
+        found = []
+        for path in self.segments():
+            # Segment name has the time of its first record, mtime the time of its last one
+            try:
+                stat = os.stat(path)
+                if since is not None and stat.st_mtime < since:
+                    continue
+                stamp = os.path.basename(path)[len(self.prefix) + 1:].split("-")[0]
+                opened = datetime.strptime(stamp, _SEGMENT_TIME_FORMAT).timestamp()
+            except (OSError, ValueError):
+                continue
+            if until is not None and opened > until + 1:
+                continue
+            found.append((path, stat.st_size, stat.st_mtime))
+        found.sort(key=lambda segment: segment[2], reverse=True)
+        return found
+
+    @staticmethod
+    def read_segment(path: str) -> List[Dict[str, Any]]:
+        """Records of one segment in write order (empty when it is gone)"""
+        try:
+            with open(path, "rb") as segment:
+                lines = segment.readlines()
+        except OSError:
+            return []
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue  # Line still being written by another process
+        return entries
+
+    def read(self, since: Optional[float] = None, until: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """Records of segments that may hold times within [since, until] (records are not filtered)"""
+        for path, _, _ in self.candidates(since, until):
+            yield from self.read_segment(path)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self._thread is not None,
+                "queued": self._queue.qsize(),
+                "written": self._written,
+                "dropped": self._dropped,
+                "batches": self._batches,
+                "errors": self._errors,
+                "fsync_ms_max": round(self._sync_ms_max, 2),
+            }
@@ -2,8 +2,8 @@
 Data models for Group Change Params API
 """
 
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Optional, Dict, Any, Tuple
 
 
 class BreedChangeRequest(BaseModel):
@@ -21,6 +21,52 @@ class ColorChangeRequest(BaseModel):
     old_colors: List[str]
 
 
+def _unique_olds(mappings: list, field: str) -> list:
+    """Each old value may be mapped only once"""
+    seen = set()
+    for mapping in mappings:
+        value = getattr(mapping, field)
+        if value in seen:
+            raise ValueError(f"{field} '{value}' is mapped more than once")
+        seen.add(value)
+    return mappings
+
+
+class BreedMapping(BaseModel):
+    """One old breed -> new breed pair of a mapping change"""
+    old_breed: str
+    new_breed: str
+
+
+class BreedMappingRequest(BaseModel):
+    """Request model for remapping several breeds in one pass"""
+    order_id: int
+    mappings: List[BreedMapping] = Field(..., min_length=1)
+
+    @field_validator("mappings")
+    @classmethod
+    def unique_old_breeds(cls, mappings: List[BreedMapping]) -> List[BreedMapping]:
+        return _unique_olds(mappings, "old_breed")
+
+
+class ColorMapping(BaseModel):
+    """One old color -> new color pair of a mapping change"""
+    old_color: str
+    new_color: str
+    new_colorgroup: str
+
+
+class ColorMappingRequest(BaseModel):
+    """Request model for remapping several colors in one pass"""
+    order_id: int
+    mappings: List[ColorMapping] = Field(..., min_length=1)
+
+    @field_validator("mappings")
+    @classmethod
+    def unique_old_colors(cls, mappings: List[ColorMapping]) -> List[ColorMapping]:
+        return _unique_olds(mappings, "old_color")
+
+
 class BreedOption(BaseModel):
     """Available breed option"""
     id: int
@@ -40,10 +86,88 @@ class Color(BaseModel):
     group_title: str
 
 
+class ColorSearchResult(BaseModel):
+    """Color found by search, ranked by score"""
+    color_id: int
+    title: str
+    group_title: str
+    score: float
+
+
+class ColorCatalogGroup(BaseModel):
+    """Color group with its colors as [color_id, title] pairs"""
+    title: str
+    colors: List[Tuple[int, str]]
+
+
+class ColorCatalog(BaseModel):
+    """All color groups with their colors"""
+    groups: List[ColorCatalogGroup]
+
+
 class OrderColor(BaseModel):
     """Color currently used in order"""
     title: str
-    count: int
+    count: int  # setparam rows with this color
+    item_count: int  # distinct order items with this color
+
+
+class OrderBreed(BaseModel):
+    """Breed currently used in order"""
+    code: str
+    count: int  # setparam rows with this breed
+    item_count: int  # distinct order items with this breed
+
+
+class OrderFingerprint(BaseModel):
+    """Hash of the breed and color rows of an order, changes whenever they do"""
+    order_id: int
+    fingerprint: str
+    rows: int
+    changed_at: Optional[float] = None  # last change made through this API, if known
+
+
+class JobSubmitRequest(BaseModel):
+    """Request model for submitting a change as background job"""
+    operation: str  # change endpoint name, e.g. "change-breed"
+    request: Dict[str, Any]  # body of that change endpoint
+    order_ids: Optional[List[int]] = None  # apply the same change to several orders
+    priority: Optional[str] = None  # "interactive" or "bulk", derived from order count if omitted
+
+
+class JobStatus(BaseModel):
+    """Background job state"""
+    job_id: str
+    operation: str
+    status: str  # queued, running, completed, completed_with_errors, failed
+    priority: str
+    database: Optional[str] = None
+    orders_total: int
+    orders_done: int
+    rows_done: int
+    progress: float
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+
+class AuditRecord(BaseModel):
+    """One change in the audit journal"""
+    time: float
+    request_id: str
+    database: Optional[str] = None
+    operation: str
+    order_id: int
+    params: Dict[str, Any]
+    affected_rows: Optional[int] = None  # rows changed
+    matched_rows: Optional[int] = None  # rows selected, including those that already had the target value
+    duration_ms: float
+    client_id: Optional[str] = None
+    user: Optional[str] = None
+    outcome: str  # ok, rejected, conflict, timeout, unknown, error
+    error: Optional[str] = None
 
 
 class APIResponse(BaseModel):
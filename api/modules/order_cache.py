@@ -0,0 +1,120 @@
+"""
+Order read cache for Group Change Params API
+Keeps encoded order reads (info, colors, breeds) per order in a bounded
+LRU. Changes made through the API invalidate the order right away; the
+TTL covers edits made in Altawin itself.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from modules.config import ORDER_CACHE_SIZE, ORDER_CACHE_TTL
+from modules.databases import PerDatabase
+
+logger = logging.getLogger(__name__)
+
+
+class _OrderEntry:
+    """Cached reads of one order"""
+
+    def __init__(self):
+        self.resources: Dict[str, Tuple[bytes, float]] = {}
+        self.version = 0  # Incremented on invalidation; loads started earlier are not stored
+        self.fingerprint: Optional[str] = None  # Last fingerprint seen for the order
+
+
+class OrderCache:
+    """LRU of per-order read results with TTL and invalidation"""
+
+    def __init__(self, max_orders: int, ttl: float):
+        self.max_orders = max_orders
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, _OrderEntry]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def _entry(self, order_id: Hashable) -> _OrderEntry:
+        entry = self._entries.get(order_id)
+        if entry is None:
+            entry = self._entries[order_id] = _OrderEntry()
+            while len(self._entries) > self.max_orders:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+        else:
+            self._entries.move_to_end(order_id)
+        return entry
+
+    def get(self, order_id: Hashable, resource: str, loader: Callable[[], bytes]) -> bytes:
+        """Cached body of an order read, loading it when missing or expired"""
+        with self._lock:
+            entry = self._entry(order_id)
+            cached = entry.resources.get(resource)
+            if cached is not None:
+                if time.monotonic() - cached[1] < self.ttl:
+                    self._hits += 1
+                    return cached[0]
+                self._expired += 1
+                del entry.resources[resource]
+            self._misses += 1
+            version = entry.version
+
+        body = loader()
+        with self._lock:
+            if self._entries.get(order_id) is entry and entry.version == version:
+                entry.resources[resource] = (body, time.monotonic())
+        return body
+
+    def invalidate(self, order_id: Hashable) -> None:
+        """Drop all cached reads of an order"""
+        with self._lock:
+            entry = self._entries.get(order_id)
+            if entry is not None:
+                entry.resources.clear()
+                entry.version += 1
+                self._invalidations += 1
+        logger.debug("Order %s dropped from read cache", order_id)
+
+    def check_fingerprint(self, order_id: Hashable, fingerprint: str) -> None:
+        """Drop cached reads when the order fingerprint differs from the last one seen (edited in Altawin)"""
+        with self._lock:
+            entry = self._entries.get(order_id)
+            if entry is None:
+                return
+            if entry.fingerprint is not None and entry.fingerprint != fingerprint and entry.resources:
+                entry.resources.clear()
+                entry.version += 1
+                self._invalidations += 1
+                logger.info("Заказ %s изменён вне API, кэш чтения сброшен", order_id)
+            entry.fingerprint = fingerprint
+
+    def clear(self) -> None:
+        with self._lock:
+            for entry in self._entries.values():
+                entry.resources.clear()
+                entry.version += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "orders": len(self._entries),
+                "max_orders": self.max_orders,
+                "ttl": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "expired": self._expired,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+                "hit_ratio": round(self._hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+# Order IDs are per database, and one busy site must not evict the orders of another
+order_cache: PerDatabase[OrderCache] = PerDatabase(lambda name: OrderCache(ORDER_CACHE_SIZE, ORDER_CACHE_TTL))
@@ -0,0 +1,152 @@
+"""
+Per-order write serialization
+Changes of the same order wait in FIFO order for each other; changes of
+different orders run in parallel. With several worker processes the holder
+also takes the lock file of its order, so workers do not change one order at
+once. Orders share a fixed number of lock files (by order ID); two workers
+changing different orders of one file wait for each other.
+"""
+
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Hashable, Iterator, Optional
+
+from modules.config import ORDER_LOCK_TIMEOUT, ORDER_LOCK_DIR, ORDER_LOCK_FILES
+from modules.file_lock import try_lock, release_lock
+from modules.deadlines import cap_timeout
+from modules.databases import PerDatabase
+
+logger = logging.getLogger(__name__)
+
+
+class OrderLockTimeout(Exception):
+    """Waited too long for earlier changes of the same order"""
+
+    def __init__(self, order_id: Hashable, waited: float):
+        super().__init__(f"Order {order_id} is being changed by another request (waited {waited:.1f} s)")
+        self.order_id = order_id
+        self.waited = waited
+
+
+class _OrderQueue:
+    """FIFO of tickets for one order; the ticket at the head holds the lock"""
+
+    def __init__(self, guard: threading.Lock):
+        self.tickets = deque()
+        self.condition = threading.Condition(guard)
+
+
+class OrderLockManager:
+    """Order-keyed FIFO locks with wait timeout and queue metrics"""
+
+    def __init__(self, timeout: float, directory: str = "", files: int = ORDER_LOCK_FILES):
+        self.timeout = timeout
+        self.directory = directory
+        self.files = max(1, files)
+        self._directory_ready = False
+        self._guard = threading.Lock()
+        self._queues: Dict[Hashable, _OrderQueue] = {}
+        # Metrics
+        self._acquired = 0
+        self._timeouts = 0
+        self._contended = 0
+        self._max_depth = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @contextmanager
+    def hold(self, order_id: Hashable, timeout: Optional[float] = None) -> Iterator[None]:
+        """Hold the write lock of an order; raises OrderLockTimeout"""
+        timeout = cap_timeout(self.timeout if timeout is None else timeout)
+        ticket = object()
+        started = time.monotonic()
+
+        with self._guard:
+            order_queue = self._queues.get(order_id)
+            if order_queue is None:
+                order_queue = self._queues[order_id] = _OrderQueue(self._guard)
+            order_queue.tickets.append(ticket)
+            depth = len(order_queue.tickets) - 1
+            if depth:
+                self._contended += 1
+                self._max_depth = max(self._max_depth, depth)
+                logger.info("Change of order %s queued behind %d other change(s)", order_id, depth)
+
+            deadline = started + timeout
+            while order_queue.tickets[0] is not ticket:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    order_queue.tickets.remove(ticket)
+                    self._timeouts += 1
+                    raise OrderLockTimeout(order_id, time.monotonic() - started)
+                order_queue.condition.wait(remaining)
+
+        handle = None
+        try:
+            if self.directory:
+                handle = self._lock_file(order_id, deadline)
+                if handle is None:
+                    with self._guard:
+                        self._timeouts += 1
+                    raise OrderLockTimeout(order_id, time.monotonic() - started)
+
+            waited = time.monotonic() - started
+            with self._guard:
+                self._acquired += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            yield
+        finally:
+            if handle is not None:
+                release_lock(handle)
+            with self._guard:
+                order_queue.tickets.popleft()
+                if order_queue.tickets:
+                    order_queue.condition.notify_all()
+                else:
+                    del self._queues[order_id]
+
+    def _lock_file(self, order_id: Hashable, deadline: float):
+        """Lock file of an order shared with other worker processes; None after the deadline"""
+        if not self._directory_ready:
+            os.makedirs(self.directory, exist_ok=True)
+            self._directory_ready = True
+        path = os.path.join(self.directory, f"orders-{self.lock_file_number(order_id):03d}.lock")
+        delay = 0.01
+        while True:
+            handle = try_lock(path)
+            if handle is not None:
+                return handle
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 2, 0.2)
+
+    def lock_file_number(self, order_id: Hashable) -> int:
+        """Lock file of an order; the same in every process (unlike hash() of strings)"""
+        return zlib.crc32(str(order_id).encode("utf-8")) % self.files
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._guard:
+            waiting = sum(len(q.tickets) - 1 for q in self._queues.values())
+            return {
+                "locked_orders": len(self._queues),
+                "waiting": waiting,
+                "acquired": self._acquired,
+                "contended": self._contended,
+                "timeouts": self._timeouts,
+                "max_queue_depth": self._max_depth,
+                "wait_ms_avg": round(self._wait_total / self._acquired * 1000, 2) if self._acquired else 0.0,
+                "wait_ms_max": round(self._wait_max * 1000, 2),
+            }
+
+
+order_locks: PerDatabase[OrderLockManager] = PerDatabase(
+    lambda name: OrderLockManager(ORDER_LOCK_TIMEOUT, os.path.join(ORDER_LOCK_DIR, name) if ORDER_LOCK_DIR else "")
+)
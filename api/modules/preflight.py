@@ -0,0 +1,182 @@
+"""
+Pre-flight validation of change targets
+Once a change holds the order lock and before its UPDATE runs, its target
+is resolved against an in-memory catalog (colors and breed enum items, from the
+shared snapshot or the DB, refreshed after CATALOG_TTL). Unknown or ambiguous
+targets are rejected, and so are breed changes that would reach rows of a
+TYPEID without the target breed (the SET subquery would write NULL there).
+Rejected changes are answered 422 with the list of problems.
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from modules.config import CATALOG_TTL
+from modules.catalog_snapshot import SharedCatalog, shared_catalog
+from modules.databases import PerDatabase
+from db.db_functions import get_color_catalog_rows, get_breed_enum_items_rows, get_order_breed_types_rows
+
+logger = logging.getLogger(__name__)
+
+# Candidates listed for an ambiguous target
+_MAX_CANDIDATES = 10
+
+
+class PreflightError(Exception):
+    """Change rejected before it reached the database"""
+
+    def __init__(self, problems: List[Dict[str, Any]]):
+        super().__init__("; ".join(problem["message"] for problem in problems))
+        self.problems = problems
+
+
+def breed_key(code: str) -> str:
+    """Normalized breed code; the UPDATEs get this value and compare LOWER(TRIM(CODE)) = it"""
+    return code.strip().lower()
+
+
+class TargetCatalog:
+    """Colors by (title, group) and breed enum items by TYPEID, rebuilt after TTL or a new snapshot"""
+
+    def __init__(self, ttl: int, catalog: SharedCatalog):
+        self.ttl = ttl
+        self._catalog = catalog
+        self._lock = threading.Lock()
+        self._colors: List[Tuple[str, int, str]] = []  # (group title, COLORID, title)
+        self._breeds: Dict[int, Dict[str, List[int]]] = {}  # TYPEID -> breed key -> enum item IDs
+        self._built_at: Optional[float] = None
+        self._generation: Optional[int] = None
+
+    def _fresh(self) -> bool:
+        return (
+            self._built_at is not None
+            and time.monotonic() - self._built_at < self.ttl
+            and self._catalog.generation() == self._generation
+        )
+
+    def _load(self) -> None:
+        if self._fresh():
+            return
+        with self._lock:
+            if self._fresh():
+                return
+            generation = self._catalog.generation()
+            snapshot = self._catalog.current()
+            if snapshot is not None:
+                colors = snapshot.color_catalog_rows()
+                enum_items = list(snapshot.enum_items())
+            else:
+                colors = get_color_catalog_rows()
+                enum_items = get_breed_enum_items_rows()
+            breeds: Dict[int, Dict[str, List[int]]] = defaultdict(lambda: defaultdict(list))
+            for item_id, type_id, code in enum_items:
+                breeds[type_id][breed_key(code)].append(item_id)
+            self._colors = list(colors)
+            self._breeds = breeds
+            self._built_at = time.monotonic()
+            self._generation = generation
+            logger.debug("Каталог проверки изменений: %d цветов, %d типов пород", len(colors), len(breeds))
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._built_at = None
+
+    def color_problem(self, title: str, group: str) -> Tuple[Optional[int], Optional[Dict[str, Any]]]:
+        """(COLORID, None) for a single match; exact title and group first, then substrings of both"""
+        self._load()
+        exact = [row for row in self._colors if row[2] == title and row[0] == group]
+        candidates = exact or [row for row in self._colors if title in row[2] and group in row[0]]
+        if len(candidates) == 1:
+            return candidates[0][1], None
+        target = {"new_color": title, "new_colorgroup": group}
+        if not candidates:
+            return None, {**target, "reason": "unknown_color", "message": f"Color '{title}' ({group}) not found"}
+        return None, {
+            **target,
+            "reason": "ambiguous_color",
+            "message": f"Color '{title}' ({group}) matches {len(candidates)} colors",
+            "candidates": [
+                {"color_id": color_id, "title": color, "group_title": group_title}
+                for group_title, color_id, color in candidates[:_MAX_CANDIDATES]
+            ],
+        }
+
+    def breed_types(self, code: str) -> Dict[int, List[int]]:
+        """TYPEID -> enum item IDs of a breed code"""
+        self._load()
+        key = breed_key(code)
+        return {type_id: items[key] for type_id, items in self._breeds.items() if items.get(key)}
+
+
+target_catalog: PerDatabase[TargetCatalog] = PerDatabase(
+    lambda name: TargetCatalog(CATALOG_TTL, shared_catalog.get(name))
+)
+
+
+def check_color_targets(targets: Sequence[Tuple[str, str]]) -> List[int]:
+    """COLORIDs of (new_color, new_colorgroup) targets; rejects unknown or ambiguous ones"""
+    catalog = target_catalog.instance()
+    resolved = [catalog.color_problem(*target) for target in targets]
+    problems = [problem for _, problem in resolved if problem]
+    if problems:
+        raise PreflightError(problems)
+    return [color_id for color_id, _ in resolved]
+
+
+def check_breed_targets(order_id: int, scope: str, targets: Sequence[Tuple[Optional[Sequence[str]], str]]) -> None:
+    """
+    Reject breed changes that cannot be applied to every row they select
+    targets are (old breed codes or None for all, new breed code). Reports
+    unknown targets, targets with several enum items in a TYPEID and the
+    TYPEIDs of the order that have no item with the target code.
+    """
+    catalog = target_catalog.instance()
+    problems = []
+    resolved = []
+    for old_codes, new_code in targets:
+        types = catalog.breed_types(new_code)
+        if not types:
+            problems.append({
+                "breed_code": new_code, "reason": "unknown_breed", "message": f"Breed '{new_code}' not found"
+            })
+        else:
+            resolved.append((old_codes, new_code, types))
+    if not resolved:
+        if problems:
+            raise PreflightError(problems)
+        return
+
+    order_rows = get_order_breed_types_rows(order_id, scope)
+    for old_codes, new_code, types in resolved:
+        # Rows the UPDATE would select, grouped by TYPEID
+        selected: Dict[int, Dict[str, int]] = defaultdict(dict)
+        for type_id, code, rows in order_rows:
+            if old_codes is None or code in old_codes:
+                selected[type_id][code] = rows
+        for type_id, codes in sorted(selected.items()):
+            items = types.get(type_id, [])
+            if len(items) == 1:
+                continue
+            problem = {
+                "breed_code": new_code,
+                "type_id": type_id,
+                "current_codes": sorted(codes),
+                "rows": sum(codes.values()),
+            }
+            if not items:
+                problem.update(
+                    reason="no_breed_for_type",
+                    message=f"Breed '{new_code}' does not exist for TYPEID {type_id} "
+                            f"({', '.join(sorted(codes))}, {problem['rows']} rows)"
+                )
+            else:
+                problem.update(
+                    reason="ambiguous_breed",
+                    message=f"Breed '{new_code}' has {len(items)} enum items in TYPEID {type_id}"
+                )
+            problems.append(problem)
+    if problems:
+        raise PreflightError(problems)
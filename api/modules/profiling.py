@@ -0,0 +1,270 @@
+"""
+On-demand request profiling
+A request sent with "X-Profile: 1" runs under cProfile from the profiling
+middleware on: inner middleware, routing, body parsing, validation, the
+endpoint and response serialization. A sync endpoint is profiled only in the
+worker thread that runs it, since only one cProfile can be active in a
+process (Python 3.12+). Such requests are profiled one at a time. With
+PROFILE_SLOW_MS set, every request is sampled by a background thread and
+the stacks of requests slower than the threshold are kept. Profiles go to
+a bounded directory and are listed by the /api/debug/profiles endpoints.
+"""
+
+import asyncio
+import cProfile
+import functools
+import io
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from fastapi import Request
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
+
+from modules.config import (
+    PROFILING_ENABLED, PROFILE_DIR, PROFILE_MAX_FILES, PROFILE_SLOW_MS, PROFILE_SAMPLE_INTERVAL_MS
+)
+from modules.logging_config import get_request_id
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_NAME_RE = re.compile(r"^[\w.-]+\.(prof|folded)$")
+
+_MAX_STACK_DEPTH = 64
+
+
+class ProfileSession:
+    """Profile of one request: cProfile when forced, stack samples otherwise"""
+
+    def __init__(self, method: str, path: str, forced: bool):
+        self.method = method
+        self.path = path
+        # Enabled on the event loop, or in the worker thread of a sync endpoint
+        self.profiler: Optional[cProfile.Profile] = cProfile.Profile() if forced else None
+        self.samples: Counter = Counter()
+
+
+current_profile: ContextVar[Optional[ProfileSession]] = ContextVar("current_profile", default=None)
+
+
+class StackSampler:
+    """Background thread sampling stacks of threads that run profiled requests"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        # The event loop thread serves several sampled requests at once
+        self._targets: Dict[int, List[Counter]] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    @contextmanager
+    def sampling(self, samples: Counter) -> Iterator[None]:
+        """Sample the calling thread into samples while the block runs"""
+        ident = threading.get_ident()
+        with self._lock:
+            self._targets.setdefault(ident, []).append(samples)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+        try:
+            yield
+        finally:
+            with self._lock:
+                counters = self._targets.get(ident, [])
+                counters.remove(samples)
+                if not counters:
+                    self._targets.pop(ident, None)
+
+    @staticmethod
+    def _stack(frame) -> str:
+        names = []
+        while frame is not None and len(names) < _MAX_STACK_DEPTH:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                targets = {ident: list(counters) for ident, counters in self._targets.items()}
+                if not targets:
+                    self._wake.clear()
+            if not targets:
+                self._wake.wait()
+                continue
+            frames = sys._current_frames()
+            for ident, counters in targets.items():
+                frame = frames.get(ident)
+                if frame is not None:
+                    stack = self._stack(frame)
+                    for samples in counters:
+                        samples[stack] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+class ProfileStore:
+    """Directory of saved profiles, keeping only the newest max_files"""
+
+    def __init__(self, directory: str, max_files: int):
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+    def save(self, session: ProfileSession, elapsed_ms: float, request_id: str) -> Optional[str]:
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", session.path).strip("_")[:60] or "root"
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        extension = "prof" if session.profiler else "folded"
+        name = f"{stamp}-{int(elapsed_ms)}ms-{session.method}-{slug}-{request_id}.{extension}"
+        path = os.path.join(self.directory, name)
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            if session.profiler:
+                session.profiler.dump_stats(path)
+            else:
+                if not session.samples:
+                    return None
+                # Collapsed stacks, the input format of flamegraph tools
+                with open(path, "w", encoding="utf-8") as f:
+                    for stack, count in session.samples.most_common():
+                        f.write(f"{stack} {count}\n")
+            self._prune()
+        logger.info("Профиль запроса %s %s сохранён: %s", session.method, session.path, name)
+        return name
+
+    def _prune(self) -> None:
+        names = sorted(self._names(), key=lambda n: os.path.getmtime(os.path.join(self.directory, n)))
+        for name in names[:max(0, len(names) - self.max_files)]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+
+    def _names(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return [name for name in os.listdir(self.directory) if PROFILE_NAME_RE.match(name)]
+
+    def list(self) -> List[Dict[str, Any]]:
+        profiles = []
+        for name in self._names():
+            stat = os.stat(os.path.join(self.directory, name))
+            profiles.append({"name": name, "size": stat.st_size, "created_at": stat.st_mtime})
+        return sorted(profiles, key=lambda p: p["created_at"], reverse=True)
+
+    def path(self, name: str) -> Optional[str]:
+        """Path of a stored profile, None for unknown or invalid names"""
+        if not PROFILE_NAME_RE.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+    @staticmethod
+    def render_text(path: str, limit: int = 60) -> str:
+        """pstats report of a cProfile file, sorted by cumulative time"""
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+
+sampler = StackSampler(PROFILE_SAMPLE_INTERVAL_MS / 1000)
+profile_store = ProfileStore(PROFILE_DIR, PROFILE_MAX_FILES)
+# One cProfile at a time can be active in the process
+_forced_lock: Optional[asyncio.Lock] = None
+
+
+def _header_forced(request: Request) -> bool:
+    return request.headers.get(PROFILE_HEADER, "").lower() in ("1", "true", "yes")
+
+
+def _thread_profiled(request: Request) -> bool:
+    """True when the request is routed to a sync endpoint that profiles itself in its worker thread"""
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(getattr(route, "endpoint", None), "__profiled__", False)
+    return False
+
+
+async def profiling_middleware(request: Request, call_next):
+    """Open a profile session for the request and store it when wanted"""
+    forced = PROFILING_ENABLED and _header_forced(request)
+    if not forced and not (PROFILING_ENABLED and PROFILE_SLOW_MS > 0):
+        return await call_next(request)
+
+    global _forced_lock
+    session = ProfileSession(request.method, request.url.path, forced)
+    token = current_profile.set(session)
+    try:
+        if forced:
+            if _forced_lock is None:
+                _forced_lock = asyncio.Lock()
+            async with _forced_lock:
+                started = time.perf_counter()
+                if _thread_profiled(request):
+                    response = await call_next(request)
+                else:
+                    session.profiler.enable()
+                    try:
+                        response = await call_next(request)
+                    finally:
+                        session.profiler.disable()
+        else:
+            started = time.perf_counter()
+            # Event loop samples include other requests interleaving with this one
+            with sampler.sampling(session.samples):
+                response = await call_next(request)
+    finally:
+        current_profile.reset(token)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    if forced or elapsed_ms >= PROFILE_SLOW_MS:
+        try:
+            name = await run_in_threadpool(profile_store.save, session, elapsed_ms, get_request_id())
+            if name:
+                response.headers["X-Profile-Name"] = name
+        except Exception:
+            logger.exception("Не удалось сохранить профиль запроса %s", request.url.path)
+    return response
+
+
+def _profiled(endpoint: Callable) -> Callable:
+    """Profile a sync endpoint in the worker thread that runs it (the middleware leaves the event loop alone)"""
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        session = current_profile.get()
+        if session is None:
+            return endpoint(*args, **kwargs)
+        if session.profiler is not None:
+            return session.profiler.runcall(endpoint, *args, **kwargs)
+        with sampler.sampling(session.samples):
+            return endpoint(*args, **kwargs)
+    wrapper.__profiled__ = True
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """APIRoute whose sync endpoint is also profiled in the thread that actually runs it"""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        # include_router() re-creates routes with the already wrapped endpoint
+        if (
+            PROFILING_ENABLED and not asyncio.iscoroutinefunction(endpoint)
+            and not getattr(endpoint, "__profiled__", False)
+        ):
+            endpoint = _profiled(endpoint)
+        super().__init__(path, endpoint, **kwargs)
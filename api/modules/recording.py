@@ -0,0 +1,119 @@
+"""
+Request recording for replay
+Captures API requests (method, path, query, JSON body, status, duration,
+request ID, database) to compact JSONL segments so real traffic can be
+re-issued against another build with benchmarks/replay.py. Values of
+RECORD_REDACT_FIELDS keys are replaced in bodies and query strings.
+"""
+
+import json
+import random
+import time
+from typing import Any, Optional
+from urllib.parse import parse_qsl, urlencode
+
+from modules.config import (
+    RECORD_REQUESTS, RECORD_DIR, RECORD_SAMPLE_RATE, RECORD_MAX_BODY, RECORD_REDACT_FIELDS,
+    RECORD_SEGMENT_BYTES, RECORD_MAX_SEGMENTS, AUDIT_FLUSH_INTERVAL, AUDIT_QUEUE_LIMIT
+)
+from modules.databases import database_name
+from modules.journal import SegmentJournal
+
+REDACTED = "***"
+# Service endpoints are not part of the workload
+_SKIP_PREFIXES = ("/api/debug", "/api/metrics")
+
+request_recorder = SegmentJournal(
+    RECORD_DIR if RECORD_REQUESTS else "", "requests", RECORD_SEGMENT_BYTES, RECORD_MAX_SEGMENTS,
+    AUDIT_FLUSH_INTERVAL, AUDIT_QUEUE_LIMIT
+)
+
+
+def redact(value: Any) -> Any:
+    """Copy of a JSON value with RECORD_REDACT_FIELDS keys masked"""
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if key.lower() in RECORD_REDACT_FIELDS else redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [redact(item) for item in value]
+    return value
+
+
+def _redact_query(query: str) -> str:
+    if not query:
+        return ""
+    pairs = parse_qsl(query, keep_blank_values=True)
+    return urlencode(
+        [(key, REDACTED if key.lower() in RECORD_REDACT_FIELDS else value) for key, value in pairs], safe="*"
+    )
+
+
+def _body(chunks: list, truncated: bool) -> Optional[Any]:
+    if truncated:
+        return {"_truncated": True}
+    if not chunks:
+        return None
+    raw = b"".join(chunks)
+    try:
+        return redact(json.loads(raw))
+    except ValueError:
+        return raw.decode("utf-8", "replace")
+
+
+class RequestRecorderMiddleware:
+    """Record sampled /api HTTP requests; placed inside the database routing, so paths are unprefixed"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if (
+            scope["type"] != "http" or not request_recorder.running or not path.startswith("/api/")
+            or path.startswith(_SKIP_PREFIXES) or random.random() >= RECORD_SAMPLE_RATE
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        chunks = []
+        state = {"size": 0, "truncated": False, "status": 0, "request_id": None}
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request" and not state["truncated"]:
+                body = message.get("body", b"")
+                state["size"] += len(body)
+                if state["size"] > RECORD_MAX_BODY:
+                    state["truncated"] = True
+                    chunks.clear()
+                elif body:
+                    chunks.append(body)
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+                for header, value in message.get("headers", ()):
+                    if header.lower() == b"x-request-id":
+                        state["request_id"] = value.decode("latin-1")
+                        break
+            await send(message)
+
+        started_at = time.time()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            request_recorder.record({
+                "t": round(started_at, 6),
+                "ms": round((time.perf_counter() - started) * 1000, 2),
+                "id": state["request_id"],
+                "db": database_name(),
+                "method": scope["method"],
+                "path": path,
+                "query": _redact_query(scope.get("query_string", b"").decode("latin-1")),
+                "body": _body(chunks, state["truncated"]),
+                "status": state["status"] or 500,
+            })
@@ -2,277 +2,505 @@
 API routes for Group Change Params
 """
 
-from fastapi import APIRouter, HTTPException
-from typing import List, Dict, Any
+import hashlib
+import logging
+from datetime import datetime
+from urllib.parse import unquote
+
+from fastapi import APIRouter, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response
+from typing import Callable, List, Dict, Any, Optional
 from modules.models import (
-    BreedChangeRequest, ColorChangeRequest, BreedOption, 
-    ColorGroup, Color, OrderColor, APIResponse
+    BreedChangeRequest, ColorChangeRequest, BreedMappingRequest, ColorMappingRequest, BreedOption,
+    ColorGroup, Color, ColorCatalog, ColorSearchResult, OrderColor, OrderBreed, OrderFingerprint, APIResponse,
+    JobSubmitRequest, JobStatus, AuditRecord
 )
+from modules.serialization import dumps, encode_rows
+from modules.conditional import make_etag, etag_matches, not_modified, conditional_response
+from modules.catalog import catalog_cache
+from modules.catalog_snapshot import shared_catalog
+from modules.color_search import color_search
 from db.db_functions import (
-    get_available_breeds, get_color_groups, get_colors_by_group,
-    get_order_colors, get_order_info, update_breed_in_order, update_color_in_order,
-    update_breed_in_stuffsets_orderitems, get_stuffsets_breeds_in_order, get_adds_breeds_in_order,
-    get_stuffsets_colors_in_order, update_color_in_stuffsets_orderitems,
-    test_connection
+    AVAILABLE_BREEDS, get_color_groups_rows, get_colors_by_group_rows, get_color_catalog_rows,
+    get_order_colors_rows, get_order_info, get_order_fingerprint_row,
+    get_stuffsets_breeds_in_order_rows, get_adds_breeds_in_order_rows,
+    get_stuffsets_colors_in_order_rows, test_connection, db_pool
 )
+from modules.changes import CHANGE_OPERATIONS, execute_change, last_change_at
+from modules.preflight import PreflightError
+from modules.events import event_broadcaster
+from modules.jobs import job_manager, JobError
+from modules.order_locks import order_locks, OrderLockTimeout
+from modules.breaker import CircuitOpen
+from modules.deadlines import deadline_error
+from modules.single_flight import single_flight, order_key
+from modules.order_cache import order_cache
+from modules.profiling import ProfiledRoute, profile_store
+from modules.idempotency import idempotency_store, request_fingerprint, IdempotencyError
+from modules.audit import audit_journal
+from modules.recording import request_recorder
+from modules.change_feed import change_feed
+from modules.databases import database_name
+from modules.config import PROFILING_ENABLED
+
+router = APIRouter(route_class=ProfiledRoute)
+logger = logging.getLogger(__name__)
+
+
+# Read endpoints are plain functions: FastAPI runs them in its threadpool, so
+# identical concurrent reads can share one DB call through single_flight.
+
+def _catalog_response(request: Request, key: str, loader: Callable[[], bytes]):
+    """Answer a catalog read from the catalog cache, with 304 for a current ETag"""
+    etag = catalog_cache.instance().current_etag(key)
+    if etag and etag_matches(request, etag):
+        return not_modified(etag)
+    body, etag = catalog_cache.instance().get(key, lambda: single_flight.do(f"{database_name()}:catalog:{key}", loader))
+    return conditional_response(request, body, etag)
+
+
+def _order_body(order_id: int, resource: str, loader: Callable[[], bytes]) -> bytes:
+    """Encoded order read from the order cache, one shared DB load on miss"""
+    return order_cache.instance().get(order_id, resource, lambda: single_flight.do(order_key(order_id, resource), loader))
 
-router = APIRouter()
+
+def _order_response(request: Request, body: bytes):
+    """Answer an order read with an ETag derived from the order content"""
+    return conditional_response(request, body, make_etag(body, prefix="ord-"))
 
 
 @router.get("/health")
-async def health_check():
+def health_check():
     """Health check endpoint"""
-    db_ok = test_connection()
+    pool = db_pool.instance()
+    breaker = pool.breaker.metrics()
+    # An open breaker answers without touching the DB; a due probe is made by this check
+    db_ok = not (breaker["state"] == "open" and breaker["retry_after"] > 0) and test_connection()
     return {
         "status": "healthy" if db_ok else "unhealthy",
         "database": "connected" if db_ok else "disconnected",
+        "database_profile": database_name(),
+        "circuit_breaker": pool.breaker.metrics(),
         "service": "Group Change Params API"
     }
 
 
 @router.get("/breeds", response_model=List[BreedOption])
-async def get_breeds():
+def get_breeds(request: Request):
     """Get all available breed options"""
     try:
-        breeds_data = get_available_breeds()
-        return [
-            BreedOption(id=breed["ID"], code=breed["CODE"], type_id=breed["TYPEID"])
-            for breed in breeds_data
-        ]
+        return _catalog_response(
+            request, "breeds", lambda: encode_rows(("id", "code", "type_id"), AVAILABLE_BREEDS)
+        )
+    except CircuitOpen:
+        raise  # Answered 503 by breaker_middleware
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get breeds: {str(e)}")
 
 
 @router.get("/color-groups", response_model=List[ColorGroup])
-async def get_color_groups_endpoint():
+def get_color_groups_endpoint(request: Request):
     """Get all color groups"""
     try:
-        groups_data = get_color_groups()
-        return [ColorGroup(title=group["CG_TITLE"]) for group in groups_data]
+        def load() -> bytes:
+            snapshot = shared_catalog.instance().current()
+            rows = snapshot.color_groups_rows() if snapshot else get_color_groups_rows()
+            return encode_rows(("title",), rows)
+        
+        return _catalog_response(request, "color-groups", load)
+    except CircuitOpen:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get color groups: {str(e)}")
 
 
+def _encode_color_catalog() -> bytes:
+    """Group catalog rows by color group into one compact payload"""
+    snapshot = shared_catalog.instance().current()
+    rows = snapshot.color_catalog_rows() if snapshot else get_color_catalog_rows()
+    groups = []
+    for group_title, color_id, color_title in rows:
+        if not groups or groups[-1]["title"] != group_title:
+            groups.append({"title": group_title, "colors": []})
+        groups[-1]["colors"].append((color_id, color_title))
+    return dumps({"groups": groups})
+
+
+@router.get("/colors", response_model=ColorCatalog)
+def get_color_catalog_endpoint(request: Request):
+    """Get all color groups with their colors in one payload"""
+    try:
+        return _catalog_response(request, "colors", _encode_color_catalog)
+    except CircuitOpen:
+        raise
+    except Exception as e:
+        logger.exception("Ошибка получения каталога цветов")
+        raise HTTPException(status_code=500, detail=f"Failed to get color catalog: {str(e)}")
+
+
+# Declared before /colors/{group_title} so "search" is not taken for a group title
+@router.get("/colors/search", response_model=List[ColorSearchResult])
+def search_colors_endpoint(q: str = Query(..., min_length=1), limit: int = Query(20, ge=1, le=100)):
+    """Search colors of all groups by title"""
+    try:
+        index = color_search.instance().index()
+    except CircuitOpen:
+        raise
+    except Exception as e:
+        logger.exception("Ошибка построения индекса поиска цветов")
+        raise HTTPException(status_code=500, detail=f"Failed to search colors: {str(e)}")
+    return Response(
+        content=encode_rows(
+            ("color_id", "title", "group_title", "score"),
+            ((color_id, title, group_title, score) for score, (group_title, color_id, title) in index.search(q, limit))
+        ),
+        media_type="application/json"
+    )
+
+
 @router.get("/colors/{group_title}", response_model=List[Color])
-async def get_colors_by_group_endpoint(group_title: str):
+def get_colors_by_group_endpoint(request: Request, group_title: str):
     """Get colors by group"""
-    print(f"🔄 API: Запрос цветов для группы '{group_title}'")
+    def load() -> bytes:
+        snapshot = shared_catalog.instance().current()
+        rows = snapshot.colors_by_group_rows(group_title) if snapshot else None
+        if rows is None:
+            rows = get_colors_by_group_rows(group_title)
+        logger.debug("Возвращаем %d цветов для группы '%s'", len(rows), group_title)
+        # Use index as ID since we only get title
+        return encode_rows(
+            ("color_id", "title", "group_title"),
+            ((i, row[0], group_title) for i, row in enumerate(rows))
+        )
+    
     try:
-        colors_data = get_colors_by_group(group_title)
-        print(f"🔄 API: Получено {len(colors_data)} цветов из БД для группы '{group_title}'")
-        
-        result = [
-            Color(
-                color_id=i,  # Use index as ID since we only get title
-                title=color["COLOR"],
-                group_title=group_title  # Pass the actual group_title parameter
-            )
-            for i, color in enumerate(colors_data)
-        ]
-        
-        print(f"🔄 API: Возвращаем {len(result)} цветов для группы '{group_title}'")
-        return result
+        return _catalog_response(request, f"colors:{group_title}", load)
         
+    except CircuitOpen:
+        raise
     except Exception as e:
-        print(f"❌ API: Ошибка получения цветов для группы '{group_title}': {e}")
+        logger.exception("Ошибка получения цветов для группы '%s'", group_title)
         raise HTTPException(status_code=500, detail=f"Failed to get colors: {str(e)}")
 
 
 @router.get("/orders/{order_id}/colors", response_model=List[OrderColor])
-async def get_order_colors_endpoint(order_id: int):
+def get_order_colors_endpoint(request: Request, order_id: int):
     """Get colors used in specific order"""
     try:
-        colors_data = get_order_colors(order_id)
-        return [
-            OrderColor(title=color["COLOR_TITLE"], count=1)  # Count not provided in new query
-            for color in colors_data
-        ]
+        body = _order_body(
+            order_id, "colors",
+            lambda: encode_rows(("title", "count", "item_count"), get_order_colors_rows(order_id))
+        )
+        return _order_response(request, body)
+    except CircuitOpen:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get order colors: {str(e)}")
 
 
 @router.get("/orders/{order_id}/info")
-async def get_order_info_endpoint(order_id: int):
+def get_order_info_endpoint(request: Request, order_id: int):
     """Get order information"""
     try:
-        order_data = get_order_info(order_id)
-        if order_data and len(order_data) > 0:
-            return order_data[0]  # Return first (should be only) record
+        def load() -> bytes:
+            order_data = get_order_info(order_id)
+            return dumps(order_data[0]) if order_data else b""  # First (should be only) record
+        
+        body = _order_body(order_id, "info", load)
+        if body:
+            return _order_response(request, body)
         else:
             raise HTTPException(status_code=404, detail=f"Order {order_id} not found")
+    except HTTPException:
+        raise
+    except CircuitOpen:
+        raise
     except Exception as e:
-        print(f"Error in get_order_info_endpoint: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in get_order_info_endpoint for order %s", order_id)
         raise HTTPException(status_code=500, detail=f"Failed to get order info: {str(e)}")
 
 
-@router.post("/change-breed", response_model=APIResponse)
-async def change_breed(request: BreedChangeRequest):
-    """Change breed (wood type) in order"""
-    print("🚀" + "=" * 79)
-    print("🚀 API ENDPOINT: /change-breed CALLED")
-    print(f"🚀 Request received: order_id={request.order_id}, breed_code='{request.breed_code}'")
-    print("🚀" + "=" * 79)
-    
+@router.get("/orders/{order_id}/fingerprint", response_model=OrderFingerprint)
+def get_order_fingerprint_endpoint(request: Request, order_id: int):
+    """Cheap change detection: hash of the breed and color rows of an order"""
     try:
-        print("🚀 Calling update_breed_in_order function...")
-        success = update_breed_in_order(request.order_id, request.breed_code, request.selected_breeds)
-        
-        print(f"🚀 update_breed_in_order returned: {success}")
-        
-        if success:
-            response = APIResponse(
-                success=True,
-                message=f"Breed changed to '{request.breed_code}' in order {request.order_id}"
-            )
-            print(f"🚀 Returning SUCCESS response: {response}")
-            print("🚀" + "=" * 79)
-            return response
-        else:
-            response = APIResponse(
-                success=False,
-                message="Failed to update breed",
-                error="Database update operation failed"
-            )
-            print(f"🚀 Returning FAILURE response: {response}")
-            print("🚀" + "=" * 79)
-            return response
+        # Never cached: it has to notice edits made in Altawin
+        rows, row_hash = single_flight.do(order_key(order_id, "fingerprint"), lambda: get_order_fingerprint_row(order_id))
+    except CircuitOpen:
+        raise
     except Exception as e:
-        print(f"🚀 EXCEPTION in change_breed endpoint: {e}")
-        print("🚀" + "=" * 79)
-        raise HTTPException(status_code=500, detail=f"Failed to change breed: {str(e)}")
+        logger.exception("Error in get_order_fingerprint_endpoint for order %s", order_id)
+        raise HTTPException(status_code=500, detail=f"Failed to get order fingerprint: {str(e)}")
+    fingerprint = hashlib.blake2b(f"{rows}:{row_hash}".encode("ascii"), digest_size=8).hexdigest()
+    order_cache.instance().check_fingerprint(order_id, fingerprint)
+    return _order_response(request, dumps({
+        "order_id": order_id,
+        "fingerprint": fingerprint,
+        "rows": rows,
+        "changed_at": last_change_at(order_id),
+    }))
 
 
-@router.post("/change-color", response_model=APIResponse)
-async def change_color(request: ColorChangeRequest):
-    """Change color in order"""
+def _idempotent(http_request: Request, operation: str, payload: Any,
+                call: Callable[[], Any], status_code: int = 200, stored: Callable[[Any], bool] = lambda r: True):
+    """Run call once per Idempotency-Key header; repeats get the stored result"""
+    key = http_request.headers.get("Idempotency-Key")
+    if not key:
+        return call()
+    
+    def run():
+        result = call()
+        return status_code, jsonable_encoder(result), stored(result)
+    
     try:
-        success = update_color_in_order(
-            request.order_id, 
-            request.new_color, 
-            request.new_colorgroup, 
-            request.old_colors
+        code, body, replayed = idempotency_store.run(key, request_fingerprint(f"{database_name()}:{operation}", payload), run)
+    except IdempotencyError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    return JSONResponse(body, status_code=code, headers={"Idempotent-Replayed": "true" if replayed else "false"})
+
+
+def _client_user(http_request: Request) -> Optional[str]:
+    """User name sent by the client (percent-encoded, it may be Cyrillic)"""
+    user = http_request.headers.get("X-Client-User")
+    return unquote(user) if user else None
+
+
+def _run_change(name: str, request, http_request: Request):
+    """Run change operation once per Idempotency-Key and wrap its outcome into APIResponse
+    Change endpoints are plain functions, so FastAPI runs them in its
+    threadpool and changes of different orders proceed in parallel.
+    """
+    logger.info("%s requested", name, extra={"change": jsonable_encoder(request)})
+    # Failed changes are not stored, so retrying them with the same key runs them again
+    return _idempotent(
+        http_request, name, jsonable_encoder(request),
+        lambda: _apply_change(name, request, http_request), stored=lambda r: r.success
+    )
+
+
+def _apply_change(name: str, request, http_request: Request) -> APIResponse:
+    operation = CHANGE_OPERATIONS[name]
+    try:
+        data = execute_change(
+            name, request, origin=http_request.headers.get("X-Client-Id"), user=_client_user(http_request)
         )
-        if success:
-            return APIResponse(
-                success=True,
-                message=f"Color changed to '{request.new_color}' ({request.new_colorgroup}) in order {request.order_id}"
-            )
-        else:
-            return APIResponse(
-                success=False,
-                message="Failed to update color",
-                error="Database update operation failed"
-            )
+    except OrderLockTimeout as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except PreflightError as e:
+        logger.warning("%s rejected for order %s: %s", name, request.order_id, e)
+        raise HTTPException(status_code=422, detail={"message": str(e), "problems": e.problems})
+    except CircuitOpen:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to change color: {str(e)}")
+        timeout = deadline_error()
+        if timeout is not None:
+            # Not an answer to store: the change was cut short or its outcome is unknown
+            logger.warning("%s for order %s ran out of time: %s", name, request.order_id, e)
+            raise timeout from e
+        logger.exception("%s failed for order %s", name, request.order_id)
+        return APIResponse(
+            success=False,
+            message=operation.failure_message,
+            error=f"Database update operation failed: {str(e)}"
+        )
+    
+    return APIResponse(
+        success=True,
+        message=operation.success_message(request),
+        data=data
+    )
 
 
-@router.get("/orders/{order_id}/stuffsets-breeds")
-async def get_stuffsets_breeds_endpoint(order_id: int):
+@router.post("/change-breed", response_model=APIResponse)
+def change_breed(request: BreedChangeRequest, http_request: Request):
+    """Change breed (wood type) in order"""
+    return _run_change("change-breed", request, http_request)
+
+@router.post("/change-color", response_model=APIResponse)
+def change_color(request: ColorChangeRequest, http_request: Request):
+    """Change color in order"""
+    return _run_change("change-color", request, http_request)
+
+@router.post("/change-breed-mapping", response_model=APIResponse)
+def change_breed_mapping(request: BreedMappingRequest, http_request: Request):
+    """Replace several breeds in order at once (old -> new pairs), rows per pair"""
+    return _run_change("change-breed-mapping", request, http_request)
+
+@router.post("/change-color-mapping", response_model=APIResponse)
+def change_color_mapping(request: ColorMappingRequest, http_request: Request):
+    """Replace several colors in order at once (old -> new pairs), rows per pair"""
+    return _run_change("change-color-mapping", request, http_request)
+
+@router.get("/orders/{order_id}/stuffsets-breeds", response_model=List[OrderBreed])
+def get_stuffsets_breeds_endpoint(request: Request, order_id: int):
     """Get breeds used in stuffsets orderitems"""
     try:
-        breeds_data = get_stuffsets_breeds_in_order(order_id)
-        return [breed["BREED_CODE"] for breed in breeds_data]
+        body = _order_body(
+            order_id, "stuffsets-breeds",
+            lambda: encode_rows(("code", "count", "item_count"), get_stuffsets_breeds_in_order_rows(order_id))
+        )
+        return _order_response(request, body)
+    except CircuitOpen:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get stuffsets breeds: {str(e)}")
 
 
-@router.get("/orders/{order_id}/adds-breeds")
-async def get_adds_breeds_endpoint(order_id: int):
+@router.get("/orders/{order_id}/adds-breeds", response_model=List[OrderBreed])
+def get_adds_breeds_endpoint(request: Request, order_id: int):
     """Get breeds used in adds (dополнения)"""
     try:
-        breeds_data = get_adds_breeds_in_order(order_id)
-        return [breed["BREED_CODE"] for breed in breeds_data]
+        body = _order_body(
+            order_id, "adds-breeds",
+            lambda: encode_rows(("code", "count", "item_count"), get_adds_breeds_in_order_rows(order_id))
+        )
+        return _order_response(request, body)
+    except CircuitOpen:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get adds breeds: {str(e)}")
 
 
-@router.get("/orders/{order_id}/stuffsets-colors")
-async def get_stuffsets_colors_endpoint(order_id: int):
+@router.get("/orders/{order_id}/stuffsets-colors", response_model=List[OrderColor])
+def get_stuffsets_colors_endpoint(request: Request, order_id: int):
     """Get colors used in stuffsets orderitems"""
     try:
-        colors_data = get_stuffsets_colors_in_order(order_id)
-        return [{"title": color["COLOR_TITLE"]} for color in colors_data]
+        body = _order_body(
+            order_id, "stuffsets-colors",
+            lambda: encode_rows(("title", "count", "item_count"), get_stuffsets_colors_in_order_rows(order_id))
+        )
+        return _order_response(request, body)
+    except CircuitOpen:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get stuffsets colors: {str(e)}")
 
 
 @router.post("/change-stuffsets-breed", response_model=APIResponse)
-async def change_stuffsets_breed(request: BreedChangeRequest):
+def change_stuffsets_breed(request: BreedChangeRequest, http_request: Request):
     """Change breed (wood type) in stuffsets orderitems"""
-    print("🚀" + "=" * 79)
-    print("🚀 API ENDPOINT: /change-stuffsets-breed CALLED")
-    print(f"🚀 Request received: order_id={request.order_id}, breed_code='{request.breed_code}'")
-    print("🚀" + "=" * 79)
-    
-    try:
-        print("🚀 Calling update_breed_in_stuffsets_orderitems function...")
-        success = update_breed_in_stuffsets_orderitems(request.order_id, request.breed_code, request.selected_breeds)
-        
-        print(f"🚀 update_breed_in_stuffsets_orderitems returned: {success}")
-        
-        if success:
-            response = APIResponse(
-                success=True,
-                message=f"Stuffsets breed changed to '{request.breed_code}' in order {request.order_id}"
-            )
-            print(f"🚀 Returning SUCCESS response: {response}")
-            print("🚀" + "=" * 79)
-            return response
-        else:
-            response = APIResponse(
-                success=False,
-                message="Failed to update stuffsets breed",
-                error="Database update operation failed"
-            )
-            print(f"🚀 Returning FAILURE response: {response}")
-            print("🚀" + "=" * 79)
-            return response
-    except Exception as e:
-        print(f"🚀 EXCEPTION in change_stuffsets_breed endpoint: {e}")
-        print("🚀" + "=" * 79)
-        raise HTTPException(status_code=500, detail=f"Failed to change stuffsets breed: {str(e)}")
-
+    return _run_change("change-stuffsets-breed", request, http_request)
 
 @router.post("/change-stuffsets-color", response_model=APIResponse)
-async def change_stuffsets_color(request: ColorChangeRequest):
+def change_stuffsets_color(request: ColorChangeRequest, http_request: Request):
     """Change color in stuffsets orderitems"""
-    print("🚀" + "=" * 79)
-    print("🚀 API ENDPOINT: /change-stuffsets-color CALLED")
-    print(f"🚀 Request received: order_id={request.order_id}, new_color='{request.new_color}', old_colors={request.old_colors}")
-    print("🚀" + "=" * 79)
+    return _run_change("change-stuffsets-color", request, http_request)
+
+
+@router.post("/change-stuffsets-breed-mapping", response_model=APIResponse)
+def change_stuffsets_breed_mapping(request: BreedMappingRequest, http_request: Request):
+    """Replace several breeds in stuffsets orderitems at once (old -> new pairs), rows per pair"""
+    return _run_change("change-stuffsets-breed-mapping", request, http_request)
+
+@router.post("/change-stuffsets-color-mapping", response_model=APIResponse)
+def change_stuffsets_color_mapping(request: ColorMappingRequest, http_request: Request):
+    """Replace several colors in stuffsets orderitems at once (old -> new pairs), rows per pair"""
+    return _run_change("change-stuffsets-color-mapping", request, http_request)
+
+
+def _job_status(job: Dict[str, Any]) -> JobStatus:
+    return JobStatus(**job)
+
+
+@router.post("/jobs", response_model=JobStatus, status_code=202)
+def submit_job(request: JobSubmitRequest, http_request: Request):
+    """Submit a change as background job"""
+    def submit() -> JobStatus:
+        try:
+            job = job_manager.submit(
+                request.operation, request.request, request.order_ids,
+                request.priority, origin=http_request.headers.get("X-Client-Id"), user=_client_user(http_request)
+            )
+        except JobError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return _job_status(job)
     
+    return _idempotent(http_request, "jobs", jsonable_encoder(request), submit, status_code=202)
+
+
+@router.get("/jobs", response_model=List[JobStatus])
+async def list_jobs(limit: int = 50):
+    """List recent background jobs"""
+    return [_job_status(job) for job in job_manager.recent(limit)]
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    """Get background job progress and result"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return _job_status(job)
+
+
+@router.get("/audit", response_model=List[AuditRecord])
+def get_audit(order_id: Optional[int] = None, since: Optional[datetime] = None,
+              until: Optional[datetime] = None, limit: int = Query(100, ge=1, le=10000)):
+    """Audit journal of changes, newest first (times without zone are server local time)"""
+    if not audit_journal.enabled:
+        raise HTTPException(status_code=404, detail="Audit journal is disabled")
+    return audit_journal.query(
+        database=database_name(),
+        order_id=order_id,
+        since=since.timestamp() if since else None,
+        until=until.timestamp() if until else None,
+        limit=limit
+    )
+
+
+@router.websocket("/ws/events")
+async def events_websocket(websocket: WebSocket):
+    """Push order change events to the client"""
+    await event_broadcaster.connect(websocket)
     try:
-        print("🚀 Calling update_color_in_stuffsets_orderitems function...")
-        success = update_color_in_stuffsets_orderitems(
-            request.order_id, 
-            request.new_color, 
-            request.new_colorgroup, 
-            request.old_colors
-        )
-        
-        print(f"🚀 update_color_in_stuffsets_orderitems returned: {success}")
-        
-        if success:
-            response = APIResponse(
-                success=True,
-                message=f"Stuffsets colors changed to '{request.new_color}' in order {request.order_id}"
-            )
-            print(f"🚀 Returning SUCCESS response: {response}")
-            print("🚀" + "=" * 79)
-            return response
-        else:
-            response = APIResponse(
-                success=False,
-                message="Failed to update stuffsets colors",
-                error="Database update operation failed"
-            )
-            print(f"🚀 Returning FAILURE response: {response}")
-            print("🚀" + "=" * 79)
-            return response
-    except Exception as e:
-        print(f"🚀 EXCEPTION in change_stuffsets_color endpoint: {e}")
-        print("🚀" + "=" * 79)
-        raise HTTPException(status_code=500, detail=f"Failed to change stuffsets color: {str(e)}")
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        event_broadcaster.disconnect(websocket)
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """Internal metrics of the API"""
+    return {
+        "databases": {
+            name: {
+                "db_pool": pool.metrics(),
+                "db_breaker": pool.breaker.metrics(),
+                "order_locks": order_locks.get(name).metrics(),
+                "order_cache": order_cache.get(name).metrics(),
+            }
+            for name, pool in db_pool.items()
+        },
+        "single_flight": single_flight.metrics(),
+        "idempotency": idempotency_store.metrics(),
+        "audit": audit_journal.metrics(),
+        "recording": request_recorder.metrics(),
+        "change_feed": change_feed.metrics(),
+    }
+
+
+@router.get("/debug/profiles")
+def list_profiles():
+    """List stored request profiles"""
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    return profile_store.list()
+
+
+@router.get("/debug/profiles/{name}")
+def get_profile(name: str, format: str = Query("raw", pattern="^(raw|text)$")):
+    """Download a stored profile; format=text renders cProfile files as a pstats report"""
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    path = profile_store.path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail=f"Profile {name} not found")
+    if format == "text" and name.endswith(".prof"):
+        return PlainTextResponse(profile_store.render_text(path))
+    if name.endswith(".folded"):
+        return FileResponse(path, media_type="text/plain", filename=name)
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
@@ -0,0 +1,36 @@
+"""
+Fast-path JSON serialization for list endpoints
+Rows are encoded straight from cursor tuples to JSON bytes, bypassing
+per-row pydantic models and FastAPI's response_model validation.
+Routes return the bytes as a raw Response and keep their response_model,
+so the OpenAPI schema is unchanged.
+"""
+
+import json
+from typing import Any, Iterable, Sequence
+
+from modules.tracing import span
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - fallback when orjson is not installed
+    orjson = None
+
+
+def _dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode object to compact UTF-8 JSON bytes"""
+    with span("ser"):
+        return _dumps(obj)
+
+
+def encode_rows(fields: Sequence[str], rows: Iterable[Sequence[Any]]) -> bytes:
+    """Encode rows (tuples in `fields` order) as a JSON array of objects"""
+    with span("ser"):
+        return _dumps([dict(zip(fields, row)) for row in rows])
+
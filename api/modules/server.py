@@ -0,0 +1,66 @@
+"""
+Server launcher for Group Change Params API
+Runs uvicorn with several worker processes, uvloop/httptools when they are
+installed, keep-alive and backlog tuning and a graceful shutdown deadline.
+"""
+
+import importlib.util
+import logging
+import multiprocessing
+from typing import Any, Dict
+
+import uvicorn
+
+from modules.config import (
+    API_HOST, API_PORT, API_WORKERS, API_LOOP, API_HTTP,
+    API_KEEPALIVE, API_BACKLOG, API_GRACEFUL_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def resolve_loop() -> str:
+    """Event loop implementation: uvloop when installed (not available on Windows)"""
+    if API_LOOP == "auto":
+        return "uvloop" if _installed("uvloop") else "asyncio"
+    return API_LOOP
+
+
+def resolve_http() -> str:
+    """HTTP parser: httptools when installed"""
+    if API_HTTP == "auto":
+        return "httptools" if _installed("httptools") else "h11"
+    return API_HTTP
+
+
+def server_options() -> Dict[str, Any]:
+    """uvicorn.run() keyword arguments from the configuration"""
+    return {
+        "host": API_HOST,
+        "port": API_PORT,
+        "workers": API_WORKERS,
+        "loop": resolve_loop(),
+        "http": resolve_http(),
+        "timeout_keep_alive": API_KEEPALIVE,
+        "backlog": API_BACKLOG,
+        # On SIGTERM/Ctrl+C the socket is closed at once; in-flight requests get this
+        # long before they are cancelled, then the shutdown handlers drain jobs and the DB pool
+        "timeout_graceful_shutdown": API_GRACEFUL_TIMEOUT,
+        "log_level": "info",
+    }
+
+
+def run_server(app: Any, app_path: str = "main:app") -> None:
+    """Serve the app; worker processes import it by `app_path`"""
+    multiprocessing.freeze_support()  # Worker processes of PyInstaller builds
+    options = server_options()
+    logger.info(
+        "Запуск API на %s:%s: workers=%d, loop=%s, http=%s, keep-alive=%d с, backlog=%d",
+        options["host"], options["port"], options["workers"], options["loop"],
+        options["http"], options["timeout_keep_alive"], options["backlog"]
+    )
+    uvicorn.run(app_path if options["workers"] > 1 else app, **options)
@@ -0,0 +1,110 @@
+"""
+Request coalescing for identical concurrent reads
+Callers asking for the same key while a load is in flight wait for that
+load and share its result. Nothing is kept once the load finishes.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from modules.config import SINGLE_FLIGHT_METRIC_KEYS
+from modules.tracing import span
+from modules.databases import database_name
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """One in-flight load and its outcome"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Share one in-flight call per key between concurrent callers"""
+
+    def __init__(self, metric_keys: int):
+        self.metric_keys = metric_keys
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        # key -> {"calls", "loads", "shared", "load_ms_max"}, least recently used first
+        self._metrics: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+
+    def _key_metrics(self, key: str) -> Dict[str, float]:
+        metrics = self._metrics.get(key)
+        if metrics is None:
+            metrics = self._metrics[key] = {"calls": 0, "loads": 0, "shared": 0, "load_ms_max": 0.0}
+            while len(self._metrics) > self.metric_keys:
+                self._metrics.popitem(last=False)
+        else:
+            self._metrics.move_to_end(key)
+        return metrics
+
+    def do(self, key: str, loader: Callable[[], Any]) -> Any:
+        """Return loader() result, shared with concurrent callers of the same key"""
+        with self._lock:
+            metrics = self._key_metrics(key)
+            metrics["calls"] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                metrics["shared"] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                metrics["loads"] += 1
+                leader = True
+
+        if not leader:
+            with span("coalesced", key):
+                call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        started = time.perf_counter()
+        try:
+            call.result = loader()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                # A forgotten key may already belong to a newer call
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                metrics = self._key_metrics(key)
+                metrics["load_ms_max"] = round(max(metrics["load_ms_max"], elapsed_ms), 2)
+            call.done.set()
+            if call.waiters:
+                logger.debug("Single-flight '%s': %d caller(s) shared one load", key, call.waiters)
+        return call.result
+
+    def forget(self, prefix: str) -> None:
+        """Let new callers of keys with prefix start a fresh load (e.g. after a write)"""
+        with self._lock:
+            for key in [key for key in self._calls if key.startswith(prefix)]:
+                del self._calls[key]
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "keys": {key: dict(values) for key, values in self._metrics.items()},
+            }
+
+
+single_flight = SingleFlight(SINGLE_FLIGHT_METRIC_KEYS)
+
+
+def order_key(order_id: int, resource: str) -> str:
+    """Single-flight key of an order read in the current database"""
+    return f"{database_name()}:order:{order_id}:{resource}"
@@ -0,0 +1,92 @@
+"""
+Request tracing with Server-Timing breakdown
+Each request collects timing spans (pool wait, every SQL statement,
+serialization) in a context-local trace; the middleware returns them in
+the Server-Timing header together with the total request time.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional, Tuple
+
+from fastapi import Request
+
+# Spans of one name beyond this are summed into the last one
+MAX_SPANS = 40
+
+
+class RequestTrace:
+    """Timing spans of one request: (name, duration ms, description)"""
+
+    def __init__(self):
+        self.spans: List[Tuple[str, float, Optional[str]]] = []
+        self._lock = threading.Lock()
+        self._sql_count = 0
+
+    def add(self, name: str, duration_ms: float, description: Optional[str] = None) -> None:
+        with self._lock:
+            if name == "sql":
+                self._sql_count += 1
+                name = f"sql-{self._sql_count}"
+            if len(self.spans) >= MAX_SPANS:
+                name, total, _ = self.spans[-1]
+                self.spans[-1] = (name, total + duration_ms, "truncated")
+                return
+            self.spans.append((name, duration_ms, description))
+
+    def server_timing(self, total_ms: float) -> str:
+        with self._lock:
+            spans = list(self.spans)
+        # Repeated names other than sql (e.g. "ser") are summed
+        merged = {}
+        for name, duration, description in spans:
+            if name in merged:
+                merged[name] = (merged[name][0] + duration, merged[name][1])
+            else:
+                merged[name] = (duration, description)
+        parts = []
+        for name, (duration, description) in merged.items():
+            part = f"{name};dur={duration:.1f}"
+            if description:
+                part += f';desc="{description}"'
+            parts.append(part)
+        parts.append(f"total;dur={total_ms:.1f}")
+        return ", ".join(parts)
+
+
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+
+
+def record(name: str, duration_ms: float, description: Optional[str] = None) -> None:
+    """Add a span to the trace of the current request, if any"""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(name, duration_ms, description)
+
+
+@contextmanager
+def span(name: str, description: Optional[str] = None) -> Iterator[None]:
+    """Time the block as a span of the current request"""
+    if current_trace.get() is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - started) * 1000, description)
+
+
+async def server_timing_middleware(request: Request, call_next):
+    """Collect the request trace and return it as Server-Timing"""
+    trace = RequestTrace()
+    token = current_trace.set(trace)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        current_trace.reset(token)
+    response.headers["Server-Timing"] = trace.server_timing((time.perf_counter() - started) * 1000)
+    return response
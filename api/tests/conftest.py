@@ -0,0 +1,31 @@
+"""
+Test setup: the API modules are imported from the api directory with their
+state files in a temporary directory and without log output
+"""
+
+import os
+import sys
+import tempfile
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if API_DIR not in sys.path:
+    sys.path.insert(0, API_DIR)
+
+_DATA_DIR = tempfile.mkdtemp(prefix="gcp-tests-")
+# Set before modules.config is imported, which reads the environment once
+os.environ.update(
+    JOBS_DB_PATH=os.path.join(_DATA_DIR, "jobs.sqlite3"),
+    IDEMPOTENCY_DB_PATH=os.path.join(_DATA_DIR, "idempotency.sqlite3"),
+    AUDIT_DIR=os.path.join(_DATA_DIR, "audit"),
+    RECORD_REQUESTS="false",
+    CATALOG_SNAPSHOT_DIR="",
+    CHANGE_FEED_PATH="",
+    ORDER_LOCK_DIR="",
+    LOG_TO_CONSOLE="false",
+    LOG_FILE="",
+    DB_TRACE_CONTEXT="false",
+    DB_CREATE_SELECTION_TABLE="false",
+    # A second database profile for the routing tests
+    DB_PROFILES="site2",
+    DB_SITE2_NAME="site2.fdb",
+)
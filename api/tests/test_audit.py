@@ -0,0 +1,150 @@
+import json
+import os
+import time
+from datetime import datetime
+
+import pytest
+
+from modules.audit import AuditJournal
+from modules.journal import SegmentJournal
+
+BASE = datetime(2026, 1, 5, 12, 0, 0).timestamp()
+
+
+def _segment(directory, opened, entries, pid=100):
+    """Segment file as a writer process would leave it: named by its first record, mtime of its last"""
+    name = f"audit-{datetime.fromtimestamp(opened).strftime('%Y%m%dT%H%M%S')}-{pid}.jsonl"
+    path = os.path.join(directory, name)
+    with open(path, "w", encoding="utf-8") as segment:
+        for entry in entries:
+            segment.write(json.dumps(entry) + "\n")
+    last = max((entry["time"] for entry in entries), default=opened)
+    os.utime(path, (last, last))
+    return path
+
+
+def _change(at, order_id, database="default", **fields):
+    return {"time": at, "order_id": order_id, "database": database, "operation": "change-color", **fields}
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return AuditJournal(str(tmp_path), segment_bytes=1024 * 1024, max_segments=0, flush_interval=0.01, queue_limit=100)
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    paths = []
+    read_segment = SegmentJournal.read_segment
+
+    def counting(path):
+        paths.append(os.path.basename(path))
+        return read_segment(path)
+
+    monkeypatch.setattr(SegmentJournal, "read_segment", staticmethod(counting))
+    return paths
+
+
+def test_records_are_written_in_batches_and_read_back(tmp_path):
+    journal = SegmentJournal(str(tmp_path), "audit", 1024 * 1024, 0, flush_interval=0.01, queue_limit=100)
+    journal.start()
+    for number in range(5):
+        assert journal.record({"n": number})
+    journal.stop()
+    assert [entry["n"] for entry in journal.read()] == list(range(5))
+    metrics = journal.metrics()
+    assert metrics["written"] == 5 and metrics["dropped"] == 0 and metrics["errors"] == 0
+    assert not journal.record({"n": 5})
+
+
+def test_full_queue_drops_records(tmp_path):
+    journal = SegmentJournal(str(tmp_path), "audit", 1024 * 1024, 0, flush_interval=0.01, queue_limit=1)
+    # Writer not draining: queue a record by hand as if it were busy
+    journal._thread = object()
+    assert journal.record({"n": 1})
+    assert not journal.record({"n": 2})
+    assert journal.metrics()["dropped"] == 1
+
+
+def test_oldest_segments_beyond_the_limit_are_removed(tmp_path):
+    for minute in range(4):
+        _segment(str(tmp_path), BASE + minute * 60, [_change(BASE + minute * 60, 1)])
+    journal = SegmentJournal(str(tmp_path), "audit", 1024 * 1024, 2, flush_interval=0.01, queue_limit=100)
+    journal._prune()
+    assert [os.path.basename(path)[6:21] for path in journal.segments()] == ["20260105T120200", "20260105T120300"]
+
+
+def test_candidates_skip_segments_outside_the_time_range(journal, tmp_path):
+    _segment(str(tmp_path), BASE, [_change(BASE, 1), _change(BASE + 50, 1)])
+    _segment(str(tmp_path), BASE + 60, [_change(BASE + 60, 1), _change(BASE + 110, 1)])
+    _segment(str(tmp_path), BASE + 120, [_change(BASE + 120, 1)])
+    assert len(journal.candidates()) == 3
+    # Written last before `since`: cannot hold newer records
+    assert len(journal.candidates(since=BASE + 100)) == 2
+    # Opened after `until`: cannot hold older records
+    assert len(journal.candidates(until=BASE + 30)) == 1
+    mtimes = [segment[2] for segment in journal.candidates()]
+    assert mtimes == sorted(mtimes, reverse=True)
+
+
+def test_query_filters_and_returns_newest_first(journal, tmp_path):
+    _segment(str(tmp_path), BASE, [_change(BASE, 1), _change(BASE + 10, 2), _change(BASE + 20, 1, "plant")])
+    _segment(str(tmp_path), BASE + 60, [_change(BASE + 60, 1), _change(BASE + 70, 2)], pid=200)
+
+    assert [entry["time"] for entry in journal.query(order_id=1)] == [BASE + 60, BASE + 20, BASE]
+    assert [entry["time"] for entry in journal.query(database="default", order_id=1)] == [BASE + 60, BASE]
+    assert [entry["time"] for entry in journal.query(database="plant")] == [BASE + 20]
+    assert [entry["time"] for entry in journal.query(since=BASE + 15, until=BASE + 65)] == [BASE + 60, BASE + 20]
+    assert [entry["time"] for entry in journal.query(limit=2)] == [BASE + 70, BASE + 60]
+
+
+def test_records_without_database_belong_to_the_default_one(journal, tmp_path):
+    entry = _change(BASE, 1)
+    del entry["database"]
+    _segment(str(tmp_path), BASE, [entry])
+    assert len(journal.query(database="default", order_id=1)) == 1
+
+
+def test_query_stops_once_older_segments_cannot_hold_newer_records(journal, tmp_path, reads):
+    for minute in range(5):
+        _segment(str(tmp_path), BASE + minute * 60, [_change(BASE + minute * 60 + second, 1) for second in range(3)])
+    result = journal.query(order_id=1, limit=3)
+    assert [entry["time"] for entry in result] == [BASE + 242, BASE + 241, BASE + 240]
+    assert reads == ["audit-20260105T120400-100.jsonl"]
+
+
+def test_index_skips_unchanged_segments_without_the_order(journal, tmp_path, reads):
+    _segment(str(tmp_path), BASE, [_change(BASE, 1)])
+    latest = _segment(str(tmp_path), BASE + 60, [_change(BASE + 60, 2)])
+    journal.query(order_id=3)
+    assert len(reads) == 2
+    reads.clear()
+
+    assert journal.query(order_id=3) == []
+    assert reads == []
+
+    # A segment that grew is read again
+    with open(latest, "a", encoding="utf-8") as segment:
+        segment.write(json.dumps(_change(BASE + 90, 3)) + "\n")
+    os.utime(latest, (BASE + 90, BASE + 90))
+    assert [entry["time"] for entry in journal.query(order_id=3)] == [BASE + 90]
+    assert reads == [os.path.basename(latest)]
+
+
+def test_index_of_removed_segments_is_dropped(journal, tmp_path):
+    path = _segment(str(tmp_path), BASE, [_change(BASE, 1)])
+    journal.query(order_id=1)
+    os.remove(path)
+    assert journal.query(order_id=1) == []
+    assert journal._index == {}
+
+
+def test_record_fills_time_and_is_queryable(tmp_path):
+    journal = AuditJournal(str(tmp_path), 1024 * 1024, 0, flush_interval=0.01, queue_limit=100)
+    journal.start()
+    journal.record({"database": "default", "order_id": 42, "outcome": "ok"})
+    journal.stop()
+    [entry] = journal.query(order_id=42)
+    assert entry["outcome"] == "ok"
+    assert abs(entry["time"] - time.time()) < 60
+    assert "request_id" in entry
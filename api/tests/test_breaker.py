@@ -0,0 +1,125 @@
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from db.pool import ConnectionPool
+from modules.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen, breaker_middleware
+
+
+def _open(breaker):
+    for _ in range(breaker.threshold):
+        breaker.failure(OSError("connection refused"))
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("default", threshold=3, reset_timeout=60)
+    assert not breaker.failure(OSError("refused"))
+    assert not breaker.failure(OSError("refused"))
+    assert breaker.state == CLOSED and breaker.allow() is False
+    assert breaker.failure(OSError("refused"))
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen) as error:
+        breaker.allow()
+    assert 59 <= error.value.retry_after <= 60
+    metrics = breaker.metrics()
+    assert (metrics["opens"], metrics["rejected"], metrics["last_error"]) == (1, 1, "refused")
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker("default", threshold=2, reset_timeout=60)
+    breaker.failure(OSError("refused"))
+    breaker.success()
+    assert not breaker.failure(OSError("refused"))
+    assert breaker.state == CLOSED
+
+
+def test_one_probe_after_the_reset_timeout():
+    breaker = CircuitBreaker("default", threshold=1, reset_timeout=0.05)
+    _open(breaker)
+    time.sleep(0.06)
+    assert breaker.allow() is True
+    assert breaker.state == HALF_OPEN
+    # Other requests are rejected while the probe runs
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+
+
+def test_probe_success_closes_the_breaker():
+    breaker = CircuitBreaker("default", threshold=1, reset_timeout=0.05)
+    _open(breaker)
+    time.sleep(0.06)
+    breaker.allow()
+    breaker.success()
+    assert breaker.state == CLOSED and breaker.allow() is False
+
+
+def test_probe_failure_opens_it_again():
+    breaker = CircuitBreaker("default", threshold=3, reset_timeout=0.05)
+    _open(breaker)
+    time.sleep(0.06)
+    breaker.allow()
+    # A single failure of the probe is enough
+    assert not breaker.failure(OSError("still down"))
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen):
+        breaker.allow()
+    assert breaker.metrics()["opens"] == 1
+
+
+def test_probe_that_never_reports_back_is_replaced():
+    breaker = CircuitBreaker("default", threshold=1, reset_timeout=0.05)
+    _open(breaker)
+    time.sleep(0.06)
+    assert breaker.allow() is True
+    time.sleep(0.06)
+    assert breaker.allow() is True
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.middleware("http")(breaker_middleware)
+
+    @app.get("/escaped")
+    def escaped():
+        raise CircuitOpen("default", 12.3)
+
+    @app.get("/handled")
+    def handled():
+        try:
+            raise CircuitOpen("default", 12.3)
+        except CircuitOpen:
+            return {"status": "unhealthy"}
+
+    return TestClient(app)
+
+
+def test_escaped_rejection_is_answered_503(client):
+    response = client.get("/escaped")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "13"
+    assert "unavailable" in response.json()["detail"]
+
+
+def test_handled_rejection_keeps_the_handler_answer(client):
+    response = client.get("/handled")
+    assert response.status_code == 200
+    assert response.json() == {"status": "unhealthy"}
+
+
+def test_pool_rejects_checkouts_while_the_database_is_down():
+    attempts = []
+
+    def connect():
+        attempts.append(1)
+        raise OSError("connection refused")
+
+    pool = ConnectionPool(connect, size=2, timeout=1, breaker=CircuitBreaker("default", 2, 60))
+    for _ in range(2):
+        with pytest.raises(OSError):
+            pool.acquire()
+    with pytest.raises(CircuitOpen):
+        pool.acquire()
+    assert len(attempts) == 2
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from modules.catalog_snapshot import POINTER_FILE, CatalogSnapshot, SharedCatalog, write_snapshot
+
+_SOURCE = {
+    "groups": [(2, "Дерево"), (1, "RAL")],
+    "colors": [(41, 2, "Орех"), (11, 1, "RAL 9016"), (40, 2, "Дуб"), (99, 7, "Без группы")],
+    "enum_items": [(1, 1, "Сосна Люкс "), (3, 2, "Лиственница Люкс")],
+}
+
+
+def _pointer(directory):
+    with open(os.path.join(directory, POINTER_FILE), encoding="ascii") as f:
+        return f.read().strip()
+
+
+@pytest.fixture
+def snapshot(tmp_path):
+    snapshot = CatalogSnapshot(write_snapshot(str(tmp_path), _SOURCE))
+    yield snapshot
+    snapshot.close()
+
+
+def test_rows_read_back_sorted_like_the_catalog_endpoints(snapshot):
+    assert snapshot.color_groups_rows() == [("RAL",), ("Дерево",)]
+    # Colors of unknown groups are left out
+    assert snapshot.color_catalog_rows() == [("RAL", 11, "RAL 9016"), ("Дерево", 40, "Дуб"), ("Дерево", 41, "Орех")]
+    assert snapshot.colors_by_group_rows("Дерево") == [("Дуб",), ("Орех",)]
+    assert snapshot.colors_by_group_rows("Металлик") is None
+    assert list(snapshot.enum_items()) == [(1, 1, "Сосна Люкс"), (3, 2, "Лиственница Люкс")]
+
+
+def test_other_files_are_not_mapped(tmp_path):
+    path = tmp_path / "catalog-1.snap"
+    path.write_bytes(b"NOTASNAP" + bytes(64))
+    with pytest.raises(ValueError):
+        CatalogSnapshot(str(path))
+
+
+def test_unchanged_refresh_keeps_the_published_snapshot(tmp_path):
+    directory = str(tmp_path)
+    first = write_snapshot(directory, _SOURCE)
+    assert write_snapshot(directory, {key: list(rows) for key, rows in _SOURCE.items()}) == first
+    assert _pointer(directory) == os.path.basename(first)
+
+    changed = dict(_SOURCE, colors=_SOURCE["colors"] + [(42, 2, "Ясень")])
+    second = write_snapshot(directory, changed)
+    assert second != first and _pointer(directory) == os.path.basename(second)
+
+
+def test_readers_remap_only_when_a_new_snapshot_is_published(tmp_path):
+    directory = str(tmp_path)
+    catalog = SharedCatalog(directory, check_interval=0)
+    assert catalog.current() is None
+
+    write_snapshot(directory, _SOURCE)
+    generation = catalog.generation()
+    assert generation is not None
+    write_snapshot(directory, _SOURCE)
+    assert catalog.generation() == generation
+
+    write_snapshot(directory, dict(_SOURCE, groups=[(2, "Дерево")]))
+    assert catalog.generation() != generation
+    assert catalog.current().color_groups_rows() == [("Дерево",)]
+
+
+def test_disabled_catalog_has_no_snapshot():
+    catalog = SharedCatalog("", check_interval=0)
+    assert not catalog.enabled and catalog.current() is None and catalog.generation() is None
@@ -0,0 +1,41 @@
+import pytest
+
+from modules import changes
+from modules.changes import ChangeOperation, execute_change, last_change_at
+from modules.events import event_broadcaster
+from modules.models import ColorChangeRequest
+
+
+@pytest.fixture
+def published(monkeypatch):
+    events = {"local": [], "feed": []}
+    monkeypatch.setattr(event_broadcaster, "publish", events["local"].append)
+    monkeypatch.setattr(changes.change_feed, "publish", events["feed"].append)
+    return events
+
+
+def _run(monkeypatch, order_id, counts):
+    operation = ChangeOperation(
+        name="test-event-change", scope="adds", kind="color", request_model=ColorChangeRequest,
+        apply=lambda request, targets: counts, success_message=lambda request: "ok", failure_message="failed",
+        values=lambda request: (request.old_colors, request.new_color), preflight=lambda request: None,
+    )
+    monkeypatch.setitem(changes.CHANGE_OPERATIONS, operation.name, operation)
+    request = ColorChangeRequest(order_id=order_id, new_color="Blue", new_colorgroup="RAL", old_colors=["Red"])
+    return execute_change(operation.name, request, origin="client-1")
+
+
+def test_change_is_announced_here_and_to_other_workers(monkeypatch, published):
+    _run(monkeypatch, 801, (3, 2))
+    assert published["local"] == published["feed"]
+    [event] = published["local"]
+    assert (event["order_id"], event["affected_rows"], event["origin"]) == (801, 2, "client-1")
+    assert last_change_at(801) is not None
+
+
+@pytest.mark.parametrize("counts", [(0, 0), (3, 0)])
+def test_change_without_rewritten_rows_is_not_announced(monkeypatch, published, counts):
+    data = _run(monkeypatch, 802, counts)
+    assert data["matched_rows"] == counts[0] and data["affected_rows"] == 0
+    assert published == {"local": [], "feed": []}
+    assert last_change_at(802) is None
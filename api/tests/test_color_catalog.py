@@ -0,0 +1,60 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from modules import routes
+from modules.catalog import catalog_cache
+from modules.models import ColorCatalog
+from modules.routes import router
+
+_ROWS = [
+    ("RAL", 12, "RAL 9003"),
+    ("RAL", 11, "RAL 9016"),
+    ("Дерево", 40, "Дуб"),
+    ("Дерево", 41, "Орех"),
+]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    loads = []
+
+    def rows():
+        loads.append(1)
+        return list(_ROWS)
+
+    monkeypatch.setattr(routes, "get_color_catalog_rows", rows)
+    catalog_cache.instance().invalidate()
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    yield TestClient(app), loads
+    catalog_cache.instance().invalidate()
+
+
+def test_colors_are_grouped_with_their_ids(client):
+    client, _ = client
+    response = client.get("/api/colors")
+    assert response.status_code == 200
+    assert response.json() == {"groups": [
+        {"title": "RAL", "colors": [[12, "RAL 9003"], [11, "RAL 9016"]]},
+        {"title": "Дерево", "colors": [[40, "Дуб"], [41, "Орех"]]},
+    ]}
+    ColorCatalog.model_validate_json(response.content)
+
+
+def test_catalog_is_loaded_once_and_revalidated_by_etag(client):
+    client, loads = client
+    first = client.get("/api/colors")
+    etag = first.headers["ETag"]
+    assert client.get("/api/colors").content == first.content
+    not_modified = client.get("/api/colors", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert len(loads) == 1
+
+
+def test_invalidated_catalog_is_reloaded(client):
+    client, loads = client
+    client.get("/api/colors")
+    catalog_cache.instance().invalidate("colors")
+    client.get("/api/colors")
+    assert len(loads) == 2
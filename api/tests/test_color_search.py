@@ -0,0 +1,129 @@
+import random
+import statistics
+import threading
+import time
+
+import pytest
+
+from modules.color_search import ColorSearch, ColorSearchIndex
+
+_ROWS = [
+    ("Дерево", 1, "Орех"),
+    ("Дерево", 2, "Орех итальянский"),
+    ("Дерево", 3, "Тёмный орех"),
+    ("Дерево", 4, "Ореховый"),
+    ("RAL", 5, "RAL 9016"),
+    ("RAL", 6, "RAL 9003"),
+    ("Дерево", 7, "Ёлка"),
+]
+
+
+def _titles(results):
+    return [row[2] for _, row in results]
+
+
+def test_exact_title_ranks_before_prefixes_and_inner_tokens():
+    results = ColorSearchIndex(_ROWS).search("ОРЕХ")
+    assert _titles(results) == ["Орех", "Ореховый", "Орех итальянский", "Тёмный орех"]
+    assert [score for score, _ in results] == [100.0, 80.0, 80.0, 60.0]
+
+
+def test_every_query_token_must_match():
+    assert _titles(ColorSearchIndex(_ROWS).search("тем ор")) == ["Тёмный орех"]
+
+
+def test_yo_is_searched_as_ye():
+    index = ColorSearchIndex(_ROWS)
+    assert _titles(index.search("елка")) == ["Ёлка"]
+    assert _titles(index.search("тёмн")) == ["Тёмный орех"]
+
+
+def test_substring_without_separators_and_typos_are_found():
+    index = ColorSearchIndex(_ROWS)
+    assert index.search("ral9016")[0] == (50.0, ("RAL", 5, "RAL 9016"))
+    assert index.search("9016")[0][1][2] == "RAL 9016"
+    fuzzy = index.search("ореж")
+    assert fuzzy and all(score < 50 for score, _ in fuzzy)
+
+
+def test_results_are_limited():
+    assert len(ColorSearchIndex(_ROWS).search("о", limit=2)) == 2
+    assert ColorSearchIndex(_ROWS).search("  ") == []
+
+
+def _synthetic_catalog(size):
+    rng = random.Random(35)
+    words = ["Орех", "Ореховый", "Дуб", "Сосна", "Белый", "Тёмный", "Светлый", "Венге", "Ясень", "Махагон"]
+    rows = []
+    for color_id in range(size):
+        if color_id % 4 == 0:
+            rows.append(("RAL", color_id, f"RAL {1000 + color_id}"))
+        else:
+            rows.append((f"Группа {color_id % 40}", color_id, f"{rng.choice(words)} {rng.choice(words)} {color_id}"))
+    return rows
+
+
+@pytest.mark.parametrize("query", ["орех", "ral 90", "орх", "тёмный дуб"])
+def test_search_over_the_whole_catalog_answers_within_5_ms(query):
+    index = ColorSearchIndex(_synthetic_catalog(8000))
+    index.search(query)  # Warm-up
+    timings = []
+    for _ in range(30):
+        started = time.perf_counter()
+        assert index.search(query)
+        timings.append(time.perf_counter() - started)
+    assert statistics.median(timings) < 0.005
+
+
+class _Catalog:
+    def __init__(self):
+        self.value = 1
+
+    def generation(self):
+        return self.value
+
+
+def test_stale_index_is_rebuilt_in_the_background():
+    catalog = _Catalog()
+    rows = [[("RAL", 1, "RAL 9016")]]
+    release = threading.Event()
+
+    def loader():
+        if len(rows) > 1:
+            release.wait(2)
+        return rows[-1]
+
+    search = ColorSearch(3600, loader, catalog, "default")
+    first = search.index()
+    rows.append([("RAL", 2, "RAL 9003")])
+    catalog.value = 2
+
+    # Searches keep using the old index while the new one is built
+    assert search.index() is first
+    release.set()
+    deadline = time.monotonic() + 2
+    while search.index() is first and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert _titles(search.index().search("ral")) == ["RAL 9003"]
+
+
+def test_failed_rebuild_keeps_the_previous_index():
+    catalog = _Catalog()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        if len(calls) > 1:
+            raise RuntimeError("connection lost")
+        return [("RAL", 1, "RAL 9016")]
+
+    search = ColorSearch(3600, loader, catalog, "default")
+    first = search.index()
+    catalog.value = 2
+    assert search.index() is first
+    deadline = time.monotonic() + 2
+    while len(calls) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    # Not retried right away, the old index is still served
+    assert search.index() is first and len(calls) == 2
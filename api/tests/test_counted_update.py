@@ -0,0 +1,111 @@
+import pytest
+
+from db import db_functions
+from db.db_functions import _update_counted
+from modules import changes
+from modules.models import ColorMappingRequest
+
+
+class _Cursor:
+    def __init__(self, con):
+        self.con = con
+
+    def execute(self, sql, params=()):
+        self.con.statements.append((sql, params))
+
+    def executemany(self, sql, rows):
+        self.con.selection.extend(rows)
+
+    def fetchone(self):
+        return self.con.counts
+
+    def close(self):
+        pass
+
+
+class _Connection:
+    """Checkout of a fake pool; the selection table exists"""
+
+    def __init__(self):
+        self.counts = (0, 0)
+        self.statements = []
+        self.selection = []
+        self.commits = 0
+        self.pool = type("Pool", (), {"features": {"selection_table": True}})()
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    con = _Connection()
+    monkeypatch.setattr(db_functions, "get_db_connection", lambda: con)
+    return con
+
+
+def test_block_counts_every_row_and_rewrites_only_differing_ones(connection):
+    connection.counts = (5, 2)
+    counts = _update_counted(
+        connection.cursor(), "ORDERS_ITEMS_ADDS_SETPARAMS", "oiasp", "COLORVALUEID", "?",
+        "WHERE oiasp.ID IN (SELECT ID FROM T WHERE ORDERID = ? AND TITLE = ?)", [42, 7, "Red"]
+    )
+    assert counts == (5, 2)
+    [(sql, params)] = connection.statements
+    assert params == (42, 7, "Red")
+    header, body = sql.split("RETURNS", 1)
+    assert "EXECUTE BLOCK (P1 INTEGER = ?, P2 INTEGER = ?, P3 VARCHAR(255) = ?)" in header
+    assert "?" not in body
+    assert "FOR SELECT oiasp.COLORVALUEID, :P1" in body and "ORDERID = :P2 AND TITLE = :P3" in body
+    assert "MATCHED_ROWS = MATCHED_ROWS + 1;" in body
+    assert "IF (NEW_VALUE IS DISTINCT FROM OLD_VALUE) THEN" in body
+    assert "UPDATE ORDERS_ITEMS_ADDS_SETPARAMS SET COLORVALUEID = :NEW_VALUE WHERE CURRENT OF TARGET_ROWS" in body
+
+
+def test_placeholders_must_match_the_parameters(connection):
+    with pytest.raises(ValueError, match="2 placeholders, 1 parameters"):
+        _update_counted(connection.cursor(), "T", "t", "C", "?", "WHERE t.ID = ?", [1])
+    assert connection.statements == []
+
+
+def test_color_change_reports_matched_and_changed_rows(connection):
+    # Two of the five rows already hold the new color
+    connection.counts = (5, 3)
+    assert db_functions.update_color_in_order(7, 42, ["Red", "Green"]) == (5, 3)
+    [(sql, params)] = connection.statements
+    # New color, order ID, then the list key of the old colors
+    assert params == (42, 7, "colors")
+    assert sorted(connection.selection) == [("colors", "Green"), ("colors", "Red")]
+    assert connection.commits == 1
+
+
+def test_breed_change_resolves_the_new_value_per_row(connection):
+    connection.counts = (4, 4)
+    assert db_functions.update_breed_in_stuffsets_orderitems(7, "дуб люкс", ["Сосна"]) == (4, 4)
+    [(sql, params)] = connection.statements
+    assert params == ("дуб люкс", 7, "breeds")
+    # The target breed is looked up in the TYPEID of each row
+    assert "WHERE ei.ID = oisp.ENUMVALUEID" in sql and "AND LOWER(TRIM(ei2.CODE)) = :P1" in sql
+    assert "UPDATE ORDERS_ITEMS_SETPARAMS SET ENUMVALUEID = :NEW_VALUE WHERE CURRENT OF TARGET_ROWS" in sql
+
+
+def test_response_separates_matched_from_changed_rows():
+    assert changes._row_counts(5, 2) == {"affected_rows": 2, "matched_rows": 5, "changed_rows": 2}
+    request = ColorMappingRequest(order_id=7, mappings=[
+        {"old_color": "Red", "new_color": "Blue", "new_colorgroup": "RAL"},
+        {"old_color": "Green", "new_color": "Blue", "new_colorgroup": "RAL"},
+    ])
+    data = changes._pair_rows(request, [(5, 2), (3, 0)])
+    assert (data["matched_rows"], data["changed_rows"], data["affected_rows"]) == (8, 2, 2)
+    assert [(pair["old_color"], pair["matched_rows"], pair["changed_rows"]) for pair in data["pairs"]] == [
+        ("Red", 5, 2), ("Green", 3, 0)
+    ]
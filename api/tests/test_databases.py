@@ -0,0 +1,85 @@
+import pytest
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from db.db_functions import db_pool
+from modules import routes
+from modules.catalog import catalog_cache
+from modules.config import DB_PROFILES
+from modules.databases import DatabaseRoutingMiddleware, UnknownDatabase, database_name, using_database
+from modules.routes import router
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+
+    @app.get("/api/where")
+    def where():
+        return {"database": database_name()}
+
+    @app.websocket("/ws")
+    async def websocket(ws: WebSocket):
+        await ws.accept()
+        await ws.send_json({"database": database_name()})
+        await ws.close()
+
+    app.add_middleware(DatabaseRoutingMiddleware)
+    return TestClient(app)
+
+
+def test_requests_without_a_selection_use_the_default_profile(client):
+    assert client.get("/api/where").json() == {"database": "default"}
+
+
+def test_path_prefix_selects_the_database_and_is_stripped(client):
+    assert client.get("/db/site2/api/where").json() == {"database": "site2"}
+    assert client.get("/db/default/api/where").json() == {"database": "default"}
+
+
+def test_header_selects_the_database(client):
+    assert client.get("/api/where", headers={"X-Database": "site2"}).json() == {"database": "site2"}
+
+
+def test_unknown_database_is_rejected(client):
+    response = client.get("/db/site9/api/where")
+    assert response.status_code == 404 and response.json() == {"detail": "Unknown database 'site9'"}
+    assert client.get("/api/where", headers={"X-Database": "site9"}).status_code == 404
+
+
+def test_websocket_selects_the_database_too(client):
+    with client.websocket_connect("/db/site2/ws") as ws:
+        assert ws.receive_json() == {"database": "site2"}
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect("/db/site9/ws") as ws:
+            ws.receive_json()
+    assert closed.value.code == 1008
+
+
+def test_each_profile_has_its_own_pool():
+    assert db_pool.get("site2") is not db_pool.get("default")
+    assert db_pool.get("site2").name == "site2"
+    assert DB_PROFILES["site2"]["database"] == "site2.fdb"
+    with using_database("site2"):
+        assert db_pool.instance() is db_pool.get("site2")
+    with pytest.raises(UnknownDatabase):
+        with using_database("site9"):
+            pass
+
+
+def test_catalogs_are_cached_per_database(monkeypatch):
+    monkeypatch.setattr(routes, "get_color_catalog_rows", lambda: [(database_name(), 1, "RAL 9016")])
+    for _, cache in catalog_cache.items():
+        cache.invalidate()
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    app.add_middleware(DatabaseRoutingMiddleware)
+    client = TestClient(app)
+    try:
+        assert client.get("/api/colors").json()["groups"][0]["title"] == "default"
+        assert client.get("/db/site2/api/colors").json()["groups"][0]["title"] == "site2"
+        assert client.get("/api/colors", headers={"X-Database": "site2"}).json()["groups"][0]["title"] == "site2"
+    finally:
+        for _, cache in catalog_cache.items():
+            cache.invalidate()
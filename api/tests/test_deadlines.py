@@ -0,0 +1,304 @@
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from db.pool import ConnectionPool
+from modules import changes, deadlines
+from modules.changes import ChangeOperation
+from modules.models import ColorChangeRequest
+from modules.routes import router
+from modules.deadlines import (
+    DeadlineExceeded, RequestDeadline, Watchdog, cap_timeout, current_deadline, deadline_middleware, route_budget
+)
+
+
+@pytest.fixture
+def deadline():
+    def set_deadline(budget):
+        request_deadline = RequestDeadline(budget)
+        tokens.append(current_deadline.set(request_deadline))
+        return request_deadline
+
+    tokens = []
+    yield set_deadline
+    for token in reversed(tokens):
+        current_deadline.reset(token)
+
+
+def _blocking_call(watchdog, cancel, seconds):
+    """Watched call that returns early once cancelled, like a cancelled statement"""
+    interrupted = threading.Event()
+
+    def cancel_call():
+        accepted = cancel()
+        if accepted:
+            interrupted.set()
+        return accepted
+
+    with watchdog.watch(cancel_call):
+        interrupted.wait(seconds)
+    return interrupted.is_set()
+
+
+def test_route_budget_uses_the_longest_prefix(monkeypatch):
+    monkeypatch.setattr(deadlines, "REQUEST_TIMEOUT", 30.0)
+    monkeypatch.setattr(deadlines, "ROUTE_TIMEOUTS", {"/api/": 10.0, "/api/jobs": 0.0})
+    assert route_budget("/api/change-color") == 10.0
+    assert route_budget("/api/jobs/1") == 0.0
+    assert route_budget("/health") == 30.0
+
+
+def test_cap_timeout_is_limited_by_the_remaining_budget(deadline):
+    assert cap_timeout(10) == 10
+    deadline(0.5)
+    assert 0.4 < cap_timeout(10) <= 0.5
+    assert cap_timeout(0.1) == 0.1
+
+
+def test_call_is_cancelled_when_the_deadline_passes(deadline):
+    watchdog = Watchdog()
+    request_deadline = deadline(0.05)
+    assert _blocking_call(watchdog, lambda: True, seconds=2)
+    assert request_deadline.expired and request_deadline.cancelled
+    assert (watchdog.cancelled, watchdog.cancel_failed) == (1, 0)
+
+
+def test_failed_cancel_is_not_reported_as_cancelled(deadline):
+    watchdog = Watchdog()
+    request_deadline = deadline(0.05)
+    assert not _blocking_call(watchdog, lambda: False, seconds=0.3)
+    assert request_deadline.expired and not request_deadline.cancelled
+    assert (watchdog.cancelled, watchdog.cancel_failed) == (0, 1)
+
+
+def test_cancel_error_counts_as_failed(deadline):
+    def broken_cancel():
+        raise OSError("no client library")
+
+    watchdog = Watchdog()
+    request_deadline = deadline(0.05)
+    assert not _blocking_call(watchdog, broken_cancel, seconds=0.3)
+    assert request_deadline.expired and not request_deadline.cancelled
+
+
+def test_finished_call_is_never_cancelled(deadline):
+    watchdog = Watchdog()
+    cancels = []
+    request_deadline = deadline(0.1)
+    with watchdog.watch(lambda: cancels.append(1) or True):
+        pass
+    time.sleep(0.2)
+    assert cancels == [] and not request_deadline.expired
+
+
+def test_call_after_the_budget_ran_out_does_not_start(deadline):
+    watchdog = Watchdog()
+    request_deadline = deadline(0)
+    with pytest.raises(DeadlineExceeded):
+        with watchdog.watch(lambda: True):
+            pytest.fail("block must not run")
+    assert request_deadline.cancelled
+
+
+def test_calls_without_a_deadline_are_not_watched():
+    watchdog = Watchdog()
+    with watchdog.watch(lambda: True):
+        pass
+    assert watchdog._thread is None
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(deadlines, "ROUTE_TIMEOUTS", {"/slow": 0.05})
+    monkeypatch.setattr(deadlines, "REQUEST_TIMEOUT", 5.0)
+    watchdog = Watchdog()
+    app = FastAPI()
+    app.middleware("http")(deadline_middleware)
+
+    def handler(cancel_accepted, fail):
+        if _blocking_call(watchdog, lambda: cancel_accepted, seconds=0.3) or fail:
+            return JSONResponse(status_code=500, content={"error": "statement failed"})
+        return {"success": True}
+
+    app.get("/slow/cancelled")(lambda: handler(True, True))
+    app.get("/slow/uncancelled")(lambda: handler(False, True))
+    app.get("/slow/finished")(lambda: handler(False, False))
+    app.get("/fast")(lambda: handler(True, True))
+    return TestClient(app)
+
+
+def test_cancelled_request_gets_504(client):
+    response = client.get("/slow/cancelled")
+    assert response.status_code == 504
+    assert "was cancelled" in response.json()["detail"]
+
+
+def test_uncancelled_failed_request_reports_unknown_outcome(client):
+    response = client.get("/slow/uncancelled")
+    assert response.status_code == 504
+    assert "outcome is unknown" in response.json()["detail"]
+
+
+def test_request_that_succeeded_late_keeps_its_answer(client):
+    assert client.get("/slow/finished").json() == {"success": True}
+
+
+def test_failure_within_the_budget_keeps_its_status(client):
+    assert client.get("/fast").status_code == 500
+
+
+class _Statement:
+    """Change statement of a fake operation: slow ones run until cancelled and fail with the DB error"""
+
+    def __init__(self):
+        self.slow = True
+        self.cancel_accepted = True
+        self.error = None
+        self.runs = 0
+
+    def apply(self, request, targets):
+        self.runs += 1
+        if self.error is not None:
+            raise self.error
+        if not self.slow:
+            return 2, 1
+        interrupted = threading.Event()
+
+        def cancel():
+            interrupted.set()
+            return self.cancel_accepted
+
+        with deadlines.watchdog.watch(cancel):
+            interrupted.wait(2)
+        raise RuntimeError("operation was cancelled" if self.cancel_accepted else "lock conflict on no wait")
+
+
+@pytest.fixture
+def change_client(monkeypatch):
+    statement = _Statement()
+    operation = ChangeOperation(
+        name="change-color", scope="adds", kind="color", request_model=ColorChangeRequest,
+        apply=statement.apply, success_message=lambda request: "Color changed",
+        failure_message="Failed to update color",
+        values=lambda request: (request.old_colors, request.new_color), preflight=lambda request: None,
+    )
+    monkeypatch.setitem(changes.CHANGE_OPERATIONS, "change-color", operation)
+    # Room for the request to reach the statement before its budget runs out
+    monkeypatch.setattr(deadlines, "ROUTE_TIMEOUTS", {"/api/change-color": 0.5})
+    app = FastAPI()
+    app.middleware("http")(deadline_middleware)
+    app.include_router(router, prefix="/api")
+    return TestClient(app), statement
+
+
+def _change(client, order_id, key=None):
+    return client.post(
+        "/api/change-color",
+        json={"order_id": order_id, "new_color": "Blue", "new_colorgroup": "RAL", "old_colors": ["Red"]},
+        headers={"Idempotency-Key": key} if key else {},
+    )
+
+
+def test_cancelled_change_gets_504(change_client):
+    client, _ = change_client
+    response = _change(client, 701)
+    assert response.status_code == 504
+    assert "was cancelled" in response.json()["detail"]
+
+
+def test_uncancelled_change_gets_504_with_unknown_outcome(change_client):
+    client, statement = change_client
+    statement.cancel_accepted = False
+    response = _change(client, 702)
+    assert response.status_code == 504
+    assert "outcome is unknown" in response.json()["detail"]
+
+
+def test_timed_out_change_is_not_stored_for_its_idempotency_key(change_client):
+    client, statement = change_client
+    assert _change(client, 703, key="deadline-703").status_code == 504
+    statement.slow = False
+    response = _change(client, 703, key="deadline-703")
+    assert response.status_code == 200 and response.json()["success"] is True
+    assert response.headers["Idempotent-Replayed"] == "false"
+    assert statement.runs == 2
+
+
+def test_change_failing_within_its_budget_keeps_its_answer(change_client, monkeypatch):
+    client, statement = change_client
+    monkeypatch.setattr(deadlines, "ROUTE_TIMEOUTS", {"/api/change-color": 5.0})
+    statement.error = RuntimeError("violation of FOREIGN KEY constraint")
+    response = _change(client, 704)
+    assert response.status_code == 200
+    assert response.json()["success"] is False
+
+
+class _Connection:
+    """DB connection whose statements run until they are cancelled from another thread"""
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self.rollbacks = 0
+        self.closed = False
+        self.pending = []  # statements of the open transaction
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def cancel(self):
+        self.cancelled.set()
+        return True
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.pending.clear()
+
+    def commit(self):
+        self.pending.clear()
+
+    def close(self):
+        self.closed = True
+
+
+class _Cursor:
+    def __init__(self, con):
+        self.con = con
+
+    def execute(self, sql, parameters=None):
+        self.con.pending.append(sql)
+        if sql.startswith("UPDATE") and self.con.cancelled.wait(2):
+            raise RuntimeError("operation was cancelled")
+
+    def close(self):
+        pass
+
+
+def test_cancelled_statement_leaves_a_clean_connection_in_the_pool(deadline):
+    connections = []
+
+    def connect():
+        connections.append(_Connection())
+        return connections[-1]
+
+    pool = ConnectionPool(connect, size=1, timeout=1, trace_context=False, cancel=lambda con: con.cancel())
+    request_deadline = deadline(0.05)
+    with pytest.raises(RuntimeError):
+        with pool.acquire() as con:
+            cur = con.cursor()
+            cur.execute("UPDATE ORDERITEMS SET COLORID = 1")
+    assert request_deadline.cancelled
+    [con] = connections
+    assert con.rollbacks == 1 and con.pending == [] and not con.closed
+    metrics = pool.metrics()
+    assert (metrics["in_use"], metrics["idle"]) == (0, 1)
+
+    # The next checkout reuses the rolled back connection
+    con.cancelled.clear()
+    deadline(5)
+    with pool.acquire() as reused:
+        reused.cursor().execute("SELECT 1 FROM RDB$DATABASE")
+    assert len(connections) == 1 and con.rollbacks == 2
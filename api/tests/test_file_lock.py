@@ -0,0 +1,51 @@
+import multiprocessing
+
+from modules.file_lock import release_lock, try_lock
+
+
+def _try_in_child(path, results):
+    handle = try_lock(path)
+    results.put(handle is not None)
+    if handle is not None:
+        release_lock(handle)
+
+
+def _locked_by_another_process(path):
+    results = multiprocessing.Queue()
+    child = multiprocessing.Process(target=_try_in_child, args=(path, results))
+    child.start()
+    child.join(10)
+    return not results.get(timeout=10)
+
+
+def test_lock_excludes_other_processes_until_released(tmp_path):
+    path = str(tmp_path / "order-1.lock")
+    handle = try_lock(path)
+    assert handle is not None
+    assert _locked_by_another_process(path)
+    release_lock(handle)
+    assert not _locked_by_another_process(path)
+
+
+def test_second_handle_is_refused(tmp_path):
+    path = str(tmp_path / "order-1.lock")
+    handle = try_lock(path)
+    assert try_lock(path) is None
+    release_lock(handle)
+    again = try_lock(path)
+    assert again is not None
+    release_lock(again)
+
+
+def test_locks_of_different_files_are_independent(tmp_path):
+    first = try_lock(str(tmp_path / "order-1.lock"))
+    second = try_lock(str(tmp_path / "order-2.lock"))
+    assert first is not None and second is not None
+    release_lock(first)
+    release_lock(second)
+
+
+def test_release_closes_the_handle(tmp_path):
+    handle = try_lock(str(tmp_path / "order-1.lock"))
+    release_lock(handle)
+    assert handle.closed
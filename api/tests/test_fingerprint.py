@@ -0,0 +1,94 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from db import db_functions
+from modules import routes
+from modules.order_cache import order_cache
+from modules.routes import router
+
+
+@pytest.fixture
+def order(monkeypatch):
+    state = {"row": (4, 123456), "color_loads": 0}
+
+    def colors(order_id):
+        state["color_loads"] += 1
+        return [("Белый", 4, 2)]
+
+    monkeypatch.setattr(routes, "get_order_fingerprint_row", lambda order_id: state["row"])
+    monkeypatch.setattr(routes, "get_order_colors_rows", colors)
+    order_cache.instance().clear()
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    yield TestClient(app), state
+    order_cache.instance().clear()
+
+
+def test_fingerprint_is_stable_while_the_rows_are(order):
+    client, state = order
+    first = client.get("/api/orders/9/fingerprint")
+    assert first.status_code == 200
+    body = first.json()
+    assert body["order_id"] == 9 and body["rows"] == 4 and len(body["fingerprint"]) == 16
+    assert client.get("/api/orders/9/fingerprint").json()["fingerprint"] == body["fingerprint"]
+    assert client.get("/api/orders/9/fingerprint", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+
+    state["row"] = (4, 654321)
+    assert client.get("/api/orders/9/fingerprint").json()["fingerprint"] != body["fingerprint"]
+
+
+def test_changed_fingerprint_drops_cached_reads_of_the_order(order):
+    client, state = order
+    client.get("/api/orders/9/fingerprint")
+    client.get("/api/orders/9/colors")
+    client.get("/api/orders/9/colors")
+    assert state["color_loads"] == 1
+
+    # Same fingerprint: the cached reads are still current
+    client.get("/api/orders/9/fingerprint")
+    client.get("/api/orders/9/colors")
+    assert state["color_loads"] == 1
+
+    # Edited in Altawin
+    state["row"] = (5, 777)
+    client.get("/api/orders/9/fingerprint")
+    client.get("/api/orders/9/colors")
+    assert state["color_loads"] == 2
+
+
+class _Cursor:
+    def __init__(self, statements):
+        self.statements = statements
+
+    def execute(self, sql, params=()):
+        self.statements.append((sql, params))
+
+    def fetchone(self):
+        return (4, 123456)
+
+    def close(self):
+        pass
+
+
+class _Connection:
+    def __init__(self):
+        self.statements = []
+
+    def cursor(self):
+        return _Cursor(self.statements)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def test_fingerprint_covers_adds_and_stuffsets_in_one_query(monkeypatch):
+    con = _Connection()
+    monkeypatch.setattr(db_functions, "get_db_connection", lambda: con)
+    assert db_functions.get_order_fingerprint_row(9) == (4, 123456)
+    [(sql, params)] = con.statements
+    assert params == (9, 9)
+    assert "ORDERS_ITEMS_ADDS_SETPARAMS" in sql and "ORDERS_ITEMS_SETPARAMS" in sql and "UNION ALL" in sql
@@ -0,0 +1,138 @@
+import threading
+import time
+
+import pytest
+
+from modules.idempotency import IdempotencyError, IdempotencyStore, request_fingerprint
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = IdempotencyStore(str(tmp_path / "idempotency.sqlite3"), ttl=3600, max_keys=100, wait_timeout=2)
+    yield store
+    store.close()
+
+
+def _counting(result=(200, {"affected_rows": 3}), store=True):
+    calls = []
+
+    def call():
+        calls.append(1)
+        return result[0], result[1], store
+    return call, calls
+
+
+def test_repeated_request_replays_the_stored_result(store):
+    fingerprint = request_fingerprint("change-color", {"order_id": 1})
+    call, calls = _counting()
+    assert store.run("key-1", fingerprint, call) == (200, {"affected_rows": 3}, False)
+    assert store.run("key-1", fingerprint, call) == (200, {"affected_rows": 3}, True)
+    assert len(calls) == 1
+    assert store.metrics()["replays"] == 1
+
+
+def test_key_reused_for_another_request_is_rejected(store):
+    call, calls = _counting()
+    store.run("key-1", request_fingerprint("change-color", {"order_id": 1}), call)
+    with pytest.raises(IdempotencyError) as error:
+        store.run("key-1", request_fingerprint("change-color", {"order_id": 2}), call)
+    assert error.value.status_code == 422
+    assert len(calls) == 1
+
+
+def test_fingerprint_ignores_key_order():
+    assert request_fingerprint("op", {"a": 1, "b": 2}) == request_fingerprint("op", {"b": 2, "a": 1})
+    assert request_fingerprint("op", {"a": 1}) != request_fingerprint("other", {"a": 1})
+
+
+def test_results_not_marked_for_storing_run_again(store):
+    call, calls = _counting(result=(409, {"error": "conflict"}), store=False)
+    store.run("key-1", "f", call)
+    assert store.run("key-1", "f", call)[2] is False
+    assert len(calls) == 2
+
+
+def test_failed_request_releases_the_key(store):
+    def failing():
+        raise RuntimeError("db error")
+
+    with pytest.raises(RuntimeError):
+        store.run("key-1", "f", failing)
+    call, calls = _counting()
+    assert store.run("key-1", "f", call)[2] is False
+    assert len(calls) == 1
+    assert store.metrics()["in_flight"] == 0
+
+
+def test_duplicate_waits_for_the_running_request(store):
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(2)
+        return 200, {"affected_rows": 1}, True
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(store.run("key-1", "f", slow)))
+    first.start()
+    while not store.metrics()["in_flight"]:
+        time.sleep(0.005)
+    duplicate = threading.Thread(target=lambda: results.append(store.run("key-1", "f", slow)))
+    duplicate.start()
+    time.sleep(0.05)
+    release.set()
+    first.join(2)
+    duplicate.join(2)
+
+    assert len(calls) == 1
+    assert sorted(result[2] for result in results) == [False, True]
+    assert store.metrics()["waits"] == 1
+
+
+def test_duplicate_gives_up_while_the_request_still_runs(tmp_path):
+    store = IdempotencyStore(str(tmp_path / "idempotency.sqlite3"), ttl=3600, max_keys=100, wait_timeout=0.1)
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(2)
+        return 200, {}, True
+
+    first = threading.Thread(target=lambda: store.run("key-1", "f", slow))
+    first.start()
+    while not store.metrics()["in_flight"]:
+        time.sleep(0.005)
+    try:
+        with pytest.raises(IdempotencyError) as error:
+            store.run("key-1", "f", slow)
+        assert error.value.status_code == 409
+        assert len(calls) == 1
+    finally:
+        release.set()
+        first.join(2)
+        store.close()
+
+
+def test_claims_are_shared_between_processes(tmp_path):
+    # Two stores on one file stand for two worker processes
+    path = str(tmp_path / "idempotency.sqlite3")
+    worker_a = IdempotencyStore(path, ttl=3600, max_keys=100, wait_timeout=2)
+    worker_b = IdempotencyStore(path, ttl=3600, max_keys=100, wait_timeout=2)
+    call, calls = _counting()
+    worker_a.run("key-1", "f", call)
+    assert worker_b.run("key-1", "f", call) == (200, {"affected_rows": 3}, True)
+    assert len(calls) == 1
+    worker_a.close()
+    worker_b.close()
+
+
+def test_expired_result_runs_again(tmp_path):
+    store = IdempotencyStore(str(tmp_path / "idempotency.sqlite3"), ttl=0, max_keys=100, wait_timeout=2)
+    call, calls = _counting()
+    store.run("key-1", "f", call)
+    time.sleep(0.01)
+    assert store.run("key-1", "f", call)[2] is False
+    assert len(calls) == 2
+    store.close()
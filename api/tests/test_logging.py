@@ -0,0 +1,78 @@
+import json
+import logging
+import logging.handlers
+import queue
+
+from modules.logging_config import JsonFormatter, RequestIdFilter, SamplingFilter, _QueueHandler, request_id_var
+
+
+class _Capture(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+def _logger_through_queue(name):
+    """Logger -> queue handler -> background listener -> JSON lines, as setup_logging wires it"""
+    log_queue = queue.SimpleQueue()
+    handler = _QueueHandler(log_queue)
+    handler.addFilter(RequestIdFilter())
+    capture = _Capture()
+    capture.setFormatter(JsonFormatter())
+    listener = logging.handlers.QueueListener(log_queue, capture)
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    return logger, listener, capture
+
+
+def test_records_are_written_as_json_with_request_id_and_extra_fields():
+    logger, listener, capture = _logger_through_queue("tests.logging.json")
+    listener.start()
+    token = request_id_var.set("req-1")
+    try:
+        logger.info("Заказ %s изменён", 42, extra={"change": {"order_id": 42}})
+    finally:
+        request_id_var.reset(token)
+    listener.stop()
+
+    [line] = capture.lines
+    entry = json.loads(line)
+    assert (entry["level"], entry["logger"], entry["request_id"]) == ("INFO", "tests.logging.json", "req-1")
+    assert entry["msg"] == "Заказ 42 изменён"
+    assert entry["change"] == {"order_id": 42}
+
+
+def test_traceback_is_formatted_before_the_record_leaves_the_thread():
+    logger, listener, capture = _logger_through_queue("tests.logging.exc")
+    listener.start()
+    try:
+        raise RuntimeError("db down")
+    except RuntimeError:
+        logger.exception("Ошибка подключения к БД")
+    listener.stop()
+
+    entry = json.loads(capture.lines[0])
+    assert entry["msg"] == "Ошибка подключения к БД"
+    assert "RuntimeError: db down" in entry["exc"]
+
+
+def test_debug_records_are_sampled_per_message():
+    sampling = SamplingFilter(0.25)
+
+    def kept(msg):
+        return sampling.filter(logging.LogRecord("db", logging.DEBUG, "", 0, msg, (), None))
+
+    assert [kept("UPDATE SQL: %s") for _ in range(8)].count(True) == 2
+    assert kept("UPDATE parameters: %s")
+    assert sampling.filter(logging.LogRecord("db", logging.INFO, "", 0, "UPDATE SQL: %s", (), None))
+
+
+def test_zero_rate_drops_debug_records():
+    sampling = SamplingFilter(0)
+    assert not sampling.filter(logging.LogRecord("db", logging.DEBUG, "", 0, "x", (), None))
+    assert sampling.filter(logging.LogRecord("db", logging.WARNING, "", 0, "x", (), None))
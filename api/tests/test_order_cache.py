@@ -0,0 +1,143 @@
+import threading
+import time
+
+import pytest
+
+from modules import changes
+from modules.changes import ChangeOperation, execute_change
+from modules.models import ColorChangeRequest
+from modules.order_cache import OrderCache, order_cache
+from modules.single_flight import SingleFlight, single_flight
+
+
+def test_cached_until_invalidated():
+    cache = OrderCache(max_orders=10, ttl=60)
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return b"v%d" % len(loads)
+
+    assert cache.get(1, "info", loader) == b"v1"
+    assert cache.get(1, "info", loader) == b"v1"
+    cache.invalidate(1)
+    assert cache.get(1, "info", loader) == b"v2"
+    metrics = cache.metrics()
+    assert (metrics["hits"], metrics["misses"], metrics["invalidations"]) == (1, 2, 1)
+
+
+def test_invalidate_drops_every_resource_of_the_order_only():
+    cache = OrderCache(max_orders=10, ttl=60)
+    cache.get(1, "info", lambda: b"info")
+    cache.get(1, "colors", lambda: b"colors")
+    cache.get(2, "info", lambda: b"other order")
+    cache.invalidate(1)
+    assert cache.get(1, "info", lambda: b"new info") == b"new info"
+    assert cache.get(1, "colors", lambda: b"new colors") == b"new colors"
+    assert cache.get(2, "info", lambda: b"reloaded") == b"other order"
+
+
+def test_expired_reads_are_reloaded():
+    cache = OrderCache(max_orders=10, ttl=0.05)
+    cache.get(1, "info", lambda: b"old")
+    time.sleep(0.06)
+    assert cache.get(1, "info", lambda: b"new") == b"new"
+    assert cache.metrics()["expired"] == 1
+
+
+def test_least_recently_used_order_is_evicted():
+    cache = OrderCache(max_orders=2, ttl=60)
+    cache.get(1, "info", lambda: b"1")
+    cache.get(2, "info", lambda: b"2")
+    cache.get(1, "info", lambda: b"reloaded")
+    cache.get(3, "info", lambda: b"3")
+    assert cache.get(1, "info", lambda: b"reloaded") == b"1"
+    assert cache.get(2, "info", lambda: b"reloaded") == b"reloaded"
+    assert cache.metrics()["evictions"] >= 1
+
+
+def test_load_started_before_invalidation_is_not_stored():
+    cache = OrderCache(max_orders=10, ttl=60)
+
+    def stale_loader():
+        # The order changes while its read is running
+        cache.invalidate(1)
+        return b"before change"
+
+    assert cache.get(1, "info", stale_loader) == b"before change"
+    assert cache.get(1, "info", lambda: b"after change") == b"after change"
+
+
+def test_changed_fingerprint_drops_cached_reads():
+    cache = OrderCache(max_orders=10, ttl=60)
+    cache.get(1, "info", lambda: b"old")
+    cache.check_fingerprint(1, "a")
+    cache.check_fingerprint(1, "a")
+    assert cache.get(1, "info", lambda: b"new") == b"old"
+    cache.check_fingerprint(1, "b")
+    assert cache.get(1, "info", lambda: b"new") == b"new"
+
+
+def test_read_in_flight_during_a_change_is_not_served_afterwards():
+    # Composition used by the read endpoints: order cache over single-flight
+    cache = OrderCache(max_orders=10, ttl=60)
+    flight = SingleFlight(metric_keys=10)
+    key = "default:order:1:info"
+    started = threading.Event()
+    release = threading.Event()
+    results = []
+
+    def stale_loader():
+        started.set()
+        release.wait(2)
+        return b"before change"
+
+    def read():
+        results.append(cache.get(1, "info", lambda: flight.do(key, stale_loader)))
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    started.wait(2)
+    # Post-commit steps of a change, in the order execute_change runs them
+    flight.forget("default:order:1:")
+    cache.invalidate(1)
+    assert cache.get(1, "info", lambda: flight.do(key, lambda: b"after change")) == b"after change"
+    release.set()
+    reader.join(2)
+    assert results == [b"before change"]
+    assert cache.get(1, "info", lambda: b"reloaded") == b"after change"
+
+
+def test_execute_change_invalidates_the_order(monkeypatch):
+    operation = ChangeOperation(
+        name="test-change", scope="adds", kind="color", request_model=ColorChangeRequest,
+        apply=lambda request, targets: (2, 1), success_message=lambda request: "ok", failure_message="failed",
+        values=lambda request: (request.old_colors, request.new_color), preflight=lambda request: None,
+    )
+    monkeypatch.setitem(changes.CHANGE_OPERATIONS, operation.name, operation)
+    request = ColorChangeRequest(order_id=501, new_color="Blue", new_colorgroup="Group", old_colors=["Red"])
+    cache = order_cache.instance()
+    cache.get(501, "colors", lambda: b"before change")
+
+    assert execute_change(operation.name, request)["affected_rows"] == 1
+    assert cache.get(501, "colors", lambda: b"after change") == b"after change"
+    assert single_flight.metrics()["in_flight"] == 0
+
+
+def test_failed_change_still_invalidates_the_order(monkeypatch):
+    def apply(request, targets):
+        raise RuntimeError("update failed after some statements")
+
+    operation = ChangeOperation(
+        name="test-failing-change", scope="adds", kind="color", request_model=ColorChangeRequest,
+        apply=apply, success_message=lambda request: "ok", failure_message="failed",
+        values=lambda request: (request.old_colors, request.new_color), preflight=lambda request: None,
+    )
+    monkeypatch.setitem(changes.CHANGE_OPERATIONS, operation.name, operation)
+    request = ColorChangeRequest(order_id=502, new_color="Blue", new_colorgroup="Group", old_colors=["Red"])
+    cache = order_cache.instance()
+    cache.get(502, "colors", lambda: b"before change")
+
+    with pytest.raises(RuntimeError):
+        execute_change(operation.name, request)
+    assert cache.get(502, "colors", lambda: b"reloaded") == b"reloaded"
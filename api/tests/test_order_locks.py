@@ -0,0 +1,132 @@
+import threading
+import time
+
+import pytest
+
+from modules.deadlines import RequestDeadline, current_deadline
+from modules.order_locks import OrderLockManager, OrderLockTimeout
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def test_different_orders_do_not_wait():
+    locks = OrderLockManager(timeout=1)
+    with locks.hold(1):
+        started = time.monotonic()
+        with locks.hold(2, timeout=0.5):
+            assert time.monotonic() - started < 0.1
+    assert locks.metrics()["contended"] == 0
+
+
+def test_same_order_is_granted_in_arrival_order():
+    locks = OrderLockManager(timeout=5)
+    granted = []
+
+    def change(name):
+        with locks.hold(7):
+            granted.append(name)
+
+    threads = []
+    with locks.hold(7):
+        for waiting, name in enumerate(["first", "second", "third"], start=1):
+            thread = threading.Thread(target=change, args=(name,))
+            thread.start()
+            threads.append(thread)
+            _wait_for(lambda: locks.metrics()["waiting"] == waiting)
+    for thread in threads:
+        thread.join(2)
+
+    assert granted == ["first", "second", "third"]
+    metrics = locks.metrics()
+    assert metrics["max_queue_depth"] == 3
+    assert metrics["locked_orders"] == 0
+
+
+def test_timeout_leaves_the_queue():
+    locks = OrderLockManager(timeout=5)
+    with locks.hold(3):
+        errors = []
+        thread = threading.Thread(target=lambda: _hold_or_record(locks, 3, 0.05, errors))
+        thread.start()
+        thread.join(2)
+        assert len(errors) == 1 and errors[0].order_id == 3
+        assert locks.metrics()["waiting"] == 0
+    metrics = locks.metrics()
+    assert (metrics["locked_orders"], metrics["timeouts"], metrics["acquired"]) == (0, 1, 1)
+
+
+def _hold_or_record(locks, order_id, timeout, errors):
+    try:
+        with locks.hold(order_id, timeout=timeout):
+            pass
+    except OrderLockTimeout as e:
+        errors.append(e)
+
+
+def test_exception_in_block_releases_the_lock():
+    locks = OrderLockManager(timeout=1)
+    with pytest.raises(RuntimeError):
+        with locks.hold(4):
+            raise RuntimeError("update failed")
+    with locks.hold(4, timeout=0.05):
+        pass
+
+
+def test_wait_is_capped_by_request_deadline():
+    locks = OrderLockManager(timeout=10)
+    errors = []
+
+    def waiter():
+        token = current_deadline.set(RequestDeadline(0.1))
+        try:
+            _hold_or_record(locks, 5, None, errors)
+        finally:
+            current_deadline.reset(token)
+
+    with locks.hold(5):
+        started = time.monotonic()
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        thread.join(2)
+    assert errors and time.monotonic() - started < 1
+
+
+def test_lock_file_excludes_other_processes(tmp_path):
+    # Each manager opens its own handle of the lock file, as another worker process would
+    worker_a = OrderLockManager(timeout=1, directory=str(tmp_path), files=256)
+    worker_b = OrderLockManager(timeout=1, directory=str(tmp_path), files=256)
+    other = next(order_id for order_id in range(10, 100)
+                 if worker_a.lock_file_number(order_id) != worker_a.lock_file_number(9))
+    with worker_a.hold(9):
+        assert (tmp_path / f"orders-{worker_a.lock_file_number(9):03d}.lock").exists()
+        with pytest.raises(OrderLockTimeout):
+            with worker_b.hold(9, timeout=0.1):
+                pass
+        with worker_b.hold(other, timeout=0.1):
+            pass
+    with worker_b.hold(9, timeout=0.1):
+        pass
+
+
+def test_orders_of_one_lock_file_wait_for_each_other_across_processes(tmp_path):
+    worker_a = OrderLockManager(timeout=1, directory=str(tmp_path), files=1)
+    worker_b = OrderLockManager(timeout=1, directory=str(tmp_path), files=1)
+    with worker_a.hold(1):
+        with pytest.raises(OrderLockTimeout):
+            with worker_b.hold(2, timeout=0.1):
+                pass
+
+
+def test_lock_directory_stays_bounded(tmp_path):
+    locks = OrderLockManager(timeout=1, directory=str(tmp_path), files=4)
+    for order_id in range(100):
+        with locks.hold(order_id):
+            pass
+    assert len(list(tmp_path.iterdir())) <= 4
+    # The same order always maps to the same file
+    assert locks.lock_file_number("A-17") == OrderLockManager(1, str(tmp_path), files=4).lock_file_number("A-17")
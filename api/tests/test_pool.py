@@ -0,0 +1,155 @@
+import re
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from db.pool import ConnectionPool, PoolTimeout
+from modules.serialization import encode_rows
+from modules.tracing import server_timing_middleware
+
+
+class _Cursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, sql, parameters=None):
+        if self.connection.broken:
+            raise RuntimeError("connection shutdown")
+        self.connection.statements.append(sql)
+
+    def fetchone(self):
+        return (1,)
+
+    def fetchall(self):
+        return [("Белый", 2, 1)]
+
+    def close(self):
+        pass
+
+
+class _Connection:
+    def __init__(self, number):
+        self.number = number
+        self.broken = False
+        self.closed = False
+        self.rollbacks = 0
+        self.statements = []
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        if self.broken:
+            raise RuntimeError("connection shutdown")
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def connections():
+    return []
+
+
+@pytest.fixture
+def pool(connections):
+    def connect():
+        connections.append(_Connection(len(connections) + 1))
+        return connections[-1]
+
+    return ConnectionPool(connect, size=2, timeout=0.1, trace_context=False)
+
+
+def test_released_connection_is_rolled_back_and_reused(pool, connections):
+    with pool.acquire() as con:
+        con.cursor().execute("UPDATE T SET X = 1")
+    with pool.acquire():
+        pass
+    assert len(connections) == 1 and connections[0].rollbacks == 2
+    metrics = pool.metrics()
+    assert (metrics["created"], metrics["checkouts"], metrics["in_use"], metrics["idle"]) == (1, 2, 0, 1)
+
+
+def test_connections_in_use_are_not_shared(pool, connections):
+    with pool.acquire() as first, pool.acquire() as second:
+        assert first._con is not second._con
+        assert pool.metrics()["in_use"] == 2
+    assert pool.metrics()["idle"] == 2
+
+
+def test_checkout_times_out_when_the_pool_is_exhausted(pool):
+    with pool.acquire(), pool.acquire():
+        with pytest.raises(PoolTimeout):
+            pool.acquire(timeout=0.05)
+    assert pool.metrics()["timeouts"] == 1
+    with pool.acquire():
+        pass  # The slots were given back
+
+
+def test_connection_broken_during_use_is_replaced(pool, connections):
+    with pytest.raises(RuntimeError):
+        with pool.acquire() as con:
+            connections[0].broken = True
+            con.cursor().execute("SELECT 1 FROM RDB$DATABASE")
+    assert connections[0].closed and pool.metrics()["discarded"] == 1
+
+    with pool.acquire() as con:
+        assert con._con is connections[1]
+    assert pool.metrics()["created"] == 2
+
+
+def test_idle_connection_failing_its_ping_is_replaced(pool, connections):
+    pool.ping_after = 0
+    with pool.acquire():
+        pass
+    connections[0].broken = True
+    with pool.acquire() as con:
+        assert con._con is connections[1]
+    assert connections[0].closed
+    metrics = pool.metrics()
+    assert (metrics["created"], metrics["discarded"], metrics["idle"]) == (2, 1, 1)
+
+
+def test_failed_connect_gives_its_slot_back():
+    attempts = []
+
+    def connect():
+        attempts.append(1)
+        raise RuntimeError("unavailable database")
+
+    pool = ConnectionPool(connect, size=1, timeout=0.05, trace_context=False)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            pool.acquire()
+    assert len(attempts) == 2 and pool.metrics()["timeouts"] == 0
+
+
+def test_closed_pool_drops_connections_when_they_are_released(pool, connections):
+    con = pool.acquire()
+    pool.close()
+    con.close()
+    assert connections[0].closed and pool.metrics()["idle"] == 0
+
+
+def test_server_timing_breaks_the_request_down(pool):
+    app = FastAPI()
+    app.middleware("http")(server_timing_middleware)
+
+    @app.get("/colors")
+    def get_order_colors():
+        with pool.acquire() as con:
+            cur = con.cursor()
+            cur.execute("SELECT TITLE FROM COLORS")
+            rows = cur.fetchall()
+        return encode_rows(("title", "count", "item_count"), rows).decode("utf-8")
+
+    header = TestClient(app).get("/colors").headers["Server-Timing"]
+    names = [part.split(";")[0] for part in header.split(", ")]
+    assert names == ["pool", "sql-1", "ser", "total"]
+    assert 'sql-1;dur=' in header and 'desc="get_order_colors"' in header
+    assert all(re.search(r"dur=\d+\.\d", part) for part in header.split(", "))
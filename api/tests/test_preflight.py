@@ -0,0 +1,157 @@
+import pytest
+
+from modules import changes, preflight
+from modules.changes import ChangeOperation, execute_change
+from modules.models import ColorChangeRequest
+from modules.order_locks import order_locks
+from modules.preflight import PreflightError, TargetCatalog, breed_key, check_breed_targets, check_color_targets
+
+COLORS = [
+    ("RAL", 1, "White"),
+    ("RAL", 2, "White matt"),
+    ("Wood", 3, "Oak"),
+    ("Wood decor", 4, "Oak"),
+]
+ENUM_ITEMS = [
+    (10, 1, "Pine"),
+    (11, 1, "Oak "),
+    (20, 2, "pine"),
+    (30, 3, "Oak"),
+    (31, 3, "OAK"),
+]
+
+
+class _NoSnapshot:
+    def __init__(self):
+        self.generation_number = 0
+
+    def generation(self):
+        return self.generation_number
+
+    def current(self):
+        return None
+
+
+class _Catalogs:
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def instance(self):
+        return self.catalog
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    counter = []
+    monkeypatch.setattr(preflight, "get_color_catalog_rows", lambda: counter.append(1) or COLORS)
+    monkeypatch.setattr(preflight, "get_breed_enum_items_rows", lambda: ENUM_ITEMS)
+    monkeypatch.setattr(preflight, "target_catalog", _Catalogs(TargetCatalog(ttl=300, catalog=_NoSnapshot())))
+    return counter
+
+
+@pytest.fixture
+def order_rows(monkeypatch):
+    rows = []
+    monkeypatch.setattr(preflight, "get_order_breed_types_rows", lambda order_id, scope: rows)
+    return rows
+
+
+def test_breed_key_normalizes_codes():
+    assert breed_key("  Oak ") == "oak"
+
+
+def test_colors_resolve_to_ids(loads):
+    assert check_color_targets([("White", "RAL"), ("Oak", "Wood decor")]) == [1, 4]
+
+
+def test_substring_match_is_used_when_there_is_no_exact_one(loads):
+    assert check_color_targets([("matt", "RAL")]) == [2]
+
+
+def test_unknown_and_ambiguous_colors_are_rejected_together(loads):
+    with pytest.raises(PreflightError) as error:
+        check_color_targets([("Black", "RAL"), ("Oak", "Wood"), ("Whit", "RAL")])
+    problems = error.value.problems
+    assert [problem["reason"] for problem in problems] == ["unknown_color", "ambiguous_color"]
+    assert [candidate["color_id"] for candidate in problems[1]["candidates"]] == [1, 2]
+
+
+def test_catalog_is_loaded_once_within_its_ttl(loads):
+    check_color_targets([("White", "RAL")])
+    check_color_targets([("Oak", "Wood decor")])
+    assert len(loads) == 1
+    preflight.target_catalog.instance().invalidate()
+    check_color_targets([("White", "RAL")])
+    assert len(loads) == 2
+
+
+def test_new_snapshot_generation_rebuilds_the_catalog(loads):
+    catalog = preflight.target_catalog.instance()
+    check_color_targets([("White", "RAL")])
+    catalog._catalog.generation_number += 1
+    check_color_targets([("White", "RAL")])
+    assert len(loads) == 2
+
+
+def test_breed_applicable_to_every_selected_type_passes(loads, order_rows):
+    order_rows.extend([(1, "oak", 5), (2, "spruce", 3)])
+    check_breed_targets(7, "adds", [(None, " PINE")])
+    # Rows of TYPEID 2 are not selected by the old codes
+    check_breed_targets(7, "adds", [(["oak"], "Pine")])
+
+
+def test_type_without_the_target_breed_is_rejected(loads, order_rows):
+    order_rows.extend([(1, "pine", 5), (2, "pine", 2), (2, "spruce", 4)])
+    with pytest.raises(PreflightError) as error:
+        check_breed_targets(7, "adds", [(None, "oak")])
+    [problem] = error.value.problems
+    assert problem["reason"] == "no_breed_for_type"
+    assert (problem["type_id"], problem["current_codes"], problem["rows"]) == (2, ["pine", "spruce"], 6)
+
+
+def test_ambiguous_breed_is_rejected(loads, order_rows):
+    order_rows.append((3, "pine", 1))
+    with pytest.raises(PreflightError) as error:
+        check_breed_targets(7, "adds", [(None, "oak")])
+    assert error.value.problems[0]["reason"] == "ambiguous_breed"
+
+
+def test_unknown_breed_is_rejected_without_reading_the_order(loads, monkeypatch):
+    def unexpected(order_id, scope):
+        raise AssertionError("order rows read for an unknown breed")
+
+    monkeypatch.setattr(preflight, "get_order_breed_types_rows", unexpected)
+    with pytest.raises(PreflightError) as error:
+        check_breed_targets(7, "adds", [(None, "larch")])
+    assert error.value.problems[0]["reason"] == "unknown_breed"
+    assert "Breed 'larch' not found" in str(error.value)
+
+
+def test_exact_match_wins_over_substring_matches(loads):
+    # "Oak" (Wood) is also a substring match of "Oak" (Wood decor)
+    assert check_color_targets([("Oak", "Wood")]) == [3]
+
+
+def test_change_is_checked_under_the_order_lock_and_rejected_before_the_update(monkeypatch):
+    seen = {}
+    applied = []
+    audited = []
+
+    def check(request):
+        seen["locked"] = order_locks.instance().metrics()["locked_orders"]
+        raise PreflightError([{"reason": "unknown_color", "message": "Color 'Black' (RAL) not found"}])
+
+    operation = ChangeOperation(
+        name="test-preflight-change", scope="adds", kind="color", request_model=ColorChangeRequest,
+        apply=lambda request, targets: applied.append(1), success_message=lambda request: "ok",
+        failure_message="failed", values=lambda request: (request.old_colors, request.new_color), preflight=check,
+    )
+    monkeypatch.setitem(changes.CHANGE_OPERATIONS, operation.name, operation)
+    monkeypatch.setattr(changes.audit_journal, "record", audited.append)
+    request = ColorChangeRequest(order_id=601, new_color="Black", new_colorgroup="RAL", old_colors=["White"])
+
+    with pytest.raises(PreflightError):
+        execute_change(operation.name, request)
+    assert seen["locked"] == 1
+    assert applied == []
+    assert audited[0]["outcome"] == "rejected"
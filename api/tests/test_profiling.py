@@ -0,0 +1,68 @@
+import cProfile
+import os
+import pstats
+
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from modules import profiling
+from modules.profiling import ProfiledRoute, ProfileStore
+
+
+class _SingleProfiler(cProfile.Profile):
+    """cProfile as on Python 3.12+: only one profiler may be active in the process"""
+
+    active = None
+
+    def enable(self, *args, **kwargs):
+        if _SingleProfiler.active not in (None, self):
+            raise ValueError("Another profiling tool is already active")
+        _SingleProfiler.active = self
+        super().enable(*args, **kwargs)
+
+    def disable(self):
+        super().disable()
+        if _SingleProfiler.active is self:
+            _SingleProfiler.active = None
+
+
+def sync_order_info(order_id: int):
+    return {"order_id": order_id}
+
+
+async def async_order_info(order_id: int):
+    return {"order_id": order_id}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(profiling.cProfile, "Profile", _SingleProfiler)
+    monkeypatch.setattr(profiling, "profile_store", ProfileStore(str(tmp_path), 10))
+    router = APIRouter(route_class=ProfiledRoute)
+    router.get("/sync/{order_id}")(sync_order_info)
+    router.get("/async/{order_id}")(async_order_info)
+    app = FastAPI()
+    app.include_router(router)
+    app.middleware("http")(profiling.profiling_middleware)
+    return TestClient(app)
+
+
+def _profiled_functions(tmp_path, response):
+    path = os.path.join(str(tmp_path), response.headers["X-Profile-Name"])
+    return {function for _, _, function in pstats.Stats(path).stats}
+
+
+@pytest.mark.parametrize("path, endpoint", [("/sync/5", "sync_order_info"), ("/async/5", "async_order_info")])
+def test_forced_profile_of_an_endpoint(client, tmp_path, path, endpoint):
+    response = client.get(path, headers={"X-Profile": "1"})
+    assert response.status_code == 200
+    assert response.json() == {"order_id": 5}
+    assert endpoint in _profiled_functions(tmp_path, response)
+    assert _SingleProfiler.active is None
+
+
+def test_sync_request_rejected_before_the_endpoint_is_still_answered(client):
+    response = client.get("/sync/not-a-number", headers={"X-Profile": "1"})
+    assert response.status_code == 422
@@ -0,0 +1,66 @@
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from modules import recording
+from modules.journal import SegmentJournal
+from modules.recording import RequestRecorderMiddleware, redact
+
+
+@pytest.fixture
+def recorder(tmp_path, monkeypatch):
+    journal = SegmentJournal(str(tmp_path), "requests", 1024 * 1024, 0, flush_interval=0.01, queue_limit=100)
+    monkeypatch.setattr(recording, "request_recorder", journal)
+    monkeypatch.setattr(recording, "RECORD_SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(recording, "RECORD_MAX_BODY", 64)
+    journal.start()
+    yield journal
+    journal.stop()
+
+
+@pytest.fixture
+def client(recorder):
+    app = FastAPI()
+    app.add_middleware(RequestRecorderMiddleware)
+
+    @app.post("/api/change-color")
+    async def change(request: Request):
+        await request.body()
+        return {"success": True}
+
+    @app.get("/api/metrics")
+    def metrics():
+        return {}
+
+    return TestClient(app)
+
+
+def _recorded(recorder):
+    recorder.stop()
+    return list(recorder.read())
+
+
+def test_redact_masks_nested_fields():
+    assert redact({"user": "a", "Password": "x", "items": [{"token": "y", "id": 1}]}) == {
+        "user": "a", "Password": "***", "items": [{"token": "***", "id": 1}]
+    }
+
+
+def test_request_is_recorded_with_redacted_body_and_query(client, recorder):
+    client.post("/api/change-color?api_key=k&order=1", json={"order_id": 1, "secret": "s"})
+    [entry] = _recorded(recorder)
+    assert (entry["method"], entry["path"], entry["status"]) == ("POST", "/api/change-color", 200)
+    assert entry["db"] == "default"
+    assert entry["query"] == "api_key=***&order=1"
+    assert entry["body"] == {"order_id": 1, "secret": "***"}
+
+
+def test_large_body_is_recorded_without_content(client, recorder):
+    client.post("/api/change-color", json={"old_colors": ["x" * 100]})
+    [entry] = _recorded(recorder)
+    assert entry["body"] == {"_truncated": True}
+
+
+def test_service_endpoints_are_not_recorded(client, recorder):
+    client.get("/api/metrics")
+    assert _recorded(recorder) == []
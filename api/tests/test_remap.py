@@ -0,0 +1,102 @@
+import pytest
+from pydantic import ValidationError
+
+from db import db_functions
+from modules.models import BreedMappingRequest, ColorMappingRequest
+
+
+class _Cursor:
+    def __init__(self, con):
+        self.con = con
+
+    def execute(self, sql, params=()):
+        self.con.statements.append((sql, params))
+
+    def executemany(self, sql, rows):
+        self.con.selection.extend(rows)
+
+    def fetchall(self):
+        return self.con.pair_rows
+
+    def close(self):
+        pass
+
+
+class _Connection:
+    """Checkout of a fake pool; the selection table exists"""
+
+    def __init__(self, pair_rows):
+        self.pair_rows = pair_rows
+        self.statements = []
+        self.selection = []
+        self.commits = 0
+        self.pool = type("Pool", (), {"features": {"selection_table": True}})()
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    con = _Connection(pair_rows=[])
+    monkeypatch.setattr(db_functions, "get_db_connection", lambda: con)
+    return con
+
+
+def test_counts_are_returned_per_pair_in_request_order(connection):
+    # Rows of pair 1 are missing: none of its old color is in the order
+    connection.pair_rows = [(0, 5, 2), (2, 3, 3)]
+    counts = db_functions.remap_colors_in_order(7, [("Red", 42), ("Green", 43), ("Blue", 44)])
+    assert counts == [(5, 2), (0, 0), (3, 3)]
+    assert connection.commits == 1
+
+
+def test_mapping_is_applied_in_one_statement(connection):
+    db_functions.remap_breeds_in_stuffsets_orderitems(7, [("pine", "oak"), ("oak", "larch")])
+    [(sql, params)] = connection.statements
+    assert sql.lstrip().startswith("EXECUTE BLOCK")
+    # Rows are counted and updated in the same pass over the order's rows
+    assert sql.count("FROM ORDERS_ITEMS_SETPARAMS oisp") == 1
+    assert "UPDATE ORDERS_ITEMS_SETPARAMS SET ENUMVALUEID = :NEW_VALUE WHERE RDB$DB_KEY = :ROW_KEY" in sql
+    assert "IF (NEW_VALUE IS DISTINCT FROM OLD_VALUE)" in sql
+    assert "COUNT(" not in sql
+    # Mapping list keys, then the order ID; one block input per parameter, the body uses the inputs
+    header, body = sql.split("RETURNS", 1)
+    assert params[-1] == 7 and header.count("= ?") == len(params) and "?" not in body
+    assert sorted(connection.selection) == [
+        ("map:0", 0, "pine"), ("map:0", 1, "oak"), ("map:1", 0, "oak"), ("map:1", 1, "larch")
+    ]
+
+
+def test_each_old_value_is_mapped_only_once(connection):
+    with pytest.raises(ValueError, match="only once"):
+        db_functions._remap_values(7, db_functions._ADDS_ROWS, "COLORVALUEID", db_functions._COLOR_PARAMS,
+                                   db_functions._COLOR_PAIRS_SQL, ["OLD_VALUE", "NEW_VALUE"],
+                                   [("Red", "42"), ("Red", "43")])
+    assert connection.statements == []
+
+
+@pytest.mark.parametrize("request_model, mappings", [
+    (ColorMappingRequest, [
+        {"old_color": "Red", "new_color": "Blue", "new_colorgroup": "RAL"},
+        {"old_color": "Red", "new_color": "Green", "new_colorgroup": "RAL"},
+    ]),
+    (BreedMappingRequest, [{"old_breed": "pine", "new_breed": "oak"}, {"old_breed": "pine", "new_breed": "larch"}]),
+])
+def test_request_mapping_an_old_value_twice_is_rejected(request_model, mappings):
+    with pytest.raises(ValidationError, match="mapped more than once"):
+        request_model(order_id=7, mappings=mappings)
+
+
+def test_request_without_mappings_is_rejected():
+    with pytest.raises(ValidationError):
+        ColorMappingRequest(order_id=7, mappings=[])
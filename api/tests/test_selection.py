@@ -0,0 +1,128 @@
+import pytest
+
+from db.selection import (
+    SELECTION_TABLE, SelectionTableMissing, ensure_selection_table, select_mapping, select_values
+)
+
+
+class _Cursor:
+    def __init__(self, con):
+        self.con = con
+
+    def execute(self, sql, params=()):
+        self.con.statements.append((sql, params))
+
+    def executemany(self, sql, rows):
+        self.con.inserts.append((sql, list(rows)))
+
+    def fetchone(self):
+        return (1,) if self.con.exists else None
+
+    def close(self):
+        pass
+
+
+class _Transaction:
+    def __init__(self, con):
+        self.con = con
+
+    def begin(self):
+        pass
+
+    def execute_immediate(self, sql):
+        if self.con.ddl_error is not None:
+            if self.con.created_elsewhere:
+                self.con.exists = True
+            raise self.con.ddl_error
+        self.con.ddl.append(sql)
+        self.con.exists = True
+
+    def commit(self):
+        self.con.ddl_commits += 1
+
+
+class _Connection:
+    def __init__(self, exists=True):
+        self.exists = exists
+        self.statements = []
+        self.inserts = []
+        self.ddl = []
+        self.ddl_commits = 0
+        self.ddl_error = None
+        self.created_elsewhere = False
+        self.pool = type("Pool", (), {})()
+        self.pool.features = {}
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def trans(self):
+        return _Transaction(self)
+
+
+def test_missing_table_is_created_in_its_own_transaction():
+    con = _Connection(exists=False)
+    assert ensure_selection_table(con) is True
+    [ddl] = con.ddl
+    assert f"CREATE GLOBAL TEMPORARY TABLE {SELECTION_TABLE}" in ddl and "ON COMMIT DELETE ROWS" in ddl
+    assert con.ddl_commits == 1
+    assert ensure_selection_table(con) is False and len(con.ddl) == 1
+
+
+def test_table_created_by_another_worker_meanwhile_is_accepted():
+    con = _Connection(exists=False)
+    con.ddl_error = RuntimeError("Table GCP_SELECTED_VALUES already exists")
+    con.created_elsewhere = True
+    assert ensure_selection_table(con) is False
+
+
+def test_failed_creation_is_raised():
+    con = _Connection(exists=False)
+    con.ddl_error = RuntimeError("no permission for CREATE access")
+    with pytest.raises(RuntimeError, match="no permission"):
+        ensure_selection_table(con)
+
+
+def test_requests_never_create_the_table():
+    con = _Connection(exists=False)
+    with pytest.raises(SelectionTableMissing, match="python -m db.selection"):
+        select_values(con, con.cursor(), "old", ["Red"])
+    assert con.ddl == [] and con.inserts == []
+    # Not remembered: once the table is created the next request uses it
+    assert "selection_table" not in con.pool.features
+    con.exists = True
+    select_values(con, con.cursor(), "old", ["Red"])
+    assert con.pool.features["selection_table"] is True
+
+
+def test_existing_table_is_checked_once_per_pool():
+    con = _Connection()
+    select_values(con, con.cursor(), "old", ["Red"])
+    select_values(con, con.cursor(), "ids", [1])
+    assert len(con.statements) == 1
+
+
+def test_values_are_loaded_by_their_type():
+    con = _Connection()
+    sql, params = select_values(con, con.cursor(), "ids", [3, 4])
+    assert con.inserts[-1] == (
+        f"INSERT INTO {SELECTION_TABLE} (LIST_KEY, INT_VALUE) VALUES (?, ?)", [("ids", 3), ("ids", 4)]
+    )
+    assert sql == f"SELECT sv.INT_VALUE FROM {SELECTION_TABLE} sv WHERE sv.LIST_KEY = ?" and params == ["ids"]
+
+    sql, params = select_values(con, con.cursor(), "old", ["Red"])
+    assert con.inserts[-1][1] == [("old", "Red")] and "sv.STR_VALUE" in sql
+
+
+def test_mapping_rows_share_their_pair_number():
+    con = _Connection()
+    sql, params = select_mapping(con, con.cursor(), "map", ["OLD_VALUE", "NEW_VALUE"], [("pine", "1"), ("oak", "3")])
+    assert con.inserts[-1][1] == [("map:0", 0, "pine"), ("map:1", 0, "1"), ("map:0", 1, "oak"), ("map:1", 1, "3")]
+    assert sql == (
+        f"SELECT m0.INT_VALUE AS PAIR_NO, m0.STR_VALUE AS OLD_VALUE, m1.STR_VALUE AS NEW_VALUE"
+        f" FROM {SELECTION_TABLE} m0"
+        f" JOIN {SELECTION_TABLE} m1 ON m1.LIST_KEY = ? AND m1.INT_VALUE = m0.INT_VALUE"
+        f" WHERE m0.LIST_KEY = ?"
+    )
+    # In the order of the placeholders: joined lists first, then the first column
+    assert params == ["map:1", "map:0"]
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pydantic import TypeAdapter
+
+from modules import routes, serialization
+from modules.catalog import catalog_cache
+from modules.models import BreedOption, ColorCatalog, OrderColor
+from modules.order_cache import order_cache
+from modules.routes import router
+from modules.serialization import dumps, encode_rows
+
+
+@pytest.fixture(params=["orjson", "json"])
+def encoder(request, monkeypatch):
+    if request.param == "json":
+        monkeypatch.setattr(serialization, "orjson", None)
+    return request.param
+
+
+def test_rows_are_encoded_as_objects_in_field_order(encoder):
+    body = encode_rows(("title", "count", "item_count"), [("Белый", 3, 2), ("RAL 9016", 1, 1)])
+    assert json.loads(body) == [
+        {"title": "Белый", "count": 3, "item_count": 2},
+        {"title": "RAL 9016", "count": 1, "item_count": 1},
+    ]
+    # Compact UTF-8, no escaped Cyrillic
+    assert "Белый".encode("utf-8") in body and b'"count":3,' in body
+
+
+def test_encoded_rows_validate_against_the_response_model(encoder):
+    body = encode_rows(("title", "count", "item_count"), iter([("Белый", 3, 2)]))
+    assert TypeAdapter(list[OrderColor]).validate_json(body) == [OrderColor(title="Белый", count=3, item_count=2)]
+    assert encode_rows(("title",), []) == b"[]"
+
+
+def test_both_encoders_give_the_same_bytes(monkeypatch):
+    payload = {"groups": [{"title": "Дерево", "colors": [(1, "Орех"), (2, "Дуб")]}]}
+    fast = dumps(payload)
+    monkeypatch.setattr(serialization, "orjson", None)
+    assert dumps(payload) == fast
+    assert ColorCatalog.model_validate_json(fast).groups[0].colors == [(1, "Орех"), (2, "Дуб")]
+
+
+@pytest.fixture
+def client():
+    catalog_cache.instance().invalidate()
+    order_cache.instance().clear()
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    yield TestClient(app)
+    catalog_cache.instance().invalidate()
+    order_cache.instance().clear()
+
+
+def test_breeds_endpoint_returns_the_response_model_shape(client):
+    response = client.get("/api/breeds")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    breeds = TypeAdapter(list[BreedOption]).validate_json(response.content)
+    assert [(b.id, b.code, b.type_id) for b in breeds] == list(routes.AVAILABLE_BREEDS)
+
+
+def test_order_colors_endpoint_encodes_cursor_rows(client, monkeypatch):
+    monkeypatch.setattr(routes, "get_order_colors_rows", lambda order_id: [("Белый", 4, 2)])
+    response = client.get("/api/orders/7/colors")
+    assert response.status_code == 200
+    assert response.json() == [{"title": "Белый", "count": 4, "item_count": 2}]
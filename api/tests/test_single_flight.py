@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+from modules.single_flight import SingleFlight
+
+
+def _concurrent(flight, key, callers, loader):
+    """Start `callers` threads on one key while the leader's load is blocked; returns their results"""
+    results = [None] * callers
+
+    def call(index):
+        try:
+            results[index] = flight.do(key, loader)
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(callers)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def test_concurrent_callers_share_one_load():
+    flight = SingleFlight(metric_keys=10)
+    release = threading.Event()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        release.wait(2)
+        return "order"
+
+    threads, results = _concurrent(flight, "k", 5, loader)
+    _wait_for(lambda: flight.metrics()["keys"]["k"]["calls"] == 5)
+    release.set()
+    for thread in threads:
+        thread.join(2)
+
+    assert results == ["order"] * 5
+    assert len(loads) == 1
+    metrics = flight.metrics()
+    assert metrics["in_flight"] == 0
+    assert metrics["keys"]["k"]["loads"] == 1 and metrics["keys"]["k"]["shared"] == 4
+
+
+def test_error_is_shared_and_not_kept():
+    flight = SingleFlight(metric_keys=10)
+    release = threading.Event()
+
+    def failing():
+        release.wait(2)
+        raise ValueError("db down")
+
+    threads, results = _concurrent(flight, "k", 3, failing)
+    _wait_for(lambda: flight.metrics()["keys"]["k"]["calls"] == 3)
+    release.set()
+    for thread in threads:
+        thread.join(2)
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.do("k", lambda: "recovered") == "recovered"
+
+
+def test_results_are_not_cached():
+    flight = SingleFlight(metric_keys=10)
+    assert flight.do("k", lambda: 1) == 1
+    assert flight.do("k", lambda: 2) == 2
+
+
+def test_forget_starts_a_fresh_load_for_new_callers():
+    flight = SingleFlight(metric_keys=10)
+    release_old = threading.Event()
+    release_new = threading.Event()
+
+    def load(release, result):
+        def loader():
+            release.wait(2)
+            return result
+        return loader
+
+    old_threads, old_results = _concurrent(flight, "db:order:1:info", 1, load(release_old, "before change"))
+    _wait_for(lambda: flight.metrics()["in_flight"] == 1)
+    # A write committed while the read was in flight
+    flight.forget("db:order:1:")
+    new_threads, new_results = _concurrent(flight, "db:order:1:info", 1, load(release_new, "after change"))
+    _wait_for(lambda: flight.metrics()["keys"]["db:order:1:info"]["loads"] == 2)
+
+    release_old.set()
+    old_threads[0].join(2)
+    assert old_results == ["before change"]
+    # The old load finishing must not drop the newer in-flight call of the key
+    assert flight.metrics()["in_flight"] == 1
+    release_new.set()
+    new_threads[0].join(2)
+    assert new_results == ["after change"]
+    assert flight.metrics()["in_flight"] == 0
+
+
+def test_forget_keeps_other_keys():
+    flight = SingleFlight(metric_keys=10)
+    release = threading.Event()
+    threads, _ = _concurrent(flight, "db:order:2:info", 1, lambda: release.wait(2))
+    _wait_for(lambda: flight.metrics()["in_flight"] == 1)
+    flight.forget("db:order:1:")
+    assert flight.metrics()["in_flight"] == 1
+    release.set()
+    threads[0].join(2)
+
+
+def test_metric_keys_are_bounded():
+    flight = SingleFlight(metric_keys=2)
+    for key in ("a", "b", "c"):
+        flight.do(key, lambda: None)
+    assert list(flight.metrics()["keys"]) == ["b", "c"]
+
+
+def test_leader_error_propagates():
+    flight = SingleFlight(metric_keys=10)
+    with pytest.raises(KeyError):
+        flight.do("k", lambda: {}["missing"])
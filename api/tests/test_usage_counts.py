@@ -0,0 +1,77 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from db import db_functions
+from modules.order_cache import order_cache
+from modules.routes import router
+
+
+class _Cursor:
+    def __init__(self, con):
+        self.con = con
+
+    def execute(self, sql, params=()):
+        self.con.statements.append((sql, params))
+
+    def fetchall(self):
+        return self.con.rows
+
+    def close(self):
+        pass
+
+
+class _Connection:
+    def __init__(self):
+        self.rows = []
+        self.statements = []
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    con = _Connection()
+    monkeypatch.setattr(db_functions, "get_db_connection", lambda: con)
+    order_cache.instance().clear()
+    yield con
+    order_cache.instance().clear()
+
+
+_ENDPOINTS = [
+    ("colors", "get_order_colors_rows", "title", "c.TITLE", "ORDERS_ITEMS_ADDS_SETPARAMS"),
+    ("stuffsets-colors", "get_stuffsets_colors_in_order_rows", "title", "c.TITLE", "ORDERS_ITEMS_SETPARAMS"),
+    ("adds-breeds", "get_adds_breeds_in_order_rows", "code", "ei.CODE", "ORDERS_ITEMS_ADDS_SETPARAMS"),
+    ("stuffsets-breeds", "get_stuffsets_breeds_in_order_rows", "code", "ei.CODE", "ORDERS_ITEMS_SETPARAMS"),
+]
+
+
+@pytest.mark.parametrize("resource, function, field, value, table", _ENDPOINTS)
+def test_values_are_counted_in_one_grouped_query(connection, resource, function, field, value, table):
+    connection.rows = [("Дуб Люкс", 37, 12)]
+    assert getattr(db_functions, function)(5) == [("Дуб Люкс", 37, 12)]
+    [(sql, params)] = connection.statements
+    assert params == (5,)
+    assert "COUNT(*) as ROW_COUNT" in sql and "COUNT(DISTINCT oi.ID) as ITEM_COUNT" in sql
+    assert f"GROUP BY {value}" in sql and f"JOIN {table} " in sql
+    assert "DISTINCT " + value not in sql and " IN (" not in sql
+
+
+@pytest.mark.parametrize("resource, function, field, value, table", _ENDPOINTS)
+def test_endpoints_return_row_and_item_counts(connection, resource, function, field, value, table):
+    connection.rows = [("Дуб Люкс", 37, 12), ("Сосна", 1, 1)]
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    response = TestClient(app).get(f"/api/orders/5/{resource}")
+    assert response.status_code == 200
+    assert response.json() == [
+        {field: "Дуб Люкс", "count": 37, "item_count": 12},
+        {field: "Сосна", "count": 1, "item_count": 1},
+    ]
@@ -2,33 +2,160 @@
 API Client for Group Change Params
 """
 
+import copy
+import getpass
+import json
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from urllib.parse import quote, urlencode
+
 import requests
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 
 
 class GroupChangeParamsAPIClient:
     """Client for Group Change Params API"""
     
-    def __init__(self, base_url: str = "http://localhost:8002"):
-        self.base_url = base_url
+    # (connect, read) seconds; a change may wait for other changes of the same order
+    TIMEOUT = (5, 120)
+    # Retries after connection errors and timeouts; POSTs are retried with the same Idempotency-Key
+    RETRIES = 2
+    RETRY_BACKOFF = 1.0
+    
+    def __init__(self, base_url: str = "http://localhost:8002", database: Optional[str] = None):
+        # Database profile of the API (site); selected by path prefix, so it applies to events as well
+        self.base_url = f"{base_url}/db/{database}" if database else base_url
+        # Identifies this client instance, e.g. to skip own change events
+        self.client_id = uuid.uuid4().hex
         self.session = requests.Session()
         self.session.headers.update({
             "Content-Type": "application/json",
-            "Accept": "application/json"
+            "Accept": "application/json",
+            "X-Client-Id": self.client_id,
+            # Who makes the changes, for the audit journal (header values must be ASCII)
+            "X-Client-User": quote(self._user_name())
         })
+        # Validator cache for conditional GET: url with sorted query params -> (ETag, parsed body)
+        self._validators: Dict[str, Tuple[str, Any]] = {}
+        self._validators_lock = threading.Lock()
+        # Timings of recent requests: client round trip plus API Server-Timing
+        self.timings = deque(maxlen=200)
+        # Idempotency keys of POSTs whose outcome is unknown (connection lost):
+        # (endpoint, body) -> key, reused when the manager repeats the same change
+        self._pending_keys: Dict[Tuple[str, str], str] = {}
+    
+    @staticmethod
+    def _user_name() -> str:
+        try:
+            return f"{getpass.getuser()}@{socket.gethostname()}"
+        except Exception:
+            return socket.gethostname()
+    
+    @staticmethod
+    def _parse_server_timing(header: str) -> Dict[str, float]:
+        """Parse 'name;dur=1.2;desc="x", ...' into {name: ms}"""
+        result = {}
+        for metric in filter(None, (part.strip() for part in header.split(","))):
+            name, *params = metric.split(";")
+            for param in params:
+                key, _, value = param.strip().partition("=")
+                if key == "dur":
+                    try:
+                        result[name.strip()] = float(value)
+                    except ValueError:
+                        pass
+        return result
+    
+    def _record_timing(self, request_id: str, method: str, endpoint: str, response, started: float):
+        round_trip_ms = (time.perf_counter() - started) * 1000
+        server = self._parse_server_timing(response.headers.get("Server-Timing", "")) if response is not None else {}
+        self.timings.append({
+            "request_id": request_id,
+            "method": method,
+            "endpoint": endpoint,
+            "status": response.status_code if response is not None else None,
+            "round_trip_ms": round(round_trip_ms, 1),
+            "server_ms": server.get("total"),
+            "db_ms": round(sum(v for k, v in server.items() if k.startswith("sql-") or k in ("pool", "ctx", "commit")), 1),
+            # Network and client-side HTTP overhead
+            "network_ms": round(round_trip_ms - server["total"], 1) if "total" in server else None,
+            "server_timing": server,
+        })
+    
+    @staticmethod
+    def _validator_key(url: str, params: Any) -> str:
+        """Cache key of a GET: the same path with other query params is another resource"""
+        if not params:
+            return url
+        items = params.items() if isinstance(params, dict) else params
+        pairs = []
+        for name, value in items:
+            values = value if isinstance(value, (list, tuple)) else [value]
+            pairs.extend((str(name), str(item)) for item in values if item is not None)
+        return f"{url}?{urlencode(sorted(pairs))}"
     
     def _make_request(self, method: str, endpoint: str, **kwargs) -> Dict[str, Any]:
-        """Make HTTP request to API"""
+        """Make HTTP request to API (GET requests are conditional when a cached ETag exists)"""
         url = f"{self.base_url}{endpoint}"
+        cached = None
+        request_id = uuid.uuid4().hex[:16]
+        headers = dict(kwargs.pop("headers", None) or {})
+        headers["X-Request-ID"] = request_id
+        kwargs.setdefault("timeout", self.TIMEOUT)
         
+        if method == "GET":
+            validator_key = self._validator_key(url, kwargs.get("params"))
+            with self._validators_lock:
+                cached = self._validators.get(validator_key)
+            if cached:
+                headers["If-None-Match"] = cached[0]
+        elif method == "POST":
+            # A POST retried below, or repeated after a lost connection, is executed by the API only once
+            pending = (endpoint, json.dumps(kwargs.get("json"), sort_keys=True, ensure_ascii=False))
+            with self._validators_lock:
+                key = self._pending_keys.pop(pending, None) or uuid.uuid4().hex
+            headers.setdefault("Idempotency-Key", key)
+        kwargs["headers"] = headers
+        
+        started = time.perf_counter()
+        response = None
         try:
-            response = self.session.request(method, url, **kwargs)
+            for attempt in range(self.RETRIES + 1):
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                    break
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    if attempt == self.RETRIES:
+                        if method == "POST":
+                            with self._validators_lock:
+                                self._pending_keys[pending] = headers["Idempotency-Key"]
+                        raise
+                    print(f"⚠️ API: {method} {endpoint} не удался ({e}), повтор {attempt + 1}/{self.RETRIES}")
+                    time.sleep(self.RETRY_BACKOFF * (attempt + 1))
+            self._record_timing(request_id, method, endpoint, response, started)
+            if response.status_code == 304 and cached:
+                return copy.deepcopy(cached[1])
             response.raise_for_status()
-            return response.json()
+            data = response.json()
+            etag = response.headers.get("ETag")
+            if method == "GET" and etag:
+                with self._validators_lock:
+                    self._validators[validator_key] = (etag, copy.deepcopy(data))
+            return data
         except requests.exceptions.RequestException as e:
-            print(f"❌ API Request failed: {e}")
+            if response is None:
+                self._record_timing(request_id, method, endpoint, None, started)
+            print(f"❌ API Request failed [{request_id}]: {e}")
             raise
     
+    @property
+    def events_url(self) -> str:
+        """WebSocket URL of order change events"""
+        return self.base_url.replace("http", "ws", 1) + "/api/ws/events"
+    
     def health_check(self) -> Dict[str, Any]:
         """Check API health"""
         return self._make_request("GET", "/health")
@@ -41,6 +168,17 @@ class GroupChangeParamsAPIClient:
         """Get color groups"""
         return self._make_request("GET", "/api/color-groups")
     
+    def get_color_catalog(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Get all colors grouped by color group: {group_title: [color, ...]}"""
+        result = self._make_request("GET", "/api/colors")
+        return {
+            group["title"]: [
+                {"color_id": color_id, "title": title, "group_title": group["title"]}
+                for color_id, title in group["colors"]
+            ]
+            for group in result["groups"]
+        }
+    
     def get_colors_by_group(self, group_title: str) -> List[Dict[str, Any]]:
         """Get colors by group"""
         print(f"🔄 API: Запрос цветов для группы '{group_title}'")
@@ -48,10 +186,18 @@ class GroupChangeParamsAPIClient:
         print(f"🔄 API: Получено {len(result)} цветов для группы '{group_title}'")
         return result
     
+    def search_colors(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Search colors of all groups by title (typeahead)"""
+        return self._make_request("GET", "/api/colors/search", params={"q": query, "limit": limit})
+    
     def get_order_colors(self, order_id: int) -> List[Dict[str, Any]]:
-        """Get colors used in order"""
+        """Get colors used in order adds: [{title, count, item_count}]"""
         return self._make_request("GET", f"/api/orders/{order_id}/colors")
     
+    def get_order_fingerprint(self, order_id: int) -> Dict[str, Any]:
+        """Get order fingerprint: reload order data only when it differs from the last one"""
+        return self._make_request("GET", f"/api/orders/{order_id}/fingerprint")
+    
     def get_order_info(self, order_id: int) -> Dict[str, Any]:
         """Get order information"""
         return self._make_request("GET", f"/api/orders/{order_id}/info")
@@ -75,11 +221,30 @@ class GroupChangeParamsAPIClient:
         }
         return self._make_request("POST", "/api/change-color", json=data)
     
-    def get_stuffsets_breeds(self, order_id: int) -> List[str]:
+    def change_breed_mapping(self, order_id: int, mappings: Dict[str, str]) -> Dict[str, Any]:
+        """Replace several breeds in order at once ({old: new}); data.pairs has rows per pair"""
+        data = {
+            "order_id": order_id,
+            "mappings": [{"old_breed": old, "new_breed": new} for old, new in mappings.items()]
+        }
+        return self._make_request("POST", "/api/change-breed-mapping", json=data)
+    
+    def change_color_mapping(self, order_id: int, mappings: Dict[str, Tuple[str, str]]) -> Dict[str, Any]:
+        """Replace several colors in order at once ({old: (new_color, new_colorgroup)})"""
+        data = {
+            "order_id": order_id,
+            "mappings": [
+                {"old_color": old, "new_color": new, "new_colorgroup": group}
+                for old, (new, group) in mappings.items()
+            ]
+        }
+        return self._make_request("POST", "/api/change-color-mapping", json=data)
+    
+    def get_stuffsets_breeds(self, order_id: int) -> List[Dict[str, Any]]:
         """Get breeds used in stuffsets orderitems"""
         return self._make_request("GET", f"/api/orders/{order_id}/stuffsets-breeds")
     
-    def get_adds_breeds(self, order_id: int) -> List[str]:
+    def get_adds_breeds(self, order_id: int) -> List[Dict[str, Any]]:
         """Get breeds used in adds (дополнения)"""
         return self._make_request("GET", f"/api/orders/{order_id}/adds-breeds")
     
@@ -92,6 +257,14 @@ class GroupChangeParamsAPIClient:
         }
         return self._make_request("POST", "/api/change-stuffsets-breed", json=data)
     
+    def change_stuffsets_breed_mapping(self, order_id: int, mappings: Dict[str, str]) -> Dict[str, Any]:
+        """Replace several breeds in stuffsets orderitems at once ({old: new})"""
+        data = {
+            "order_id": order_id,
+            "mappings": [{"old_breed": old, "new_breed": new} for old, new in mappings.items()]
+        }
+        return self._make_request("POST", "/api/change-stuffsets-breed-mapping", json=data)
+    
     def get_stuffsets_colors(self, order_id: int) -> List[Dict[str, Any]]:
         """Get colors used in stuffsets orderitems"""
         return self._make_request("GET", f"/api/orders/{order_id}/stuffsets-colors")
@@ -105,15 +278,47 @@ class GroupChangeParamsAPIClient:
             "old_colors": old_colors
         }
         return self._make_request("POST", "/api/change-stuffsets-color", json=data)
+    
+    def change_stuffsets_color_mapping(self, order_id: int, mappings: Dict[str, Tuple[str, str]]) -> Dict[str, Any]:
+        """Replace several colors in stuffsets orderitems at once ({old: (new_color, new_colorgroup)})"""
+        data = {
+            "order_id": order_id,
+            "mappings": [
+                {"old_color": old, "new_color": new, "new_colorgroup": group}
+                for old, (new, group) in mappings.items()
+            ]
+        }
+        return self._make_request("POST", "/api/change-stuffsets-color-mapping", json=data)
+    
+    def submit_job(self, operation: str, request: Dict[str, Any], order_ids: List[int] = None,
+                   priority: str = None) -> Dict[str, Any]:
+        """Submit change as background job (operation is the change endpoint name)"""
+        data = {
+            "operation": operation,
+            "request": request,
+            "order_ids": order_ids,
+            "priority": priority
+        }
+        return self._make_request("POST", "/api/jobs", json=data)
+    
+    def get_job(self, job_id: str) -> Dict[str, Any]:
+        """Get background job status"""
+        return self._make_request("GET", f"/api/jobs/{job_id}")
+    
+    def get_audit(self, order_id: int = None, since: str = None, until: str = None,
+                  limit: int = 100) -> List[Dict[str, Any]]:
+        """Get audit journal of changes, newest first (since/until as ISO date-time)"""
+        params = {"order_id": order_id, "since": since, "until": until, "limit": limit}
+        return self._make_request("GET", "/api/audit", params={k: v for k, v in params.items() if v is not None})
 
 
 # Global API client instance
 _api_client = None
 
 
-def get_api_client(base_url: str = "http://localhost:8002") -> GroupChangeParamsAPIClient:
+def get_api_client(base_url: str = "http://localhost:8002", database: Optional[str] = None) -> GroupChangeParamsAPIClient:
     """Get API client instance"""
     global _api_client
     if _api_client is None:
-        _api_client = GroupChangeParamsAPIClient(base_url)
+        _api_client = GroupChangeParamsAPIClient(base_url, database)
     return _api_client
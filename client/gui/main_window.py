@@ -3,6 +3,8 @@ Main Window for Group Change Params
 Modern minimalist interface on PyQt6
 """
 
+import json
+
 from PyQt5.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QTabWidget,
     QGroupBox, QFormLayout, QLineEdit, QComboBox, QPushButton,
@@ -10,7 +12,9 @@ from PyQt5.QtWidgets import (
     QSplitter, QFrame, QCheckBox, QScrollArea,
     QAction, QDialog, QDialogButtonBox, QHBoxLayout
 )
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
+from PyQt5.QtCore import Qt, QThread, QTimer, QUrl, pyqtSignal
+from PyQt5.QtNetwork import QAbstractSocket
+from PyQt5.QtWebSockets import QWebSocket
 
 from core.api_client import get_api_client
 from .styles import (
@@ -19,6 +23,17 @@ from .styles import (
 )
 
 
+def format_usage(title: str, item_count: int) -> str:
+    """'Дуб Люкс — 37 позиций'"""
+    if item_count % 10 == 1 and item_count % 100 != 11:
+        word = "позиция"
+    elif item_count % 10 in (2, 3, 4) and item_count % 100 not in (12, 13, 14):
+        word = "позиции"
+    else:
+        word = "позиций"
+    return f"{title} — {item_count} {word}"
+
+
 class LoadOrderDialog(QDialog):
     """Dialog for loading order data"""
     
@@ -101,6 +116,8 @@ class DataLoadThread(QThread):
                 data = self.api_client.get_breeds()
             elif self.data_type == "color_groups":
                 data = self.api_client.get_color_groups()
+            elif self.data_type == "color_catalog":
+                data = self.api_client.get_color_catalog()
             elif self.data_type == "colors":
                 group_title = self.kwargs.get("group_title")
                 data = self.api_client.get_colors_by_group(group_title)
@@ -241,12 +258,12 @@ class StuffsetsBreedChangeTab(QWidget):
             # Create checkboxes for each breed
             if breeds:
                 for breed in breeds:
-                    checkbox = QCheckBox(f"🌳 {breed}")
+                    checkbox = QCheckBox(f"🌳 {format_usage(breed['code'], breed['item_count'])}")
                     checkbox.setStyleSheet(CHECKBOX_STYLE)
                     checkbox.setChecked(True)  # Default to selected
                     checkbox.stateChanged.connect(self.update_apply_button_state)
                     self.breeds_layout.addWidget(checkbox)
-                    self.breed_checkboxes[breed] = checkbox
+                    self.breed_checkboxes[breed['code']] = checkbox
                 
                 self.update_apply_button_state()
             else:
@@ -463,12 +480,12 @@ class BreedChangeTab(QWidget):
             # Create checkboxes for each breed
             if breeds:
                 for breed in breeds:
-                    checkbox = QCheckBox(f"🌳 {breed}")
+                    checkbox = QCheckBox(f"🌳 {format_usage(breed['code'], breed['item_count'])}")
                     checkbox.setStyleSheet(CHECKBOX_STYLE)
                     checkbox.setChecked(True)  # Default to selected
                     checkbox.stateChanged.connect(self.update_apply_button_state)
                     self.adds_breeds_layout.addWidget(checkbox)
-                    self.adds_breed_checkboxes[breed] = checkbox
+                    self.adds_breed_checkboxes[breed['code']] = checkbox
                 
                 self.update_apply_button_state()
             else:
@@ -574,6 +591,7 @@ class StuffsetsColorChangeTab(QWidget):
         super().__init__(parent)
         self.parent_window = parent
         self.color_groups_data = []
+        self.color_catalog = {}  # group title -> colors, loaded once
         self.colors_data = []
         self.order_colors_data = []
         self.color_checkboxes = {}
@@ -672,18 +690,19 @@ class StuffsetsColorChangeTab(QWidget):
         layout.addStretch()
     
     def load_color_groups(self):
-        """Load color groups from API automatically"""
+        """Load color catalog (groups with their colors) from API automatically"""
         api_client = get_api_client()
         
         # Create and start data loading thread
-        self.data_thread = DataLoadThread(api_client, "color_groups")
+        self.data_thread = DataLoadThread(api_client, "color_catalog")
         self.data_thread.data_loaded.connect(self.on_data_loaded)
         self.data_thread.error_occurred.connect(self.on_error)
         self.data_thread.start()
     
     def on_data_loaded(self, data):
-        """Handle loaded color groups"""
-        self.color_groups_data = data.get("color_groups", [])
+        """Handle loaded color catalog"""
+        self.color_catalog = data.get("color_catalog", {})
+        self.color_groups_data = [{"title": title} for title in self.color_catalog]
         
         # Populate combo box
         self.color_group_combo.clear()
@@ -709,7 +728,7 @@ class StuffsetsColorChangeTab(QWidget):
             # Create checkboxes for each color
             if colors_data:
                 for color in colors_data:
-                    checkbox = QCheckBox(f"🎨 {color['title']}")
+                    checkbox = QCheckBox(f"🎨 {format_usage(color['title'], color['item_count'])}")
                     checkbox.setStyleSheet(CHECKBOX_STYLE)
                     checkbox.setChecked(True)  # Default to selected
                     checkbox.stateChanged.connect(self.update_apply_color_button_state)
@@ -735,20 +754,8 @@ class StuffsetsColorChangeTab(QWidget):
             self.color_combo.setEnabled(False)
             return
         
-        print(f"🔄 Смена категории цвета на: '{group_title}'")
-        
-        # Disable combo and clear it
-        
-        self.color_combo.setEnabled(False)
-        self.color_combo.clear()
-        self.status_label.setText(f"Загрузка цветов группы '{group_title}'...")
-        
-        # Load colors for this group in background thread
-        api_client = get_api_client()
-        self.colors_thread = DataLoadThread(api_client, "colors", group_title=group_title)
-        self.colors_thread.data_loaded.connect(self.on_colors_loaded)
-        self.colors_thread.error_occurred.connect(self.on_error)
-        self.colors_thread.start()
+        # Colors of all groups are already loaded with the catalog
+        self.on_colors_loaded({"colors": self.color_catalog.get(group_title, [])})
     
     def on_colors_loaded(self, data):
         """Handle loaded colors for group"""
@@ -866,6 +873,7 @@ class ColorChangeTab(QWidget):
         super().__init__(parent)
         self.parent_window = parent
         self.color_groups_data = []
+        self.color_catalog = {}  # group title -> colors, loaded once
         self.colors_data = []
         self.order_colors_data = []
         self.color_checkboxes = {}
@@ -962,12 +970,12 @@ class ColorChangeTab(QWidget):
         layout.addWidget(main_group)
     
     def load_color_groups(self):
-        """Load color groups from API automatically"""
+        """Load color catalog (groups with their colors) from API automatically"""
         api_client = get_api_client()
         
         self.status_label.setText("Загрузка категорий цветов...")
         
-        self.data_thread = DataLoadThread(api_client, "color_groups")
+        self.data_thread = DataLoadThread(api_client, "color_catalog")
         self.data_thread.data_loaded.connect(self.on_color_groups_loaded)
         self.data_thread.error_occurred.connect(self.on_error)
         self.data_thread.start()
@@ -984,8 +992,9 @@ class ColorChangeTab(QWidget):
         self.data_thread.start()
     
     def on_color_groups_loaded(self, data):
-        """Handle loaded color groups"""
-        self.color_groups_data = data.get("color_groups", [])
+        """Handle loaded color catalog"""
+        self.color_catalog = data.get("color_catalog", {})
+        self.color_groups_data = [{"title": title} for title in self.color_catalog]
         
         self.color_group_combo.clear()
         for group in self.color_groups_data:
@@ -1006,7 +1015,7 @@ class ColorChangeTab(QWidget):
         # Create checkboxes for each color
         if self.order_colors_data:
             for color in self.order_colors_data:
-                checkbox = QCheckBox(f"🎨 {color['title']}")
+                checkbox = QCheckBox(f"🎨 {format_usage(color['title'], color['item_count'])}")
                 checkbox.setStyleSheet(CHECKBOX_STYLE)
                 checkbox.setChecked(True)  # Default to selected
                 checkbox.stateChanged.connect(self.update_apply_color_button_state)
@@ -1027,23 +1036,8 @@ class ColorChangeTab(QWidget):
             self.color_combo.setEnabled(False)
             return
         
-        print(f"🔄 Смена категории цвета на: '{group_title}'")
-        
-        api_client = get_api_client()
-        
-        self.color_combo.setEnabled(False)
-        self.color_combo.clear()
-        self.status_label.setText(f"Загрузка цветов группы '{group_title}'...")
-        
-        # Clear previous colors data
-        self.colors_data = []
-        
-        print(f"🔄 Запуск загрузки цветов для группы '{group_title}'")
-        
-        self.data_thread = DataLoadThread(api_client, "colors", group_title=group_title)
-        self.data_thread.data_loaded.connect(self.on_colors_loaded)
-        self.data_thread.error_occurred.connect(self.on_error)
-        self.data_thread.start()
+        # Colors of all groups are already loaded with the catalog
+        self.on_colors_loaded({"colors": self.color_catalog.get(group_title, [])})
     
     def on_colors_loaded(self, data):
         """Handle loaded colors"""
@@ -1175,6 +1169,7 @@ class GroupChangeParamsWindow(QMainWindow):
         self.order_info = {}
         self.init_ui()
         self.setup_window()
+        self.connect_events()
     
     def init_ui(self):
         """Initialize user interface"""
@@ -1396,6 +1391,50 @@ class GroupChangeParamsWindow(QMainWindow):
         
         self.status_bar.showMessage(f"Загружены данные заказа {self.current_order_id}")
     
+    def connect_events(self):
+        """Subscribe to order change events pushed by the API"""
+        self.events_socket = QWebSocket()
+        self.events_socket.textMessageReceived.connect(self.on_change_event)
+        self.events_socket.open(QUrl(get_api_client().events_url))
+        
+        # Reopen the channel if the API was restarted or unreachable
+        self.events_reconnect_timer = QTimer(self)
+        self.events_reconnect_timer.timeout.connect(self.reconnect_events)
+        self.events_reconnect_timer.start(10000)
+    
+    def reconnect_events(self):
+        """Reopen events channel when it is closed"""
+        if self.events_socket.state() == QAbstractSocket.UnconnectedState:
+            self.events_socket.open(QUrl(get_api_client().events_url))
+    
+    def on_change_event(self, message):
+        """Refresh only the tab affected by a change of the current order"""
+        try:
+            event = json.loads(message)
+        except ValueError:
+            return
+        
+        if event.get("type") != "order_changed" or event.get("order_id") != self.current_order_id:
+            return
+        if event.get("origin") == get_api_client().client_id:
+            return  # Own changes are reloaded by the tab that made them
+        
+        order_id = self.current_order_id
+        scope = event.get("scope")
+        kind = event.get("kind")
+        if scope == "adds" and kind == "breed":
+            self.breed_tab.load_adds_breeds(order_id)
+        elif scope == "stuffsets" and kind == "breed":
+            self.stuffsets_breed_tab.load_stuffsets_breeds(order_id)
+        elif scope == "adds" and kind == "color":
+            self.color_tab.load_order_colors(order_id)
+        elif scope == "stuffsets" and kind == "color":
+            self.stuffsets_color_tab.load_stuffsets_colors(order_id)
+        else:
+            return
+        
+        self.status_bar.showMessage(f"Заказ {order_id} изменён другим пользователем, данные обновлены")
+    
     def on_order_load_error(self, error_msg):
         """Handle order load error"""
         self.status_bar.showMessage("Ошибка загрузки заказа")
@@ -1485,6 +1524,8 @@ class GroupChangeParamsWindow(QMainWindow):
         reply = msg_box.exec()
         
         if reply == QMessageBox.Yes:
+            self.events_reconnect_timer.stop()
+            self.events_socket.close()
             event.accept()
         else:
             event.ignore()